@@ -0,0 +1,399 @@
+"""Load test the EBS against a local fake of the Twitch API.
+
+Starts the fake Twitch Helix/OAuth server from the test suite (optionally with added latency and
+errors), seeds a database with broadcasters, users and firsts, then starts the EBS under gunicorn
+pointed at both. Each scenario sends requests from a pool of concurrent clients and the latency
+percentiles and throughput are reported per scenario:
+
+    panel        viewers loading the leaderboard, GET /firsts
+    redemptions  a burst of signed channel point redemption webhooks, POST /eventsub
+    config       broadcasters saving the extension config, POST /eventsub/create
+
+Usage:
+    python -m bench.loadtest [--scenario {panel,redemptions,config,all}] [--requests N]
+        [--concurrency N] [--workers N] [--twitch-latency SECONDS] [--twitch-error-rate RATE]
+        [--database-uri URI] [--output FILE]
+
+Example:
+    python -m bench.loadtest --scenario panel --requests 5000 --concurrency 50 --workers 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import requests
+from sqlalchemy import insert
+
+from bench import traffic
+from tests.fake_helix import FakeHelix
+from verifiedfirst import create_app, totals
+from verifiedfirst.config import Config
+from verifiedfirst.database import db
+from verifiedfirst.models.broadcasters import Broadcaster
+from verifiedfirst.models.firsts import First
+from verifiedfirst.models.users import User
+
+logger = logging.getLogger(__name__)
+
+EBS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTENSION_SECRET = "YWFhYWFhYWFhYWFhYWFhYWFhYWFhYWFhYWFhYWFhYQo="
+EVENTSUB_SECRET = "loadtestsecret"
+REWARD_ID = "d1a2b3c4-0000-4000-8000-000000000001"
+FIRST_BROADCASTER_ID = 1000000
+SCENARIOS = ("panel", "redemptions", "config")
+# settings shared by the EBS and the app used to seed the database
+EBS_CONFIG = {
+    "CLIENT_ID": "loadtest",
+    "CLIENT_SECRET": "loadtest",
+    "EXTENSION_SECRET": EXTENSION_SECRET,
+    "REDIRECT_URI": "http://localhost/auth",
+    "EVENTSUB_CALLBACK_URL": "http://localhost/eventsub",
+    "EVENTSUB_SECRET": EVENTSUB_SECRET,
+}
+
+# (method, path, keyword arguments for requests) of a request to send
+RequestSpec = tuple[str, str, dict[str, Any]]
+
+
+@dataclass
+class Dataset:
+    """Ids of the seeded broadcasters and users."""
+
+    broadcaster_ids: list[int]
+    user_ids: list[int]
+
+
+@dataclass
+class Result:
+    """Latencies and statuses of the requests sent for a scenario."""
+
+    scenario: str
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter[str] = field(default_factory=Counter)
+    duration: float = 0.0
+
+    def summary(self) -> dict[str, Any]:
+        """Summarise the result.
+
+        :return: request counts, throughput and latency percentiles in milliseconds
+        """
+        ok = sum(count for status, count in self.statuses.items() if status.startswith("2"))
+        percentiles = statistics.quantiles(self.latencies, n=100, method="inclusive")
+        return {
+            "scenario": self.scenario,
+            "requests": len(self.latencies),
+            "errors": len(self.latencies) - ok,
+            "statuses": dict(self.statuses),
+            "throughput": len(self.latencies) / self.duration,
+            "p50_ms": percentiles[49] * 1000,
+            "p95_ms": percentiles[94] * 1000,
+            "p99_ms": percentiles[98] * 1000,
+        }
+
+
+def seed(database_uri: str, fake: FakeHelix, broadcasters: int, users: int, firsts: int) -> Dataset:
+    """Create the tables and populate them with broadcasters, users and firsts.
+
+    :param database_uri: database to seed
+    :param fake: fake twitch api to register the broadcasters' tokens with
+    :param broadcasters: number of broadcasters to create
+    :param users: number of users to create
+    :param firsts: number of firsts to create for each broadcaster
+    :return: ids of the created broadcasters and users
+    """
+    config = type(
+        "SeedConfig",
+        (Config,),
+        {**EBS_CONFIG, "SQLALCHEMY_DATABASE_URI": database_uri, "LOG_LEVEL": "WARNING"},
+    )
+    dataset = Dataset(
+        broadcaster_ids=[FIRST_BROADCASTER_ID + i for i in range(broadcasters)],
+        user_ids=list(range(1, users + 1)),
+    )
+    with create_app(config).app_context():
+        db.drop_all()
+        db.create_all()
+        for broadcaster_id in dataset.broadcaster_ids:
+            access_token = f"loadtest{broadcaster_id}"
+            refresh_token = fake.add_broadcaster(
+                broadcaster_id, f"broadcaster{broadcaster_id}", access_token
+            )
+            db.session.add(
+                Broadcaster(
+                    id=broadcaster_id,
+                    name=f"broadcaster{broadcaster_id}",
+                    access_token=access_token,
+                    refresh_token=refresh_token,
+                    reward_id=REWARD_ID,
+                )
+            )
+        db.session.execute(
+            insert(User),
+            [{"id": user_id, "name": f"user{user_id}"} for user_id in dataset.user_ids],
+        )
+        for broadcaster_id in dataset.broadcaster_ids:
+            user_ids = random.choices(dataset.user_ids, k=firsts)
+            db.session.execute(
+                insert(First),
+                [
+                    {"broadcaster_id": broadcaster_id, "name": f"user{user_id}", "user_id": user_id}
+                    for user_id in user_ids
+                ],
+            )
+        totals.rebuild(db.session.connection())
+        db.session.commit()
+
+    return dataset
+
+
+def free_port() -> int:
+    """Find a free local port.
+
+    :return: port number
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def start_ebs(
+    database_uri: str, fake: FakeHelix, workers: int
+) -> tuple[subprocess.Popen[bytes], str]:
+    """Start the EBS with gunicorn, configured to use the fake twitch api.
+
+    :param database_uri: database the EBS should use
+    :param fake: fake twitch api the EBS should use
+    :param workers: number of gunicorn workers
+    :raises RuntimeError: if the EBS doesn't start
+    :return: the gunicorn process and the base url of the EBS
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        **{f"{Config.PREFIX}{key}": value for key, value in EBS_CONFIG.items()},
+        f"{Config.PREFIX}SQLALCHEMY_DATABASE_URI": database_uri,
+        f"{Config.PREFIX}TWITCH_API_BASEURL": fake.base_url,
+        f"{Config.PREFIX}TWITCH_AUTH_URL": fake.auth_url,
+        f"{Config.PREFIX}LOG_LEVEL": "WARNING",
+    }
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "verifiedfirst:create_app()",
+        ],
+        cwd=EBS_DIR,
+        env=env,
+    )
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            requests.get(f"{url}/metrics", timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("timed out waiting for the EBS to start")
+
+
+def panel_requests(dataset: Dataset) -> Callable[[], RequestSpec]:
+    """Viewers of random channels loading the leaderboard.
+
+    :param dataset: seeded broadcasters and users
+    :return: function generating the next request
+    """
+    tokens = {
+        broadcaster_id: traffic.extension_jwt(EXTENSION_SECRET, broadcaster_id)
+        for broadcaster_id in dataset.broadcaster_ids
+    }
+
+    def next_request() -> RequestSpec:
+        token = tokens[random.choice(dataset.broadcaster_ids)]
+        return "GET", "/firsts", {"headers": {"Authorization": f"Bearer {token}"}}
+
+    return next_request
+
+
+def redemption_requests(dataset: Dataset) -> Callable[[], RequestSpec]:
+    """Random users redeeming the first reward on random channels.
+
+    :param dataset: seeded broadcasters and users
+    :return: function generating the next request
+    """
+
+    def next_request() -> RequestSpec:
+        user_id = random.choice(dataset.user_ids)
+        headers, body = traffic.eventsub_notification(
+            EVENTSUB_SECRET,
+            random.choice(dataset.broadcaster_ids),
+            user_id,
+            f"user{user_id}",
+            REWARD_ID,
+        )
+        return "POST", "/eventsub", {"headers": headers, "data": body}
+
+    return next_request
+
+
+def config_requests(dataset: Dataset) -> Callable[[], RequestSpec]:
+    """Broadcasters saving the reward in the extension config.
+
+    :param dataset: seeded broadcasters and users
+    :return: function generating the next request
+    """
+    tokens = {
+        broadcaster_id: traffic.extension_jwt(EXTENSION_SECRET, broadcaster_id, "broadcaster")
+        for broadcaster_id in dataset.broadcaster_ids
+    }
+
+    def next_request() -> RequestSpec:
+        token = tokens[random.choice(dataset.broadcaster_ids)]
+        return (
+            "POST",
+            "/eventsub/create",
+            {"headers": {"Authorization": f"Bearer {token}"}, "params": {"reward_id": REWARD_ID}},
+        )
+
+    return next_request
+
+
+def run_scenario(
+    scenario: str,
+    url: str,
+    next_request: Callable[[], RequestSpec],
+    total: int,
+    concurrency: int,
+) -> Result:
+    """Send requests from a pool of concurrent clients, timing each one.
+
+    :param scenario: name of the scenario
+    :param url: base url of the EBS
+    :param next_request: function generating the requests to send
+    :param total: number of requests to send
+    :param concurrency: number of requests to send at the same time
+    :return: latencies and statuses of the requests
+    """
+    result = Result(scenario)
+    local = threading.local()
+    lock = threading.Lock()
+
+    def send(_: int) -> None:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        method, path, kwargs = next_request()
+        start = time.perf_counter()
+        try:
+            status = str(
+                local.session.request(method, f"{url}{path}", timeout=30, **kwargs).status_code
+            )
+        except requests.RequestException as exp:
+            status = exp.__class__.__name__
+        latency = time.perf_counter() - start
+        with lock:
+            result.latencies.append(latency)
+            result.statuses[status] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(total)))
+    result.duration = time.perf_counter() - start
+
+    return result
+
+
+def main() -> None:
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Load test the EBS against a local fake of the Twitch API."
+    )
+    parser.add_argument("--scenario", choices=(*SCENARIOS, "all"), default="all")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients")
+    parser.add_argument("--workers", type=int, default=4, help="Number of gunicorn workers")
+    parser.add_argument("--broadcasters", type=int, default=10, help="Broadcasters to seed")
+    parser.add_argument("--users", type=int, default=1000, help="Users to seed")
+    parser.add_argument("--firsts", type=int, default=10000, help="Firsts to seed per broadcaster")
+    parser.add_argument(
+        "--twitch-latency", type=float, default=0.0, help="Seconds added to each Twitch API call"
+    )
+    parser.add_argument(
+        "--twitch-error-rate", type=float, default=0.0, help="Fraction of Twitch API calls to fail"
+    )
+    parser.add_argument(
+        "--database-uri",
+        help="Database to use (it will be dropped and re-seeded), defaults to a temporary sqlite db",
+    )
+    parser.add_argument("--output", help="Write the results to this file as json")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    fake = FakeHelix(EXTENSION_SECRET).start()
+    fake.latency = args.twitch_latency
+    fake.error_rate = args.twitch_error_rate
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_uri = args.database_uri or f"sqlite:///{tmpdir}/loadtest.db"
+        logger.info("Seeding database...")
+        dataset = seed(database_uri, fake, args.broadcasters, args.users, args.firsts)
+        process, url = start_ebs(database_uri, fake, args.workers)
+        generators = {
+            "panel": panel_requests,
+            "redemptions": redemption_requests,
+            "config": config_requests,
+        }
+        summaries = []
+        try:
+            for scenario in SCENARIOS if args.scenario == "all" else (args.scenario,):
+                logger.info("Running scenario '%s'...", scenario)
+                result = run_scenario(
+                    scenario, url, generators[scenario](dataset), args.requests, args.concurrency
+                )
+                summary = result.summary()
+                summaries.append(summary)
+                logger.info(
+                    "%s: %d requests, %d errors, %.1f req/s, p50=%.1fms p95=%.1fms p99=%.1fms",
+                    scenario,
+                    summary["requests"],
+                    summary["errors"],
+                    summary["throughput"],
+                    summary["p50_ms"],
+                    summary["p95_ms"],
+                    summary["p99_ms"],
+                )
+        finally:
+            process.terminate()
+            process.wait()
+            fake.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(summaries, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
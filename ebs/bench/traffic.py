@@ -0,0 +1,86 @@
+"""Generators for the requests the EBS receives from Twitch and the extension frontend."""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from datetime import datetime, UTC
+from typing import Any
+
+import jwt
+
+EVENTSUB_TYPE = "channel.channel_points_custom_reward_redemption.add"
+
+
+def extension_jwt(extension_secret: str, channel_id: int, role: str = "viewer") -> str:
+    """Sign a JWT like the ones the extension frontend sends with each request.
+
+    :param extension_secret: base64 encoded extension secret
+    :param channel_id: id of the channel the extension is running on
+    :param role: role of the user, "viewer" or "broadcaster"
+    :return: signed JWT
+    """
+    payload = {
+        "exp": int(time.time() + 3600),
+        "opaque_user_id": f"U{uuid.uuid4().hex[:12]}",
+        "channel_id": str(channel_id),
+        "role": role,
+        "is_unlinked": "false",
+        "pubsub_perms": {"listen": ["broadcast"], "send": []},
+    }
+    return jwt.encode(payload=payload, key=base64.b64decode(extension_secret), algorithm="HS256")
+
+
+def eventsub_notification(
+    eventsub_secret: str, broadcaster_id: int, user_id: int, user_login: str, reward_id: str
+) -> tuple[dict[str, str], bytes]:
+    """Build a signed channel point redemption notification like the ones twitch sends.
+
+    :param eventsub_secret: secret the eventsub was created with
+    :param broadcaster_id: id of the broadcaster the reward belongs to
+    :param user_id: id of the user that redeemed the reward
+    :param user_login: login of the user that redeemed the reward
+    :param reward_id: id of the reward that was redeemed
+    :return: headers and body of the request
+    """
+    now = datetime.now(UTC).isoformat()
+    event: dict[str, Any] = {
+        "id": str(uuid.uuid4()),
+        "broadcaster_user_id": str(broadcaster_id),
+        "broadcaster_user_login": f"broadcaster{broadcaster_id}",
+        "user_id": str(user_id),
+        "user_login": user_login,
+        "user_input": "",
+        "status": "unfulfilled",
+        "reward": {"id": reward_id, "title": "first", "cost": 1, "prompt": ""},
+        "redeemed_at": now,
+    }
+    body = json.dumps(
+        {
+            "subscription": {
+                "id": str(uuid.uuid4()),
+                "type": EVENTSUB_TYPE,
+                "version": "1",
+                "status": "enabled",
+                "condition": {"broadcaster_user_id": str(broadcaster_id), "reward_id": reward_id},
+                "transport": {"method": "webhook"},
+                "created_at": now,
+            },
+            "event": event,
+        }
+    ).encode("utf-8")
+
+    message_id = str(uuid.uuid4())
+    signature = hmac.new(
+        eventsub_secret.encode("utf-8"), message_id.encode() + now.encode() + body, hashlib.sha256
+    ).hexdigest()
+    headers = {
+        "Content-Type": "application/json",
+        "Twitch-Eventsub-Message-Id": message_id,
+        "Twitch-Eventsub-Message-Timestamp": now,
+        "Twitch-Eventsub-Message-Signature": f"sha256={signature}",
+        "Twitch-Eventsub-Message-Type": "notification",
+    }
+    return headers, body
@@ -0,0 +1,27 @@
+"""Gunicorn config, loaded automatically when gunicorn is started from this directory."""
+
+import glob
+import os
+
+from prometheus_client import multiprocess
+
+# /firsts/stream connections each hold a thread open for up to VFIRST_STREAM_TIMEOUT seconds, so
+# deployments that enable streams use threaded workers with more threads than
+# VFIRST_STREAM_MAX_CLIENTS, others keep single threaded sync workers
+threads = int(os.environ.get("GUNICORN_THREADS") or 1)
+worker_class = "gthread" if threads > 1 else "sync"
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Clear metrics left over from a previous run before any workers start."""
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        # keep the directory, with --preload the app has already been imported and uses it
+        for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Stop reporting live gauges for workers that have exited."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from verifiedfirst import create_app, db, twitch
+from verifiedfirst import create_app, db, totals, twitch
 from verifiedfirst.models.firsts import First
 
 BROADCASTER_ID = "25819608"
@@ -14,5 +14,8 @@ with create_app().app_context():
     db.session.add(First(broadcaster_id=broadcaster.id, name="test2"))
     db.session.add(First(broadcaster_id=broadcaster.id, name="test3"))
 
+    # all time leaderboards are read from the running totals
+    db.session.flush()
+    totals.rebuild(db.session.connection(), broadcaster.id)
 
     db.session.commit()
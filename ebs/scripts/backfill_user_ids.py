@@ -8,23 +8,56 @@ API response are left with user_id=NULL.
 A second phase ensures User records exist for any user_id values already set in the
 First table that are missing from the User table (e.g. from a partial previous run).
 
+Both phases work through the table in bounded chunks. Each chunk of looked up users is
+staged into a temporary table so the updates are a handful of set-based statements
+rather than one query per user. Progress is checkpointed after every chunk, so an
+interrupted run can be continued with --resume without repeating the Twitch API lookups
+for the chunks that were already completed. The running totals are rebuilt once all the
+chunks are done, as firsts that gain a user_id move from their name's total to the user's.
+
 Usage:
-    python -m scripts.backfill_user_ids
+    python -m scripts.backfill_user_ids [--chunk-size N] [--resume]
 """
 
+import argparse
 import logging
 from typing import List
 
 from requests import Request
-from sqlalchemy import select
-
-from verifiedfirst import create_app, twitch
+from sqlalchemy import (
+    Column,
+    Connection,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    delete,
+    exists,
+    func,
+    insert,
+    select,
+    update,
+)
+
+from scripts.jobs import Checkpoint, add_job_arguments
+from verifiedfirst import create_app, totals, twitch
 from verifiedfirst.database import db
 from verifiedfirst.models.firsts import First
 from verifiedfirst.models.users import User
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHUNK_SIZE = 1000
+
+# login -> user_id map for the chunk currently being processed
+STAGING = Table(
+    "backfill_user_ids_staging",
+    MetaData(),
+    Column("login", String, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
 
 def _get_users_by_id(user_ids: List[int]) -> dict[int, str]:
     """Look up Twitch users by numeric ID and return a mapping of user_id -> login.
@@ -51,95 +84,192 @@ def _get_users_by_id(user_ids: List[int]) -> dict[int, str]:
     return id_to_login
 
 
-def backfill_user_ids() -> None:
-    """Look up Twitch user IDs for all First rows that are missing a user_id."""
+def _stage_logins(conn: Connection, login_to_id: dict[str, int]) -> None:
+    """Replace the contents of the staging table with a login -> user_id map.
 
-    # Phase 1: set user_id on First rows that are still NULL
-    rows_without_id = (
-        db.session.query(First.name)
-        .filter(First.user_id.is_(None))
-        .distinct()
-        .all()
-    )
-    logins = [row.name for row in rows_without_id]
+    :param conn: connection the staging table was created on
+    :param login_to_id: dict mapping login name to numeric Twitch user id
+    """
+    conn.execute(delete(STAGING))
+    if login_to_id:
+        conn.execute(
+            insert(STAGING),
+            [{"login": login, "user_id": user_id} for login, user_id in login_to_id.items()],
+        )
 
-    if not logins:
-        logger.info("No First rows are missing a user_id, nothing to do.")
-    else:
-        logger.info("Looking up %d unique login(s) via the Twitch API...", len(logins))
+
+def backfill_missing_user_ids(
+    conn: Connection, checkpoint: Checkpoint, last_login: str, chunk_size: int
+) -> None:
+    """Phase 1: set user_id on First rows that are still NULL.
+
+    Distinct logins are read in chunks, looked up via the Twitch API and staged into a temporary
+    table, then the User cache and the First rows are updated with one statement each per chunk.
+
+    :param conn: connection to run the backfill on
+    :param checkpoint: checkpoint to record progress in after each chunk
+    :param last_login: only process logins after this one, used to resume an interrupted run
+    :param chunk_size: number of logins to process per chunk
+    """
+    STAGING.create(conn, checkfirst=True)
+    users = User.__table__
+    firsts = First.__table__
+    processed = updated = 0
+    not_found: list[str] = []
+
+    while True:
+        logins = list(
+            conn.execute(
+                select(firsts.c.name)
+                .where(firsts.c.user_id.is_(None), firsts.c.name > last_login)
+                .distinct()
+                .order_by(firsts.c.name)
+                .limit(chunk_size)
+            ).scalars()
+        )
+        if not logins:
+            break
+        last_login = logins[-1]
 
         login_to_id = twitch.get_users_by_login(logins)
+        not_found.extend(set(logins) - set(login_to_id))
+        _stage_logins(conn, login_to_id)
 
-        found = set(login_to_id.keys())
-        not_found = set(logins) - found
-        if not_found:
-            logger.warning(
-                "%d login(s) were not found in the Twitch API and will remain NULL: %s",
-                len(not_found),
-                sorted(not_found),
+        # refresh the names of cached users, then add the ones that are missing
+        conn.execute(
+            update(users).where(users.c.id == STAGING.c.user_id).values(name=STAGING.c.login)
+        )
+        conn.execute(
+            insert(users).from_select(
+                ["id", "name", "last_seen"],
+                select(STAGING.c.user_id, STAGING.c.login, func.current_timestamp()).where(
+                    ~exists().where(users.c.id == STAGING.c.user_id)
+                ),
             )
+        )
+        result = conn.execute(
+            update(firsts)
+            .where(firsts.c.user_id.is_(None), firsts.c.name == STAGING.c.login)
+            .values(user_id=STAGING.c.user_id)
+        )
+        checkpoint.save(f"logins:{last_login}")
+        conn.commit()
+
+        processed += len(logins)
+        updated += result.rowcount
+        logger.info(
+            "Processed %d login(s), set user_id on %d First row(s) so far...", processed, updated
+        )
+
+    STAGING.drop(conn)
+    checkpoint.save("user_ids:0")
+    conn.commit()
+
+    if not processed:
+        logger.info("No First rows are missing a user_id, nothing to do.")
+    if not_found:
+        logger.warning(
+            "%d login(s) were not found in the Twitch API and will remain NULL: %s",
+            len(not_found),
+            sorted(not_found),
+        )
 
-        for login, user_id in login_to_id.items():
-            user = db.session.get(User, user_id)
-            if user is None:
-                db.session.add(User(id=user_id, name=login))
-            else:
-                user.name = login
-
-            updated = (
-                db.session.query(First)
-                .filter(First.name == login, First.user_id.is_(None))
-                .all()
+
+def backfill_orphaned_users(
+    conn: Connection, checkpoint: Checkpoint, last_user_id: int, chunk_size: int
+) -> None:
+    """Phase 2: ensure User records exist for any user_id already set in First.
+
+    :param conn: connection to run the backfill on
+    :param checkpoint: checkpoint to record progress in after each chunk
+    :param last_user_id: only process user ids after this one, used to resume an interrupted run
+    :param chunk_size: number of user ids to process per chunk
+    """
+    users = User.__table__
+    firsts = First.__table__
+    processed = created = 0
+    missing: list[int] = []
+
+    while True:
+        orphaned_ids = list(
+            conn.execute(
+                select(firsts.c.user_id)
+                .outerjoin(users, users.c.id == firsts.c.user_id)
+                .where(
+                    firsts.c.user_id.is_not(None),
+                    users.c.id.is_(None),
+                    firsts.c.user_id > last_user_id,
+                )
+                .distinct()
+                .order_by(firsts.c.user_id)
+                .limit(chunk_size)
+            ).scalars()
+        )
+        if not orphaned_ids:
+            break
+        last_user_id = orphaned_ids[-1]
+
+        id_to_login = _get_users_by_id(orphaned_ids)
+        missing.extend(set(orphaned_ids) - set(id_to_login))
+        if id_to_login:
+            conn.execute(
+                insert(users),
+                [{"id": user_id, "name": login} for user_id, login in id_to_login.items()],
             )
-            for first in updated:
-                first.user_id = user_id
-
-            logger.info("Set user_id=%d for login=%s (%d row(s))", user_id, login, len(updated))
-
-        db.session.commit()
-
-    # Phase 2: ensure User records exist for any user_id already set in First
-    existing_user_ids = db.session.execute(select(User.id)).scalars().all()
-    orphaned_ids = [
-        row.user_id
-        for row in (
-            db.session.query(First.user_id)
-            .filter(First.user_id.is_not(None), First.user_id.not_in(existing_user_ids))
-            .distinct()
-            .all()
+        checkpoint.save(f"user_ids:{last_user_id}")
+        conn.commit()
+
+        processed += len(orphaned_ids)
+        created += len(id_to_login)
+        logger.info(
+            "Processed %d orphaned user_id(s), created %d User record(s) so far...",
+            processed,
+            created,
         )
-    ]
 
-    if not orphaned_ids:
+    if not processed:
         logger.info("No orphaned user_ids found in First table, nothing to do.")
-    else:
-        logger.info(
-            "Looking up %d user_id(s) with no User record...", len(orphaned_ids)
+    if missing:
+        logger.warning(
+            "%d user_id(s) were not found in the Twitch API: %s",
+            len(missing),
+            sorted(missing),
         )
-        id_to_login = _get_users_by_id(list(orphaned_ids))
-
-        for user_id, login in id_to_login.items():
-            db.session.add(User(id=user_id, name=login))
-            logger.info("Created User record for user_id=%d login=%s", user_id, login)
-
-        missing = set(orphaned_ids) - set(id_to_login.keys())
-        if missing:
-            logger.warning(
-                "%d user_id(s) were not found in the Twitch API: %s",
-                len(missing),
-                sorted(missing),
-            )
 
-        db.session.commit()
+
+def backfill_user_ids(chunk_size: int = DEFAULT_CHUNK_SIZE, resume: bool = False) -> None:
+    """Look up Twitch user IDs for all First rows that are missing a user_id.
+
+    :param chunk_size: number of logins or user ids to process per chunk
+    :param resume: continue from the checkpoint of an interrupted run
+    """
+    with db.engine.connect() as conn:
+        checkpoint = Checkpoint(conn, "backfill_user_ids", resume=resume)
+        # the cursor records the phase and the last login/user id it completed
+        phase, _, position = (checkpoint.cursor or "logins:").partition(":")
+        if phase == "logins":
+            backfill_missing_user_ids(conn, checkpoint, position, chunk_size)
+            position = "0"
+        backfill_orphaned_users(conn, checkpoint, int(position), chunk_size)
+
+        logger.info("Rebuilt %d total(s).", totals.rebuild(conn))
+        checkpoint.clear()
+        conn.commit()
 
     logger.info("Backfill complete.")
 
 
 def main() -> None:
     """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Backfill user_id on existing First rows that predate the User table."
+    )
+    add_job_arguments(parser, DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
     logging.getLogger().setLevel(logging.INFO)
     with create_app().app_context():
-        backfill_user_ids()
+        backfill_user_ids(args.chunk_size, resume=args.resume)
 
 
 if __name__ == "__main__":
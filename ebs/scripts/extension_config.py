@@ -0,0 +1,144 @@
+"""Concurrent client for the Twitch Extensions Configuration API, shared by the config scripts.
+
+The Get Extension Configuration Segment endpoint only accepts a single broadcaster_id per request,
+so reads can't be batched. Instead requests for different broadcasters are sent from a bounded pool
+of worker threads over a single pooled session. Requests that are rate limited (429) wait until the
+rate limit bucket resets and are retried.
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Mapping
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from verifiedfirst.extension_jwt import ExtensionJWTSigner
+from verifiedfirst.models.broadcasters import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+VERSION = "1"
+DEFAULT_WORKERS = 8
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class ExtensionConfigClient:
+    """Reads and writes the broadcaster segment of the extension configuration."""
+
+    def __init__(self, config: Mapping[str, Any], workers: int = DEFAULT_WORKERS) -> None:
+        """Create a new client.
+
+        :param config: app config containing the twitch api settings
+        :param workers: maximum number of requests to send at the same time
+        """
+        self.client_id = config["CLIENT_ID"]
+        self.signer = ExtensionJWTSigner(config["EXTENSION_SECRET"])
+        self.url = f"{config['TWITCH_API_BASEURL']}/extensions/configurations"
+        self.timeout = config["REQUEST_TIMEOUT"]
+        self.workers = workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+
+    def get_headers(self, broadcaster: Broadcaster) -> dict[str, str]:
+        """Get headers allowing the config of a broadcaster to be read and written.
+
+        :param broadcaster: broadcaster the requests are for
+        :return: headers to send with the requests
+        """
+        return self.signer.headers(self.client_id, broadcaster.id, role="broadcaster")
+
+    def request(self, method: str, **kwargs: Any) -> requests.Response:
+        """Send a request to the configuration endpoint, waiting and retrying if rate limited.
+
+        :param method: http method to use
+        :param kwargs: extra arguments passed to requests
+        :return: response from the twitch api
+        """
+        for attempt in range(MAX_RATE_LIMIT_RETRIES):
+            resp = self.session.request(method, self.url, timeout=self.timeout, **kwargs)
+            if resp.status_code != requests.codes.too_many_requests:
+                break
+            if attempt == MAX_RATE_LIMIT_RETRIES - 1:
+                # no attempts left, so fail straight away rather than waiting for nothing
+                break
+            reset = float(resp.headers.get("Ratelimit-Reset") or time.time() + 1)
+            delay = max(reset - time.time(), 0.0)
+            logger.warning("Rate limited, retrying in %.1f second(s).", delay)
+            time.sleep(delay)
+
+        resp.raise_for_status()
+        return resp
+
+    def get_config(self, broadcaster: Broadcaster) -> dict[str, Any] | None:
+        """Get the current broadcaster config.
+
+        :param broadcaster: broadcaster to get the config for
+        :return: the current config, or None if it isn't set or isn't valid json
+        """
+        resp = self.request(
+            "GET",
+            params={
+                "extension_id": self.client_id,
+                "broadcaster_id": str(broadcaster.id),
+                "segment": "broadcaster",
+            },
+            headers=self.get_headers(broadcaster),
+        )
+
+        try:
+            current_config = json.loads(resp.json()["data"][0]["content"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
+        return current_config if isinstance(current_config, dict) else None
+
+    def set_config(self, broadcaster: Broadcaster, content: dict[str, Any]) -> None:
+        """Set the broadcaster config.
+
+        :param broadcaster: broadcaster to set the config for
+        :param content: new config
+        """
+        self.request(
+            "PUT",
+            headers=self.get_headers(broadcaster),
+            json={
+                "extension_id": self.client_id,
+                "broadcaster_id": str(broadcaster.id),
+                "segment": "broadcaster",
+                "version": VERSION,
+                "content": json.dumps(content),
+            },
+        )
+
+    def run(
+        self, broadcasters: Iterable[Broadcaster], func: Callable[[Broadcaster], None]
+    ) -> list[Broadcaster]:
+        """Run a function for each broadcaster using the worker pool.
+
+        Errors are logged and don't stop the other broadcasters from being processed.
+
+        :param broadcasters: broadcasters to process
+        :param func: function to call for each broadcaster
+        :return: broadcasters that failed
+        """
+
+        def run_one(broadcaster: Broadcaster) -> Broadcaster | None:
+            try:
+                func(broadcaster)
+            except requests.RequestException as exp:
+                logger.error("Failed for broadcaster '%s': %s", broadcaster.name, exp)
+                return broadcaster
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(run_one, broadcasters)
+            return [broadcaster for broadcaster in results if broadcaster is not None]
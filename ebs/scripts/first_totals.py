@@ -0,0 +1,89 @@
+"""Rebuild or check the running totals of each user's firsts.
+
+The first_totals table is maintained by add_first and the scripts that change the first table, and
+is created from the existing firsts when the app first starts against an upgraded database. Run
+rebuild to fix totals that check reports as inconsistent (it also creates the table if it does not
+exist). Each rebuild runs in a single transaction.
+
+check exits with status 1 if any total doesn't match the first table.
+
+Usage:
+    python -m scripts.first_totals {rebuild,check} [--broadcaster-id N]
+
+Example:
+    python -m scripts.first_totals rebuild
+    python -m scripts.first_totals check --broadcaster-id 12345678
+"""
+
+import argparse
+import logging
+import sys
+
+from verifiedfirst import create_app, totals
+from verifiedfirst.database import db
+from verifiedfirst.models.first_totals import FirstTotal
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild(broadcaster_id: int | None) -> None:
+    """Recompute the totals from the first table.
+
+    :param broadcaster_id: only rebuild the totals of this broadcaster, or all broadcasters if None
+    """
+    FirstTotal.__table__.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        count = totals.rebuild(conn, broadcaster_id)
+        conn.commit()
+
+    logger.info("Rebuilt %d total(s).", count)
+
+
+def check(broadcaster_id: int | None) -> bool:
+    """Compare the totals against the first table and log any that don't match.
+
+    :param broadcaster_id: only check the totals of this broadcaster, or all broadcasters if None
+    :return: True if all the totals match
+    """
+    with db.engine.connect() as conn:
+        mismatches = totals.check(conn, broadcaster_id)
+
+    for (total_broadcaster_id, user), (expected, actual) in sorted(mismatches.items(), key=str):
+        logger.warning(
+            "broadcaster_id=%d user=%s has a total of %d, expected %d.",
+            total_broadcaster_id,
+            user,
+            actual,
+            expected,
+        )
+    if mismatches:
+        logger.error("%d total(s) are inconsistent, run rebuild to fix them.", len(mismatches))
+        return False
+
+    logger.info("All totals are consistent.")
+    return True
+
+
+def main() -> None:
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Rebuild or check the running totals of each user's firsts."
+    )
+    parser.add_argument(
+        "command", choices=["rebuild", "check"], help="Recompute the totals, or check them"
+    )
+    parser.add_argument(
+        "--broadcaster-id", type=int, help="Only rebuild/check the totals of this broadcaster"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    with create_app().app_context():
+        if args.command == "rebuild":
+            rebuild(args.broadcaster_id)
+        elif not check(args.broadcaster_id):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Populate the database with synthetic channel histories for benchmarks and capacity planning.
+
+Creates broadcasters, users and firsts that look like production data rather than a handful of
+hand written rows:
+
+- chatter activity follows a Zipf distribution, a few regulars claim most of a channel's firsts
+  while most users only have one or two. Each channel has its own set of regulars.
+- channel sizes also follow a Zipf distribution, a few big channels have most of the firsts.
+- timestamps are spread over several years and ids increase with time, like rows that were
+  inserted as the redemptions happened.
+- the oldest firsts of each channel are legacy rows with a NULL user_id, from before the user id
+  was recorded.
+
+Rows are written with bulk inserts in chunks so millions of rows can be created in seconds. The
+running totals of each channel are rebuilt after its firsts are inserted.
+
+Usage:
+    python -m scripts.generate_data [--channels N] [--users N] [--firsts N] [--zipf-exponent S]
+        [--legacy-fraction F] [--years N] [--chunk-size N] [--seed N] [--drop]
+
+Example:
+    python -m scripts.generate_data --channels 100 --users 50000 --firsts 1000000 --drop
+"""
+
+import argparse
+import logging
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, UTC
+from itertools import accumulate, batched
+from typing import Any, Iterator, Sequence
+
+from sqlalchemy import Connection, func, insert, select
+
+from verifiedfirst import create_app, totals
+from verifiedfirst.database import db
+from verifiedfirst.models.broadcasters import Broadcaster
+from verifiedfirst.models.firsts import First
+from verifiedfirst.models.users import User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_ZIPF_EXPONENT = 1.1
+REWARD_ID = "00000000-0000-4000-8000-000000000000"
+
+
+def zipf_cum_weights(n: int, exponent: float = DEFAULT_ZIPF_EXPONENT) -> list[float]:
+    """Get the cumulative weights of a Zipf distribution over n ranks.
+
+    :param n: number of ranks
+    :param exponent: exponent of the distribution, higher values are more skewed
+    :return: cumulative weights to pass to random.choices, the first rank is the most likely
+    """
+    return list(accumulate(1 / rank**exponent for rank in range(1, n + 1)))
+
+
+def split(total: int, cum_weights: Sequence[float], rng: random.Random) -> list[int]:
+    """Split a total between ranks according to a distribution.
+
+    :param total: total to split
+    :param cum_weights: cumulative weights of the ranks
+    :param rng: random number generator to use
+    :return: the share of each rank
+    """
+    counts = Counter(rng.choices(range(len(cum_weights)), cum_weights=cum_weights, k=total))
+    return [counts[rank] for rank in range(len(cum_weights))]
+
+
+def generate_firsts(
+    broadcaster_id: int,
+    count: int,
+    user_ids: Sequence[int],
+    cum_weights: Sequence[float],
+    *,
+    start: datetime,
+    end: datetime,
+    legacy_fraction: float = 0.0,
+    rng: random.Random | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Generate the firsts of a channel in chronological order.
+
+    :param broadcaster_id: id of the channel
+    :param count: number of firsts to generate
+    :param user_ids: ids of the channel's chatters, most active first
+    :param cum_weights: cumulative weights of the chatters' activity
+    :param start: time of the earliest possible first
+    :param end: time of the latest possible first
+    :param legacy_fraction: fraction of the oldest firsts to generate without a user_id
+    :param rng: random number generator to use
+    :return: iterator of rows to insert into the first table
+    """
+    rng = rng or random.Random()
+    span = (end - start).total_seconds()
+    offsets = sorted(rng.random() * span for _ in range(count))
+    chatters = rng.choices(user_ids, cum_weights=cum_weights, k=count)
+    legacy = int(count * legacy_fraction)
+
+    for i, (offset, user_id) in enumerate(zip(offsets, chatters)):
+        yield {
+            "broadcaster_id": broadcaster_id,
+            "name": f"user{user_id}",
+            "user_id": None if i < legacy else user_id,
+            "timestamp": start + timedelta(seconds=offset),
+        }
+
+
+def bulk_insert(
+    conn: Connection, model: Any, rows: Iterator[dict[str, Any]], chunk_size: int
+) -> int:
+    """Insert rows in chunks.
+
+    :param conn: connection to insert the rows with
+    :param model: model of the table to insert the rows into
+    :param rows: rows to insert
+    :param chunk_size: number of rows to insert per statement
+    :return: number of rows inserted
+    """
+    inserted = 0
+    for chunk in batched(rows, chunk_size):
+        conn.execute(insert(model.__table__), list(chunk))
+        inserted += len(chunk)
+
+    return inserted
+
+
+def generate_data(  # pylint: disable=too-many-arguments,too-many-locals
+    conn: Connection,
+    channels: int,
+    users: int,
+    firsts: int,
+    *,
+    zipf_exponent: float = DEFAULT_ZIPF_EXPONENT,
+    legacy_fraction: float = 0.1,
+    years: int = 3,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    seed: int | None = None,
+) -> None:
+    """Add synthetic broadcasters, users and firsts to the database.
+
+    Ids continue after the largest existing ids, so the data can be added to an existing database.
+
+    :param conn: connection to add the data with
+    :param channels: number of broadcasters to create
+    :param users: number of users to create
+    :param firsts: total number of firsts to create across all channels
+    :param zipf_exponent: skew of the channel sizes and chatter activity
+    :param legacy_fraction: fraction of each channel's oldest firsts that have no user_id
+    :param years: number of years the firsts are spread over
+    :param chunk_size: number of rows to insert per statement
+    :param seed: seed for the random number generator, for repeatable datasets
+    """
+    rng = random.Random(seed)
+    first_broadcaster_id = (conn.scalar(select(func.max(Broadcaster.id))) or 0) + 1
+    first_user_id = (conn.scalar(select(func.max(User.id))) or 0) + 1
+    broadcaster_ids = list(range(first_broadcaster_id, first_broadcaster_id + channels))
+    user_ids = list(range(first_user_id, first_user_id + users))
+    end = datetime.now(UTC).replace(tzinfo=None)
+    start = end - timedelta(days=365 * years)
+
+    bulk_insert(
+        conn,
+        Broadcaster,
+        (
+            {
+                "id": broadcaster_id,
+                "name": f"broadcaster{broadcaster_id}",
+                "access_token": f"access{broadcaster_id}",
+                "refresh_token": f"refresh{broadcaster_id}",
+                "reward_name": "first",
+                "reward_id": REWARD_ID,
+            }
+            for broadcaster_id in broadcaster_ids
+        ),
+        chunk_size,
+    )
+    bulk_insert(
+        conn,
+        User,
+        ({"id": user_id, "name": f"user{user_id}", "last_seen": end} for user_id in user_ids),
+        chunk_size,
+    )
+    conn.commit()
+    logger.info("Created %d broadcaster(s) and %d user(s)", channels, users)
+
+    cum_weights = zipf_cum_weights(users, zipf_exponent)
+    sizes = split(firsts, zipf_cum_weights(channels, zipf_exponent), rng)
+    inserted = 0
+    for broadcaster_id, size in zip(broadcaster_ids, sizes):
+        # rotate the users so each channel has different regulars
+        offset = rng.randrange(users)
+        chatters = user_ids[offset:] + user_ids[:offset]
+        inserted += bulk_insert(
+            conn,
+            First,
+            generate_firsts(
+                broadcaster_id,
+                size,
+                chatters,
+                cum_weights,
+                start=start,
+                end=end,
+                legacy_fraction=legacy_fraction,
+                rng=rng,
+            ),
+            chunk_size,
+        )
+        totals.rebuild(conn, broadcaster_id)
+        conn.commit()
+        logger.info("Created %d first(s) for broadcaster %d", size, broadcaster_id)
+
+    logger.info("Created %d first(s) in total", inserted)
+
+
+def main() -> None:
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Populate the database with synthetic broadcasters, users and firsts."
+    )
+    parser.add_argument("--channels", type=int, default=10, help="Number of broadcasters")
+    parser.add_argument("--users", type=int, default=10000, help="Number of users")
+    parser.add_argument(
+        "--firsts", type=int, default=100000, help="Total number of firsts across all channels"
+    )
+    parser.add_argument(
+        "--zipf-exponent",
+        type=float,
+        default=DEFAULT_ZIPF_EXPONENT,
+        help="Skew of the channel sizes and chatter activity",
+    )
+    parser.add_argument(
+        "--legacy-fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of each channel's oldest firsts created with a NULL user_id",
+    )
+    parser.add_argument(
+        "--years", type=int, default=3, help="Number of years the firsts are spread over"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Number of rows to insert per statement",
+    )
+    parser.add_argument("--seed", type=int, help="Random seed, for repeatable datasets")
+    parser.add_argument(
+        "--drop", action="store_true", help="Drop and recreate all tables before generating"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    with create_app().app_context():
+        if args.drop:
+            db.drop_all()
+        db.create_all()
+
+        started = time.monotonic()
+        with db.engine.connect() as conn:
+            generate_data(
+                conn,
+                args.channels,
+                args.users,
+                args.firsts,
+                zipf_exponent=args.zipf_exponent,
+                legacy_fraction=args.legacy_fraction,
+                years=args.years,
+                chunk_size=args.chunk_size,
+                seed=args.seed,
+            )
+        logger.info("Done in %.1fs", time.monotonic() - started)
+
+
+if __name__ == "__main__":
+    main()
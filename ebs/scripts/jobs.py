@@ -0,0 +1,114 @@
+"""Helpers for long running maintenance jobs that commit in chunks and can be resumed.
+
+A job works through its rows in a stable order (e.g. by primary key) and, in the same transaction
+as each chunk of work, saves a checkpoint recording the last row it finished. If the job is
+interrupted it can be run again with ``--resume`` to continue after the last saved checkpoint
+instead of starting over.
+
+Example:
+    with db.engine.connect() as conn:
+        checkpoint = Checkpoint(conn, "my_job", resume=args.resume)
+        last_id = int(checkpoint.cursor or 0)
+        for chunk in ...:
+            ...
+            checkpoint.save(chunk[-1].id)
+            conn.commit()
+        checkpoint.clear()
+        conn.commit()
+"""
+
+import argparse
+import logging
+from datetime import datetime, UTC
+
+from sqlalchemy import Column, Connection, DateTime, MetaData, String, Table, delete, insert
+from sqlalchemy import select, update
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS = Table(
+    "job_checkpoint",
+    MetaData(),
+    Column("job", String, primary_key=True),
+    Column("cursor", String, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def add_job_arguments(parser: argparse.ArgumentParser, default_chunk_size: int = 1000) -> None:
+    """Add the common --resume and --chunk-size arguments to a job's argument parser.
+
+    :param parser: parser to add the arguments to
+    :param default_chunk_size: default number of items to process per chunk
+    """
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the last checkpoint of an interrupted run",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=default_chunk_size,
+        help="Number of items to process per chunk/commit",
+    )
+
+
+class Checkpoint:
+    """Progress of a resumable job, stored in the job_checkpoint table."""
+
+    def __init__(self, conn: Connection, job: str, resume: bool = False) -> None:
+        """Load (or discard) the checkpoint for a job.
+
+        :param conn: connection to store the checkpoint with, usually the one the job's work is
+            done on so the checkpoint is committed atomically with each chunk
+        :param job: unique name of the job
+        :param resume: continue from the saved checkpoint if there is one, otherwise any saved
+            checkpoint is discarded
+        """
+        self.conn = conn
+        self.job = job
+        self.cursor: str | None = None
+
+        CHECKPOINTS.create(conn, checkfirst=True)
+        saved = conn.execute(
+            select(CHECKPOINTS.c.cursor).where(CHECKPOINTS.c.job == job)
+        ).scalar_one_or_none()
+
+        if resume and saved is not None:
+            logger.info("Resuming job '%s' after cursor=%s.", job, saved)
+            self.cursor = saved
+        elif resume:
+            logger.info("No checkpoint found for job '%s', starting from the beginning.", job)
+        elif saved is not None:
+            logger.warning(
+                "Discarding checkpoint for job '%s' at cursor=%s, use --resume to continue it.",
+                job,
+                saved,
+            )
+            self.clear()
+        conn.commit()
+
+    def save(self, cursor: str | int) -> None:
+        """Record the last item that was completed.
+
+        The caller is responsible for committing, so the checkpoint can be committed in the same
+        transaction as the work it records.
+
+        :param cursor: position to resume after, e.g. the last primary key processed
+        """
+        self.cursor = str(cursor)
+        values = {"cursor": self.cursor, "updated_at": datetime.now(UTC).replace(tzinfo=None)}
+        result = self.conn.execute(
+            update(CHECKPOINTS).where(CHECKPOINTS.c.job == self.job).values(**values)
+        )
+        if not result.rowcount:
+            self.conn.execute(insert(CHECKPOINTS).values(job=self.job, **values))
+
+    def clear(self) -> None:
+        """Remove the checkpoint once the job has completed.
+
+        The caller is responsible for committing.
+        """
+        self.cursor = None
+        self.conn.execute(delete(CHECKPOINTS).where(CHECKPOINTS.c.job == self.job))
@@ -0,0 +1,46 @@
+"""Add the (broadcaster_id, id) index to the first table of an existing database.
+
+The index serves the /firsts/since endpoint, which reads the firsts added for a broadcaster after a
+given id. New databases created with init_db.py already have it.
+
+This script is idempotent and safe to run multiple times.
+
+Usage:
+    python -m scripts.migrate_first_index
+"""
+
+import logging
+
+from sqlalchemy import inspect
+
+from verifiedfirst import create_app
+from verifiedfirst.database import db
+from verifiedfirst.models.firsts import First
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "ix_first_broadcaster_id_id"
+
+
+def migrate() -> None:
+    """Create the index if it doesn't exist."""
+    existing_indexes = [index["name"] for index in inspect(db.engine).get_indexes("first")]
+    if INDEX_NAME in existing_indexes:
+        logger.info("'%s' index already exists on 'first' table, skipping.", INDEX_NAME)
+        return
+
+    logger.info("Creating '%s' index on 'first' table...", INDEX_NAME)
+    index = next(index for index in First.__table__.indexes if index.name == INDEX_NAME)
+    index.create(db.engine)
+    logger.info("'%s' index created.", INDEX_NAME)
+
+
+def main() -> None:
+    """Entry point."""
+    logging.getLogger().setLevel(logging.INFO)
+    with create_app().app_context():
+        migrate()
+
+
+if __name__ == "__main__":
+    main()
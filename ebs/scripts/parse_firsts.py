@@ -1,63 +1,135 @@
-"""Used to import firsts from a csv."""
+"""Import firsts for a broadcaster from a csv.
+
+The csv must have a "Name" column followed by one column per month (e.g. "Jan 23") containing the
+number of firsts the user got that month. Users are validated against the Twitch API in batches of
+100 and the firsts are inserted in chunks, committing after each chunk. Names that are not found in
+the Twitch API are imported as-is with no user_id. The broadcaster's running totals are rebuilt
+once all the firsts are imported.
+
+Usage:
+    python -m scripts.parse_firsts <broadcaster_id> <csv_file> [--chunk-size N]
+
+Example:
+    python -m scripts.parse_firsts 12345678 /tmp/firsts.csv
+"""
+
+import argparse
 import csv
+import logging
+import sys
 from datetime import datetime
+from itertools import batched
+from typing import Any, Iterable, Iterator, TextIO
 
-from flask import current_app
-from requests import Request
+from sqlalchemy import insert
 
-from verifiedfirst import create_app, db, twitch
+from verifiedfirst import create_app, totals, twitch
+from verifiedfirst.database import db
 from verifiedfirst.models.firsts import First
+from verifiedfirst.models.users import User
 
-BROADCASTER_ID = "12345678"
-CSV_FILE = "/tmp/firsts.csv"
+logger = logging.getLogger(__name__)
 
+# the Twitch /users endpoint accepts up to 100 logins per request
+USER_BATCH_SIZE = 100
 
-def check_user(broadcaster, display_name):
-    username = display_name.strip().lower()
-    req = Request(
-        method="GET",
-        url=f"{current_app.config['TWITCH_API_BASEURL']}/users",
-        headers={"Client-ID": current_app.config["CLIENT_ID"]},
-        params={
-            "login": str(username),
-        },
-    )
 
-    resp = twitch.request_twitch_api_broadcaster(broadcaster, req)
-    resp.raise_for_status()
-    try:
-        user = resp.json()["data"][0]["login"]
-        print(f"{user} is valid")
-    except IndexError:
-        print(f"user {username} not found")
-        user = username
+def read_csv(csvfile: TextIO) -> Iterator[tuple[str, list[tuple[datetime, int]]]]:
+    """Read the first counts for each user from a csv.
+
+    :param csvfile: open csv file
+    :return: iterator of (login, [(month, count), ...]) for each row
+    """
+    reader = csv.DictReader(csvfile)
+    months = [(month, datetime.strptime(month, "%b %y")) for month in reader.fieldnames[1:]]
+    for row in reader:
+        login = row["Name"].strip().lower()
+        yield login, [(date, int(row[month] or 0)) for month, date in months]
+
+
+def validate_users(logins: list[str]) -> dict[str, int]:
+    """Look up a batch of logins and make sure a User record exists for each valid one.
+
+    :param logins: login names to look up
+    :return: dict mapping login name to numeric Twitch user id for the valid logins
+    """
+    login_to_id = twitch.get_users_by_login(sorted(set(logins)))
+    for login in set(logins) - set(login_to_id):
+        logger.warning("User '%s' not found in the Twitch API, importing without user_id.", login)
+
+    users = {user.id: user for user in User.query.filter(User.id.in_(login_to_id.values())).all()}
+    for login, user_id in login_to_id.items():
+        if user_id in users:
+            users[user_id].name = login
+        else:
+            db.session.add(User(id=user_id, name=login))
+
+    return login_to_id
 
-    return user
 
+def iter_firsts(
+    broadcaster_id: int, rows: Iterable[tuple[str, list[tuple[datetime, int]]]]
+) -> Iterator[dict[str, Any]]:
+    """Expand csv rows into one First row per redemption, validating users in batches.
 
-def main():
-    firsts = []
+    :param broadcaster_id: id of the broadcaster the firsts belong to
+    :param rows: (login, [(month, count), ...]) for each user
+    :return: iterator of First rows as dicts suitable for a bulk insert
+    """
+    for batch in batched(rows, USER_BATCH_SIZE):
+        login_to_id = validate_users([login for login, _ in batch])
+        for login, counts in batch:
+            for date, count in counts:
+                for _ in range(count):
+                    yield {
+                        "broadcaster_id": broadcaster_id,
+                        "name": login,
+                        "user_id": login_to_id.get(login),
+                        "timestamp": date,
+                    }
+
+
+def import_firsts(broadcaster_id: int, csvfile: TextIO, chunk_size: int) -> int:
+    """Bulk insert the firsts from a csv, committing after each chunk.
+
+    :param broadcaster_id: id of the broadcaster the firsts belong to
+    :param csvfile: open csv file
+    :param chunk_size: number of firsts to insert per statement and commit
+    :return: number of firsts imported
+    """
+    total = 0
+    for chunk in batched(iter_firsts(broadcaster_id, read_csv(csvfile)), chunk_size):
+        db.session.execute(insert(First), list(chunk))
+        db.session.commit()
+        total += len(chunk)
+        logger.info("Imported %d first(s)...", total)
+
+    # commit any users validated after the last chunk was inserted, along with the totals
+    totals.rebuild(db.session.connection(), broadcaster_id)
+    db.session.commit()
+    return total
+
+
+def main() -> None:
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Import firsts for a broadcaster from a csv.")
+    parser.add_argument("broadcaster_id", type=int, help="Twitch user ID of the broadcaster")
+    parser.add_argument("csv_file", help="Path to the csv file to import")
+    parser.add_argument(
+        "--chunk-size", type=int, default=1000, help="Number of firsts to insert per commit"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
     with create_app().app_context():
-        broadcaster = twitch.get_broadcaster(BROADCASTER_ID)
-        with open(CSV_FILE, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            months = reader.fieldnames[1:]
-            for row in reader:
-                username = check_user(broadcaster, row["Name"])
-                for month in months:
-                    date = datetime.strptime(month, "%b %y")
-                    count = row[month]
-                    if count == "":
-                        count = 0
-                    for _ in range(0, int(count)):
-                        firsts.append((username, date))
-        for first in firsts:
-            name = first[0]
-            date = first[1]
-            print(name, date)
-            first_entry = First(broadcaster_id=broadcaster.id, name=name, timestamp=date)
-            db.session.add(first_entry)
-            db.session.commit()
+        if twitch.get_broadcaster(args.broadcaster_id) is None:
+            logger.error("No broadcaster found with id=%d.", args.broadcaster_id)
+            sys.exit(1)
+
+        with open(args.csv_file, newline="", encoding="utf-8") as csvfile:
+            total = import_firsts(args.broadcaster_id, csvfile, args.chunk_size)
+
+    logger.info("Imported %d first(s) for broadcaster id=%d.", total, args.broadcaster_id)
 
 
 if __name__ == "__main__":
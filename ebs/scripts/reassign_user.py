@@ -1,7 +1,8 @@
 """Reassign First entries from an old username to a user's current Twitch account.
 
 Looks up the current username via the Twitch API to get the stable user ID, then
-sets user_id on all First rows that have the old username and no user_id set.
+sets user_id on all First rows that have the old username and no user_id set. The running
+totals of the affected broadcasters are rebuilt in the same transaction.
 
 Usage:
     python -m scripts.reassign_user <current_username> <old_username>
@@ -14,7 +15,7 @@ import argparse
 import logging
 import sys
 
-from verifiedfirst import create_app, twitch
+from verifiedfirst import create_app, totals, twitch
 from verifiedfirst.database import db
 from verifiedfirst.models.firsts import First
 from verifiedfirst.models.users import User
@@ -64,6 +65,9 @@ def reassign_user(current_username: str, old_username: str) -> None:
             len(rows),
             old_username,
         )
+        db.session.flush()
+        for broadcaster_id in sorted({first.broadcaster_id for first in rows}):
+            totals.rebuild(db.session.connection(), broadcaster_id)
 
     # Warn about any rows for the old username that already have a different user_id
     conflicting = (
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from verifiedfirst import create_app, db, twitch
+from verifiedfirst import create_app, db, totals, twitch
 from verifiedfirst.models.firsts import First
 from verifiedfirst.models.broadcasters import Broadcaster
 
@@ -21,4 +21,7 @@ with create_app().app_context():
 
     first_entry = First(broadcaster_id=broadcaster.id, name="liondeveloper306", timestamp=datetime(2023, 12, 15))
     db.session.add(first_entry)
+    # all time leaderboards are read from the running totals
+    db.session.flush()
+    totals.rebuild(db.session.connection(), broadcaster.id)
     db.session.commit()
@@ -1,65 +1,35 @@
 """Sets the default config for every channel that has configured the extension. This script was
 required due to the default value of the title not working correctly in v0.2.
+
+Broadcasters are processed in chunks ordered by id, with a checkpoint saved after each chunk so an
+interrupted run can be continued with --resume. Within each chunk the broadcasters are processed
+concurrently by --workers threads.
+
+Usage:
+    python -m scripts.update_config [--chunk-size N] [--workers N] [--resume]
 """
-import base64
-import json
-import time
 
-import jwt
-import requests
+import argparse
+import logging
+import sys
+
 from flask import current_app
 
+from scripts.extension_config import DEFAULT_WORKERS, ExtensionConfigClient
+from scripts.jobs import Checkpoint, add_job_arguments
 from verifiedfirst import create_app
+from verifiedfirst.database import db
 from verifiedfirst.models.broadcasters import Broadcaster
 
-VERSION = "1"
-
-
-def get_jwt_headers(broadcaster):
-    jwt_payload = {
-        "exp": int(time.time() + 10),
-        "user_id": str(broadcaster.id),
-        "role": "broadcaster",
-    }
-
-    jwt_token = jwt.encode(
-        payload=jwt_payload,
-        key=base64.b64decode(current_app.config["EXTENSION_SECRET"]),
-    )
+logger = logging.getLogger(__name__)
 
-    headers = {
-        "Authorization": "Bearer " + jwt_token,
-        "Client-Id": current_app.config["CLIENT_ID"],
-    }
-    return headers
-
-
-def get_config(broadcaster):
-    headers = get_jwt_headers(broadcaster)
-    resp = requests.get(
-        "https://api.twitch.tv/helix/extensions/configurations",
-        params={
-            "extension_id": current_app.config["CLIENT_ID"],
-            "broadcaster_id": str(broadcaster.id),
-            "segment": "broadcaster",
-            "version": VERSION,
-        },
-        timeout=5,
-        headers=headers,
-    )
 
-    resp.raise_for_status()
+def default_config(broadcaster: Broadcaster) -> dict[str, str]:
+    """Get the default config for a broadcaster.
 
-    try:
-        current_config = json.loads(resp.json()["data"][0]["content"])
-    except Exception:
-        current_config = None
-
-    return current_config
-
-
-def update_config(broadcaster):
-    headers = get_jwt_headers(broadcaster)
+    :param broadcaster: broadcaster to get the config for
+    :return: default config
+    """
     config = {
         "title": "Verified First Chatters",
         "timeRange": "all_time",
@@ -68,42 +38,74 @@ def update_config(broadcaster):
     if broadcaster.reward_id:
         config["rewardId"] = broadcaster.reward_id
 
-    data = {
-        "extension_id": current_app.config["CLIENT_ID"],
-        "segment": "broadcaster",
-        "version": VERSION,
-        "content": json.dumps(config),
-    }
+    return config
 
-    print(f"setting config for {broadcaster.name} to: {data}")
-
-    resp = requests.put(
-        "https://api.twitch.tv/helix/extensions/configurations",
-        params={
-            "extension_id": current_app.config["CLIENT_ID"],
-            "broadcaster_id": str(broadcaster.id),
-            "segment": "broadcaster",
-            "version": VERSION,
-        },
-        timeout=5,
-        headers=headers,
-        json=data,
-    )
-    resp.raise_for_status()
 
+def update_config(client: ExtensionConfigClient, broadcaster: Broadcaster) -> None:
+    """Set the default config for a broadcaster if it isn't configured already.
 
-def main():
-    with create_app().app_context():
-        broadcasters = Broadcaster.query.filter(Broadcaster.reward_id != "").all()
+    :param client: extension configuration client to use
+    :param broadcaster: broadcaster to update
+    """
+    config = client.get_config(broadcaster)
+    logger.info("Current config for %s: %s", broadcaster.name, config)
+    if config is not None:
+        logger.info("Skipping config update for %s, already configured.", broadcaster.name)
+        return
 
-        for broadcaster in broadcasters:
-            config = get_config(broadcaster)
-            print(f"current config for {broadcaster.name}: {config}")
-            if config is None:
-                print(f"updating config for {broadcaster.name}")
-                update_config(broadcaster)
-            else:
-                print(f"skipping config update for {broadcaster.name}, already configured")
+    config = default_config(broadcaster)
+    logger.info("Setting config for %s to: %s", broadcaster.name, config)
+    client.set_config(broadcaster, config)
+
+
+def main() -> None:
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        description="Set the default config for every channel that has configured the extension."
+    )
+    add_job_arguments(parser, default_chunk_size=100)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of broadcasters to update at the same time",
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    failed: list[Broadcaster] = []
+    with create_app().app_context(), db.engine.connect() as conn:
+        client = ExtensionConfigClient(current_app.config, workers=args.workers)
+        checkpoint = Checkpoint(conn, "update_config", resume=args.resume)
+        last_id = int(checkpoint.cursor or 0)
+
+        while True:
+            broadcasters = (
+                Broadcaster.query.filter(Broadcaster.reward_id != "", Broadcaster.id > last_id)
+                .order_by(Broadcaster.id)
+                .limit(args.chunk_size)
+                .all()
+            )
+            if not broadcasters:
+                break
+
+            failed.extend(client.run(broadcasters, lambda b: update_config(client, b)))
+
+            last_id = broadcasters[-1].id
+            checkpoint.save(last_id)
+            conn.commit()
+
+        checkpoint.clear()
+        conn.commit()
+        client.close()
+
+    if failed:
+        logger.error(
+            "Failed to update the config for %d broadcaster(s): %s",
+            len(failed),
+            ", ".join(broadcaster.name for broadcaster in failed),
+        )
+        sys.exit(1)
 
 
 if __name__ == "__main__":
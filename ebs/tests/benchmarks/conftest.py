@@ -0,0 +1,105 @@
+"""Fixtures for the benchmarks.
+
+The benchmarks run against a file based sqlite db, and also against postgres if the
+VFIRST_BENCHMARK_POSTGRES_URI env var is set (the database is dropped and recreated). The dataset
+sizes can be reduced with VFIRST_BENCHMARK_ROWS and VFIRST_BENCHMARK_USERS, e.g. for a quick run.
+"""
+
+import os
+from datetime import datetime
+
+import pytest
+
+from scripts.generate_data import bulk_insert, generate_firsts, zipf_cum_weights
+from verifiedfirst import create_app, totals
+from verifiedfirst.database import db
+from verifiedfirst.models.broadcasters import Broadcaster
+from verifiedfirst.models.firsts import First
+from verifiedfirst.models.users import User
+
+from ..conftest import TestConfig
+
+ROWS = [
+    int(rows) for rows in os.environ.get("VFIRST_BENCHMARK_ROWS", "10000,100000,1000000").split(",")
+]
+USERS = [
+    int(users) for users in os.environ.get("VFIRST_BENCHMARK_USERS", "10,1000,50000").split(",")
+]
+DATABASES = ["sqlite"] + (["postgres"] if "VFIRST_BENCHMARK_POSTGRES_URI" in os.environ else [])
+INSERT_CHUNK_SIZE = 10000
+
+
+@pytest.fixture(name="bench_app", scope="session", params=DATABASES)
+def fixture_bench_app(request, tmp_path_factory):
+    """Create an app using one of the benchmark databases, with all users already created."""
+    if request.param == "postgres":
+        database_uri = os.environ["VFIRST_BENCHMARK_POSTGRES_URI"]
+    else:
+        database_uri = f"sqlite:///{tmp_path_factory.mktemp('benchmarks') / 'benchmarks.db'}"
+
+    class BenchmarkConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """Config using the benchmark database."""
+
+        SQLALCHEMY_DATABASE_URI = database_uri
+        LOG_LEVEL = "WARNING"
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        bulk_insert(
+            db.session.connection(),
+            User,
+            ({"id": user_id, "name": f"user{user_id}"} for user_id in range(1, max(USERS) + 1)),
+            INSERT_CHUNK_SIZE,
+        )
+        db.session.commit()
+    app.extensions["benchmark_datasets"] = {}
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture(name="dataset")
+def fixture_dataset(bench_app):
+    """Get a function that returns a broadcaster with a synthetic history of firsts.
+
+    Chatter activity follows a Zipf distribution, see scripts/generate_data.py. Each (rows, users)
+    dataset is only created once per database.
+    """
+    datasets = bench_app.extensions["benchmark_datasets"]
+
+    def dataset(rows, users):
+        if (rows, users) not in datasets:
+            broadcaster_id = len(datasets) + 1
+            db.session.add(
+                Broadcaster(
+                    id=broadcaster_id,
+                    name=f"broadcaster{broadcaster_id}",
+                    access_token="access",
+                    refresh_token="refresh",
+                )
+            )
+            bulk_insert(
+                db.session.connection(),
+                First,
+                generate_firsts(
+                    broadcaster_id,
+                    rows,
+                    range(1, users + 1),
+                    zipf_cum_weights(users),
+                    start=datetime(2021, 1, 1),
+                    end=datetime(2024, 1, 1),
+                ),
+                INSERT_CHUNK_SIZE,
+            )
+            totals.rebuild(db.session.connection(), broadcaster_id)
+            db.session.commit()
+            datasets[(rows, users)] = broadcaster_id
+
+        return db.session.get(Broadcaster, datasets[(rows, users)])
+
+    with bench_app.app_context():
+        yield dataset
@@ -0,0 +1,51 @@
+"""Benchmarks for the CPU cost and bandwidth saving of compressing /firsts responses.
+
+The compressed size and ratio of each run are saved in its extra_info.
+"""
+
+import json
+import random
+import string
+
+import pytest
+
+from scripts.generate_data import split, zipf_cum_weights
+from verifiedfirst import compress
+
+pytest.importorskip("pytest_benchmark")
+
+ENCODINGS = compress.available(["gzip", "br", "zstd"])
+LEVELS = [1, 5, 9]
+LEADERBOARD_USERS = [100, 5000, 50000]
+
+
+def leaderboard(users: int) -> bytes:
+    """Encode a leaderboard like a /firsts response, with twitch like names and Zipf counts.
+
+    :param users: number of users on the leaderboard
+    :return: the json body
+    """
+    rng = random.Random(users)
+    alphabet = string.ascii_lowercase + string.digits + "_"
+    counts = split(users * 5, zipf_cum_weights(users), rng)
+    firsts = {
+        "".join(rng.choices(alphabet, k=rng.randint(4, 25))): max(count, 1) for count in counts
+    }
+    # the same separators as flask uses outside of debug mode
+    return json.dumps(firsts, separators=(",", ":"), sort_keys=True).encode()
+
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("users", LEADERBOARD_USERS)
+def test_compress(benchmark, users, encoding, level):
+    """Benchmark compressing a leaderboard with each encoding and level."""
+    data = leaderboard(users)
+    benchmark.group = f"compress users={users} size={len(data)}"
+
+    compressed = benchmark(compress.compress, data, encoding, level)
+
+    benchmark.extra_info["size"] = len(data)
+    benchmark.extra_info["compressed_size"] = len(compressed)
+    benchmark.extra_info["ratio"] = round(len(data) / len(compressed), 2)
+    assert len(compressed) < len(data)
@@ -0,0 +1,92 @@
+"""Benchmarks for counting, adding and serializing firsts."""
+
+from datetime import datetime
+
+import pytest
+from flask import jsonify
+
+from verifiedfirst import leaderboards, twitch
+from verifiedfirst.database import db
+
+from .conftest import ROWS, USERS
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize("users", USERS)
+@pytest.mark.parametrize("rows", ROWS)
+def test_get_firsts(benchmark, dataset, rows, users):
+    """Benchmark reading the all time totals of a broadcaster."""
+    broadcaster = dataset(rows, users)
+    benchmark.group = f"get_firsts rows={rows}"
+
+    def setup():
+        # start each round with an empty identity map, like a new request
+        db.session.expunge_all()
+        return (broadcaster,), {}
+
+    firsts = benchmark.pedantic(twitch.get_firsts, setup=setup, rounds=5, warmup_rounds=1)
+
+    assert sum(firsts.values()) == rows
+
+
+@pytest.mark.parametrize("users", USERS)
+@pytest.mark.parametrize("rows", ROWS)
+def test_get_firsts_date_range(benchmark, dataset, rows, users):
+    """Benchmark counting the firsts of a broadcaster in a date range, which reads every first."""
+    broadcaster = dataset(rows, users)
+    benchmark.group = f"get_firsts date range rows={rows}"
+
+    def setup():
+        db.session.expunge_all()
+        return (broadcaster,), {"start_time": datetime(2021, 1, 1)}
+
+    firsts = benchmark.pedantic(twitch.get_firsts, setup=setup, rounds=5, warmup_rounds=1)
+
+    assert sum(firsts.values()) == rows
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_get_firsts_since(benchmark, dataset, rows):
+    """Benchmark counting the latest 100 firsts of a broadcaster, as a client refresh would."""
+    broadcaster = dataset(rows, max(USERS))
+    _, last_id = twitch.get_firsts_since(broadcaster, 0)
+    benchmark.group = "get_firsts_since"
+
+    firsts, _ = benchmark(twitch.get_firsts_since, broadcaster, last_id - 100)
+
+    assert sum(firsts.values()) == 100
+
+
+def test_add_first(benchmark, dataset):
+    """Benchmark adding a first for an existing user."""
+    broadcaster = dataset(min(ROWS), max(USERS))
+
+    first = benchmark(twitch.add_first, broadcaster.id, 1, "user1")
+
+    assert first.user_id == 1
+
+
+@pytest.mark.parametrize("users", USERS)
+def test_serialize_leaderboard(benchmark, app, users):  # pylint: disable=unused-argument
+    """Benchmark serializing a leaderboard to json."""
+    leaderboard = {f"user{user_id}": users - user_id for user_id in range(users)}
+    benchmark.group = "serialize_leaderboard"
+
+    resp = benchmark(jsonify, leaderboard)
+
+    assert resp.status_code == 200
+
+
+@pytest.mark.parametrize("users", USERS)
+def test_cached_leaderboard(benchmark, app, users):
+    """Benchmark serving a cached leaderboard, which only copies the encoded body."""
+    leaderboard = {f"user{user_id}": users - user_id for user_id in range(users)}
+    benchmark.group = "serialize_leaderboard"
+
+    with app.test_request_context():
+        cached = leaderboards.add("key", jsonify(leaderboard), 1)
+
+        resp = benchmark(cached.response)
+
+    assert resp.status_code == 200
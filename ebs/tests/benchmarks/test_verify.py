@@ -0,0 +1,29 @@
+"""Benchmarks for verifying requests."""
+
+import pytest
+from flask import request
+
+from verifiedfirst import verify
+
+from .. import defaults
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_verify_jwt(benchmark, app, generate_jwt):
+    """Benchmark verifying the JWT sent by the extension frontend."""
+    with app.test_request_context(headers={"Authorization": f"Bearer {generate_jwt()}"}):
+        channel_id, role = benchmark(verify.verify_jwt, request)
+
+    assert (channel_id, role) == (defaults.CHANNEL_ID, defaults.ROLE)
+
+
+def test_verify_eventsub_message(benchmark, app):
+    """Benchmark verifying the signature of an eventsub message."""
+    headers = {
+        "Twitch-Eventsub-Message-Id": defaults.MESSAGE_ID,
+        "Twitch-Eventsub-Message-Timestamp": defaults.MESSAGE_TIMESTAMP,
+        "Twitch-Eventsub-Message-Signature": f"sha256={defaults.MESSAGE_HMAC}",
+    }
+    with app.test_request_context(headers=headers, data=defaults.MESSAGE_DATA):
+        assert benchmark(verify.verify_eventsub_message, request)
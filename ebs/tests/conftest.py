@@ -15,6 +15,7 @@ from freezegun import freeze_time
 from verifiedfirst import create_app, Config
 from verifiedfirst.database import db
 from . import defaults
+from .fake_helix import FakeHelix
 
 
 # pylint: disable=too-few-public-methods
@@ -30,6 +31,9 @@ class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite://"
     LOG_LEVEL = "DEBUG"
+    STREAM_MAX_CLIENTS = 80
+    # don't broadcast to the real twitch api, tests of the broadcasts enable it with the fake one
+    EXTENSION_PUBSUB_INTERVAL = 0
 
 
 @pytest.fixture()
@@ -79,6 +83,33 @@ def app():
     return test_app
 
 
+@pytest.fixture(name="fake_helix")
+def fixture_fake_helix():
+    """Run a fake twitch api server for the duration of a test."""
+    helix = FakeHelix(TestConfig.EXTENSION_SECRET).start()
+    yield helix
+    helix.stop()
+
+
+@pytest.fixture()
+def helix_app(fake_helix):
+    """Create app with test config that points at the fake twitch api."""
+
+    class HelixTestConfig(TestConfig):
+        """Config using the fake twitch api."""
+
+        TWITCH_API_BASEURL = fake_helix.base_url
+        TWITCH_AUTH_URL = fake_helix.auth_url
+        # wait for every stale eventsub to be deleted so tests can check they were
+        EVENTSUB_DELETE_TIMEOUT = 30
+
+    test_app = create_app(HelixTestConfig)
+    with test_app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield test_app
+
+
 @pytest.fixture(name="init_db")
 def fixture_init_db():
     """Initialise the in memory sqllite db used for testing."""
@@ -0,0 +1,296 @@
+"""A local fake of the parts of the Twitch Helix and OAuth APIs used by the app."""
+
+import base64
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import jwt
+
+EVENTSUB_TYPE = "channel.channel_points_custom_reward_redemption.add"
+
+
+class FakeHelix:  # pylint: disable=too-many-instance-attributes
+    """In-memory fake Twitch API served over http on a random local port.
+
+    Tokens are only accepted once they have been issued by the fake oauth endpoint or added with
+    ``add_broadcaster``, so token refresh flows can be exercised end to end. Extensions API requests
+    must be signed with ``extension_secret`` instead. Setting ``latency``
+    (seconds) or ``error_rate`` (fraction of requests that fail with a 503) simulates a slow or
+    unreliable api, e.g. for load testing.
+    """
+
+    def __init__(self, extension_secret: str = "") -> None:
+        self.extension_secret = extension_secret
+        self.lock = threading.Lock()
+        self.users: dict[int, str] = {}
+        self.rewards: dict[int, list[dict[str, Any]]] = {}
+        self.eventsubs: dict[str, dict[str, Any]] = {}
+        self.app_tokens: set[str] = set()
+        self.broadcaster_tokens: dict[str, int] = {}
+        self.refresh_tokens: dict[str, int] = {}
+        self.requests: list[tuple[str, str, dict[str, list[str]]]] = []
+        self.pubsub_messages: list[dict[str, Any]] = []
+        self.page_size = 100
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self._counter = itertools.count()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.helix = self  # type: ignore[attr-defined]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        """Base url of the fake server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        """Url to use as TWITCH_API_BASEURL."""
+        return f"{self.url}/helix"
+
+    @property
+    def auth_url(self) -> str:
+        """Url to use as TWITCH_AUTH_URL."""
+        return f"{self.url}/oauth2/token"
+
+    def start(self) -> "FakeHelix":
+        """Start serving requests in a background thread."""
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def new_token(self, prefix: str) -> str:
+        """Generate a unique token."""
+        return f"{prefix}{next(self._counter)}"
+
+    def add_user(self, user_id: int, login: str) -> None:
+        """Add a user that can be looked up via /users."""
+        self.users[user_id] = login
+
+    def add_broadcaster(self, broadcaster_id: int, login: str, access_token: str) -> str:
+        """Add a broadcaster with a valid access token.
+
+        :return: refresh token for the broadcaster
+        """
+        self.add_user(broadcaster_id, login)
+        self.broadcaster_tokens[access_token] = broadcaster_id
+        refresh_token = self.new_token("refresh")
+        self.refresh_tokens[refresh_token] = broadcaster_id
+        return refresh_token
+
+    def add_eventsub(
+        self,
+        broadcaster_id: int,
+        reward_id: str,
+        status: str = "enabled",
+        callback: str = "https://verifiedfirst.jaedolph.net/eventsub",
+    ) -> dict[str, Any]:
+        """Add an existing eventsub subscription."""
+        eventsub: dict[str, Any] = {
+            "id": str(uuid.uuid4()),
+            "status": status,
+            "type": EVENTSUB_TYPE,
+            "version": "1",
+            "condition": {"broadcaster_user_id": str(broadcaster_id), "reward_id": reward_id},
+            "created_at": "2023-09-22T12:13:50.019162515Z",
+            "transport": {"method": "webhook", "callback": callback},
+            "cost": 0,
+        }
+        self.eventsubs[eventsub["id"]] = eventsub
+        return eventsub
+
+    def count(self, method: str, path: str) -> int:
+        """Count the requests received for a method and path."""
+        return sum(1 for req in self.requests if req[:2] == (method, path))
+
+
+# pylint: disable=invalid-name
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler for the fake api."""
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        """Silence access logs."""
+
+    @property
+    def helix(self) -> FakeHelix:
+        """The FakeHelix instance serving the request."""
+        return self.server.helix  # type: ignore[attr-defined,no-any-return]
+
+    def _respond(self, status: int, body: Any = None) -> None:
+        data = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method: str) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if self.helix.latency:
+            time.sleep(self.helix.latency)
+        if self.helix.error_rate and random.random() < self.helix.error_rate:
+            self._respond(503, {"error": "Service Unavailable"})
+            return
+        with self.helix.lock:
+            self.helix.requests.append((method, url.path, query))
+            if url.path == "/oauth2/token":
+                self._oauth(query)
+                return
+
+            token = (self.headers.get("Authorization") or "").removeprefix("Bearer ")
+            if url.path.startswith("/helix/extensions/"):
+                self._extensions(url.path, token, body)
+                return
+            if token not in self.helix.app_tokens and token not in self.helix.broadcaster_tokens:
+                self._respond(401, {"error": "Unauthorized", "message": "Invalid OAuth token"})
+                return
+
+            route = getattr(self, f"_{method.lower()}{url.path.replace('/', '_')}", None)
+            if route is None:
+                self._respond(404, {"error": "Not Found"})
+                return
+            route(token, query, body)
+
+    def do_GET(self) -> None:
+        """Handle GET requests."""
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        """Handle POST requests."""
+        self._handle("POST")
+
+    def do_DELETE(self) -> None:
+        """Handle DELETE requests."""
+        self._handle("DELETE")
+
+    def _oauth(self, query: dict[str, list[str]]) -> None:
+        grant_type = query.get("grant_type", [""])[0]
+        if grant_type == "client_credentials":
+            token = self.helix.new_token("app")
+            self.helix.app_tokens.add(token)
+            self._respond(200, {"access_token": token, "expires_in": 5000000})
+        elif grant_type == "refresh_token":
+            broadcaster_id = self.helix.refresh_tokens.pop(query["refresh_token"][0], None)
+            if broadcaster_id is None:
+                self._respond(400, {"status": 400, "message": "Invalid refresh token"})
+                return
+            access_token = self.helix.new_token("access")
+            refresh_token = self.helix.new_token("refresh")
+            self.helix.broadcaster_tokens[access_token] = broadcaster_id
+            self.helix.refresh_tokens[refresh_token] = broadcaster_id
+            self._respond(200, {"access_token": access_token, "refresh_token": refresh_token})
+        else:
+            self._respond(400, {"status": 400, "message": "Invalid grant type"})
+
+    def _extensions(self, path: str, token: str, body: Any) -> None:
+        try:
+            claims = jwt.decode(
+                token, key=base64.b64decode(self.helix.extension_secret), algorithms=["HS256"]
+            )
+        except jwt.PyJWTError:
+            self._respond(401, {"error": "Unauthorized", "message": "Invalid JWT"})
+            return
+        if path != "/helix/extensions/pubsub":
+            self._respond(404, {"error": "Not Found"})
+            return
+        if (
+            claims.get("role") != "external"
+            or claims.get("channel_id") != body["broadcaster_id"]
+            or "broadcast" not in claims.get("pubsub_perms", {}).get("send", [])
+        ):
+            self._respond(403, {"error": "Forbidden", "message": "JWT can't send to channel"})
+            return
+        self.helix.pubsub_messages.append(body)
+        self._respond(204)
+
+    def _get_helix_users(self, token: str, query: dict[str, list[str]], _body: Any) -> None:
+        if "login" in query or "id" in query:
+            logins = set(query.get("login", []))
+            ids = {int(user_id) for user_id in query.get("id", [])}
+            users = [
+                (user_id, login)
+                for user_id, login in self.helix.users.items()
+                if login in logins or user_id in ids
+            ]
+        else:
+            user_id = self.helix.broadcaster_tokens[token]
+            users = [(user_id, self.helix.users[user_id])]
+        self._respond(
+            200,
+            {
+                "data": [
+                    {"id": str(user_id), "login": login, "display_name": login}
+                    for user_id, login in users
+                ]
+            },
+        )
+
+    def _get_helix_channel_points_custom_rewards(
+        self, _token: str, query: dict[str, list[str]], _body: Any
+    ) -> None:
+        broadcaster_id = int(query["broadcaster_id"][0])
+        self._respond(200, {"data": self.helix.rewards.get(broadcaster_id, [])})
+
+    def _get_helix_eventsub_subscriptions(
+        self, _token: str, query: dict[str, list[str]], _body: Any
+    ) -> None:
+        filters = [key for key in ("status", "type", "user_id") if key in query]
+        if len(filters) > 1:
+            self._respond(400, {"error": "Bad Request", "message": "only one filter allowed"})
+            return
+        eventsubs = list(self.helix.eventsubs.values())
+        if "user_id" in query:
+            user_id = query["user_id"][0]
+            eventsubs = [e for e in eventsubs if e["condition"]["broadcaster_user_id"] == user_id]
+        for key in ("status", "type"):
+            if key in query:
+                eventsubs = [e for e in eventsubs if e[key] == query[key][0]]
+
+        start = int(query.get("after", ["0"])[0])
+        end = start + self.helix.page_size
+        pagination = {"cursor": str(end)} if end < len(eventsubs) else {}
+        self._respond(
+            200,
+            {"total": len(eventsubs), "data": eventsubs[start:end], "pagination": pagination},
+        )
+
+    def _post_helix_eventsub_subscriptions(
+        self, _token: str, _query: dict[str, list[str]], body: Any
+    ) -> None:
+        for eventsub in self.helix.eventsubs.values():
+            if eventsub["type"] == body["type"] and eventsub["condition"] == body["condition"]:
+                self._respond(409, {"error": "Conflict", "message": "subscription already exists"})
+                return
+        condition = body["condition"]
+        eventsub = self.helix.add_eventsub(
+            int(condition["broadcaster_user_id"]),
+            condition["reward_id"],
+            status="webhook_callback_verification_pending",
+            callback=body["transport"]["callback"],
+        )
+        self._respond(202, {"data": [eventsub], "total": len(self.helix.eventsubs)})
+
+    def _delete_helix_eventsub_subscriptions(
+        self, _token: str, query: dict[str, list[str]], _body: Any
+    ) -> None:
+        if self.helix.eventsubs.pop(query["id"][0], None) is None:
+            self._respond(404, {"error": "Not Found"})
+            return
+        self._respond(204)
@@ -0,0 +1,49 @@
+"""Tests for in-process caches."""
+
+from verifiedfirst.cache import TTLCache
+
+
+def test_ttl_cache(mocker):
+    """Test values can be stored, expire and be removed."""
+    mock_monotonic = mocker.patch("time.monotonic")
+    mock_monotonic.return_value = 100.0
+    cache = TTLCache(ttl=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    assert cache.get("c") is None
+
+    cache.delete("b")
+    cache.delete("b")
+    assert cache.get("b") is None
+
+    mock_monotonic.return_value = 110.0
+    assert cache.get("a") is None
+
+    cache.set("a", 1)
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_maxsize():
+    """Test the oldest entries are evicted once the cache is full."""
+    cache = TTLCache(ttl=10, maxsize=2)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 3)
+    cache.set("c", 4)
+
+    assert cache.get("a") == 3
+    assert cache.get("b") is None
+    assert cache.get("c") == 4
+
+
+def test_ttl_cache_disabled():
+    """Test nothing is cached if the ttl is 0."""
+    cache = TTLCache(ttl=0)
+
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
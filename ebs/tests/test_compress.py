@@ -0,0 +1,108 @@
+"""Tests for response compression."""
+
+import gzip
+
+import brotli  # type: ignore[import-untyped]
+import pytest
+from flask import Response, jsonify
+
+from verifiedfirst import compress, create_app
+
+from .conftest import TestConfig
+
+BODY = {f"user{i}": i for i in range(100)}
+
+
+@pytest.fixture(name="fake_zstd")
+def fixture_fake_zstd(mocker):
+    """Make zstd available, it is only in the standard library from python 3.14."""
+    fake_zstd = mocker.Mock()
+    fake_zstd.compress.side_effect = lambda data, level: b"zstd" + gzip.compress(data, level)
+    mocker.patch("verifiedfirst.compress.zstd", fake_zstd)
+    return fake_zstd
+
+
+def test_compress_response(app, fake_zstd):
+    """Test large bodies are compressed with the best encoding the client accepts."""
+    del fake_zstd
+    app.extensions["compress_encodings"] = ["zstd", "br", "gzip"]
+    for accept_encoding, encoding, decompress in (
+        ("gzip, deflate, br, zstd", "zstd", lambda data: gzip.decompress(data[4:])),
+        ("gzip, deflate, br", "br", brotli.decompress),
+        ("gzip", "gzip", gzip.decompress),
+    ):
+        with app.test_request_context(headers={"Accept-Encoding": accept_encoding}):
+            resp = jsonify(BODY)
+            data = resp.get_data()
+
+            resp = compress.compress_response(resp)
+
+            assert resp.content_encoding == encoding
+            assert resp.content_length < len(data)
+            assert decompress(resp.get_data()) == data
+            assert "Accept-Encoding" in resp.vary
+
+
+def test_compress_response_skipped(app):
+    """Test bodies are left uncompressed if too small or not accepted by the client."""
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        resp = compress.compress_response(jsonify({"user1": 1}))
+        assert resp.content_encoding is None
+        assert "Accept-Encoding" in resp.vary
+
+    for headers in ({}, {"Accept-Encoding": "identity"}):
+        with app.test_request_context(headers=headers):
+            resp = compress.compress_response(jsonify(BODY))
+            assert resp.content_encoding is None
+
+
+def test_compressible():
+    """Test only complete json, msgpack and text bodies with no encoding are compressed."""
+    assert compress.compressible(Response("{}", mimetype="application/json"))
+    assert compress.compressible(Response("{}", mimetype="application/vnd.verifiedfirst+json"))
+    assert compress.compressible(Response("text", mimetype="text/html"))
+    assert compress.compressible(Response(b"data", mimetype="application/msgpack"))
+    assert not compress.compressible(Response(b"data", mimetype="image/png"))
+    assert not compress.compressible(Response(iter([b"data"]), mimetype="text/event-stream"))
+    assert not compress.compressible(Response("text", status=304, mimetype="text/html"))
+    assert not compress.compressible(Response("text", status=101, mimetype="text/html"))
+
+    resp = Response("text", mimetype="text/html")
+    resp.content_encoding = "gzip"
+    assert not compress.compressible(resp)
+
+    resp = Response("text", mimetype="text/html")
+    resp.cache_control.no_transform = True
+    assert not compress.compressible(resp)
+
+
+def test_available(mocker):
+    """Test only installed encodings are used, in the configured order."""
+    mocker.patch("verifiedfirst.compress.zstd", None)
+    assert compress.available(["zstd", "br", "gzip", "deflate"]) == ["br", "gzip"]
+
+    mocker.patch("verifiedfirst.compress.brotli", None)
+    assert compress.available(["zstd", "br", "gzip"]) == ["gzip"]
+    assert not compress.available(["identity"])
+
+
+def test_import_optional():
+    """Test modules that aren't installed are None."""
+    assert compress.import_optional("gzip") is gzip
+    assert compress.import_optional("verifiedfirst.not_installed") is None
+
+
+def test_init_app(client):
+    """Test responses are compressed, unless compression is disabled."""
+
+    class IdentityConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """Config with compression disabled."""
+
+        COMPRESS_ENCODINGS = ["identity"]
+
+    app = create_app(IdentityConfig)
+    assert not app.extensions["compress_encodings"]
+    assert compress.compress_response not in app.after_request_funcs.get(None, [])
+
+    assert client.application.extensions["compress_encodings"][-1] == "gzip"
+    assert compress.compress_response in client.application.after_request_funcs[None]
@@ -57,6 +57,18 @@ def test_validate_config_errors(testconfig):
     with pytest.raises(ValueError, match=r"Missing env var VFIRST_SQLALCHEMY_DATABASE_URI"):
         validate_config(TestConfig7)
 
+    class TestConfig8(testconfig):
+        LOG_FORMAT = "xml"
+
+    with pytest.raises(ValueError, match=r"VFIRST_LOG_FORMAT must be 'text' or 'json'"):
+        validate_config(TestConfig8)
+
+    class TestConfig9(testconfig):
+        COMPRESS_LEVEL = 10
+
+    with pytest.raises(ValueError, match=r"VFIRST_COMPRESS_LEVEL must be between 1 and 9"):
+        validate_config(TestConfig9)
+
 
 # pylint: disable=missing-class-docstring,too-few-public-methods
 def test_create_app_config_errors(testconfig, caplog):
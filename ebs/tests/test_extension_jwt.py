@@ -0,0 +1,75 @@
+"""Tests for extension JWT signing."""
+
+import base64
+
+import jwt
+
+from verifiedfirst import extension_jwt
+from verifiedfirst.extension_jwt import ExtensionJWTSigner
+
+from .conftest import TestConfig
+
+
+def decode(token):
+    """Decode a token signed with the test extension secret."""
+    return jwt.decode(
+        token,
+        key=base64.b64decode(TestConfig.EXTENSION_SECRET),
+        algorithms=["HS256"],
+        options={"verify_exp": False},
+    )
+
+
+def test_sign(mocker):
+    """Test tokens are reused per user and role until shortly before they expire."""
+    mock_time = mocker.patch("time.time")
+    mock_monotonic = mocker.patch("time.monotonic")
+    mock_time.return_value = mock_monotonic.return_value = 1000
+    signer = ExtensionJWTSigner(TestConfig.EXTENSION_SECRET, expiry=60, refresh_margin=10)
+
+    token = signer.sign(1234)
+
+    assert decode(token) == {"exp": 1060, "user_id": "1234", "role": "external"}
+    assert signer.sign("1234") == token
+    assert decode(signer.sign(1234, role="broadcaster"))["role"] == "broadcaster"
+    assert decode(signer.sign(5678))["user_id"] == "5678"
+
+    mock_time.return_value = mock_monotonic.return_value = 1049
+    assert signer.sign(1234) == token
+
+    mock_time.return_value = mock_monotonic.return_value = 1050
+    new_token = signer.sign(1234)
+    assert new_token != token
+    assert decode(new_token)["exp"] == 1110
+
+
+def test_sign_pubsub():
+    """Test tokens for sending extension pubsub messages to a channel."""
+    signer = ExtensionJWTSigner(TestConfig.EXTENSION_SECRET)
+
+    token = signer.sign(1234, channel_id=1234)
+
+    claims = decode(token)
+    assert claims["channel_id"] == "1234"
+    assert claims["pubsub_perms"] == {"send": ["broadcast"]}
+    assert signer.sign(1234) != token
+    assert "channel_id" not in decode(signer.sign(1234))
+
+
+def test_headers():
+    """Test headers for the Extensions API are generated."""
+    signer = ExtensionJWTSigner(TestConfig.EXTENSION_SECRET)
+
+    headers = signer.headers(TestConfig.CLIENT_ID, 1234, role="broadcaster")
+
+    assert headers["Client-Id"] == TestConfig.CLIENT_ID
+    assert headers["Authorization"] == f"Bearer {signer.sign(1234, role='broadcaster')}"
+
+
+def test_get_signer(app):
+    """Test the app has a signer using its extension secret."""
+    with app.app_context():
+        signer = extension_jwt.get_signer()
+
+    assert signer is app.extensions["extension_jwt"]
+    assert signer.secret == base64.b64decode(TestConfig.EXTENSION_SECRET)
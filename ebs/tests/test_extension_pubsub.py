@@ -0,0 +1,177 @@
+"""Tests for broadcasting leaderboard deltas with extension pubsub."""
+
+import json
+import time
+
+import pytest
+from requests import ConnectionError as RequestsConnectionError
+
+from verifiedfirst import totals, twitch
+from verifiedfirst.extension_pubsub import MAX_DELTAS_PER_MESSAGE, ExtensionPubSub
+
+from . import defaults
+
+
+@pytest.fixture(name="extension_pubsub")
+def fixture_extension_pubsub(app, mocker):
+    """Create an extension pubsub sender that doesn't start a background thread."""
+    mocker.patch("verifiedfirst.extension_pubsub.threading.Thread")
+    extension_pubsub = ExtensionPubSub(app.config, app.extensions["extension_jwt"], app.logger)
+    extension_pubsub.interval = 1
+    return extension_pubsub
+
+
+def wait_for_messages(fake_helix, count):
+    """Wait for the fake twitch api to receive a number of pubsub messages."""
+    deadline = time.monotonic() + 5
+    while len(fake_helix.pubsub_messages) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    return [json.loads(message["message"]) for message in fake_helix.pubsub_messages]
+
+
+def test_add_first_pubsub(helix_app, fake_helix):
+    """Test deltas are broadcast to the channel when firsts are added."""
+    extension_pubsub = helix_app.extensions["extension_pubsub"]
+    extension_pubsub.interval = 0.5
+
+    # the first delta is sent straight away
+    twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+    messages = wait_for_messages(fake_helix, 1)
+    assert messages == [{"firsts": [{"name": "user1", "count": 1, "added": 1, "id": 1}]}]
+    assert fake_helix.pubsub_messages[0]["broadcaster_id"] == str(defaults.BROADCASTER_ID)
+    assert fake_helix.pubsub_messages[0]["target"] == ["broadcast"]
+
+    # deltas added within the interval are coalesced into one message
+    twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+    twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+    twitch.add_first(defaults.BROADCASTER_ID, 1002, "user2")
+    messages = wait_for_messages(fake_helix, 2)
+    assert len(messages) == 2
+    assert messages[1]["firsts"] == [
+        {"name": "user1", "count": 3, "added": 2, "id": 3},
+        {"name": "user2", "count": 1, "added": 1, "id": 4},
+    ]
+
+    # the thread waits for more deltas once there are none pending
+    twitch.add_first(defaults.BROADCASTER_ID, 1002, "user2")
+    messages = wait_for_messages(fake_helix, 3)
+    assert messages[2]["firsts"] == [{"name": "user2", "count": 2, "added": 1, "id": 5}]
+
+
+def test_add_first_pubsub_disabled(helix_app, fake_helix, mocker):
+    """Test deltas aren't counted or sent if extension pubsub is disabled."""
+    extension_pubsub = helix_app.extensions["extension_pubsub"]
+    extension_pubsub.interval = 0
+    mock_add = mocker.patch.object(extension_pubsub, "add")
+    mock_count = mocker.patch("verifiedfirst.twitch.count_user_firsts")
+
+    twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+
+    mock_add.assert_not_called()
+    mock_count.assert_not_called()
+    assert not fake_helix.pubsub_messages
+
+
+def test_run_unexpected_error(helix_app, fake_helix, mocker):
+    """Test the sender thread keeps running after an unexpected error."""
+    extension_pubsub = helix_app.extensions["extension_pubsub"]
+    extension_pubsub.interval = 0.01
+    send = extension_pubsub.send
+    mock_send = mocker.patch.object(
+        extension_pubsub, "send", side_effect=[RuntimeError("test exception"), None]
+    )
+    mock_exception = mocker.patch.object(extension_pubsub.logger, "exception")
+
+    extension_pubsub.add(defaults.BROADCASTER_ID, "user1", 1, 1)
+    deadline = time.monotonic() + 5
+    while not mock_exception.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+    mock_send.side_effect = send
+    extension_pubsub.add(defaults.BROADCASTER_ID, "user2", 1, 2)
+
+    messages = wait_for_messages(fake_helix, 1)
+    assert messages == [{"firsts": [{"name": "user2", "count": 1, "added": 1, "id": 2}]}]
+    mock_exception.assert_called_once_with("could not send pubsub messages")
+
+
+def test_count_user_firsts(app, init_db):
+    """Test a user's firsts are counted including legacy firsts recorded by name."""
+    database = init_db(app)
+    twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+    twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+    twitch.add_first(defaults.BROADCASTER_ID + 1, 1001, "user1")
+    database.session.add(twitch.First(broadcaster_id=defaults.BROADCASTER_ID, name="user1"))
+    database.session.flush()
+    totals.rebuild(database.session.connection(), defaults.BROADCASTER_ID)
+    database.session.commit()
+
+    assert twitch.count_user_firsts(defaults.BROADCASTER_ID, 1001, "user1") == 3
+    assert twitch.count_user_firsts(defaults.BROADCASTER_ID, 1002, "user2") == 0
+
+
+def test_flush(extension_pubsub, mocker):
+    """Test deltas are coalesced and sent at most once per interval for each channel."""
+    mock_monotonic = mocker.patch("verifiedfirst.extension_pubsub.time.monotonic")
+    mock_monotonic.return_value = 100.0
+    mock_send = mocker.patch.object(extension_pubsub, "send")
+    names = [f"user{i}" for i in range(MAX_DELTAS_PER_MESSAGE + 1)]
+
+    assert extension_pubsub.flush() is None
+
+    for i, name in enumerate(names):
+        extension_pubsub.add(1, name, 1, i)
+    extension_pubsub.add(2, "user1", 5, 100)
+    assert extension_pubsub.flush() == 1.0
+    assert [call.args[0] for call in mock_send.call_args_list] == [1, 2]
+    assert len(mock_send.call_args_list[0].args[1]) == MAX_DELTAS_PER_MESSAGE
+
+    # the rest are sent once the interval has passed
+    mock_send.reset_mock()
+    extension_pubsub.add(2, "user1", 6, 101)
+    mock_monotonic.return_value = 100.5
+    assert extension_pubsub.flush() == 0.5
+    mock_send.assert_not_called()
+
+    mock_monotonic.return_value = 101.0
+    assert extension_pubsub.flush() is None
+    mock_send.assert_any_call(1, [{"name": names[-1], "count": 1, "added": 1, "id": 50}])
+    mock_send.assert_any_call(2, [{"name": "user1", "count": 6, "added": 1, "id": 101}])
+
+    # send times are forgotten once they have passed
+    assert extension_pubsub._next_send  # pylint: disable=protected-access
+    mock_monotonic.return_value = 102.0
+    assert extension_pubsub.flush() is None
+    assert not extension_pubsub._next_send  # pylint: disable=protected-access
+
+
+def test_send_errors(extension_pubsub, requests_mock, mocker):
+    """Test failed messages are logged and rate limited messages are queued again."""
+    mock_time = mocker.patch("verifiedfirst.extension_pubsub.time.time")
+    mock_time.return_value = 1000.0
+    mocker.patch("verifiedfirst.extension_pubsub.time.monotonic").return_value = 100.0
+    mock_warning = mocker.patch.object(extension_pubsub.logger, "warning")
+    delta = {"name": "user1", "count": 1, "added": 1, "id": 1}
+
+    requests_mock.post(extension_pubsub.url, exc=RequestsConnectionError("failed"))
+    extension_pubsub.send(1, [delta])
+    assert "could not send pubsub message" in mock_warning.call_args.args[0]
+
+    requests_mock.post(extension_pubsub.url, status_code=400, text="bad request")
+    extension_pubsub.send(1, [delta])
+    assert mock_warning.call_args.args[-1] == "bad request"
+
+    requests_mock.post(extension_pubsub.url, status_code=429, headers={"Ratelimit-Reset": "1005"})
+    extension_pubsub.add(1, "user1", 2, 2)
+    extension_pubsub.send(1, [delta, {"name": "user2", "count": 1, "added": 1, "id": 3}])
+    assert "rate limited" in mock_warning.call_args.args[0]
+    assert extension_pubsub.flush() == 5.0
+    # pylint: disable=protected-access
+    assert extension_pubsub._pending[1] == {
+        "user1": {"name": "user1", "count": 2, "added": 2, "id": 2},
+        "user2": {"name": "user2", "count": 1, "added": 1, "id": 3},
+    }
+
+    requests_mock.post(extension_pubsub.url, status_code=429)
+    extension_pubsub.send(2, [delta])
+    assert extension_pubsub._next_send[2] == 100.0 + extension_pubsub.interval
@@ -0,0 +1,53 @@
+"""Tests for the cache of encoded leaderboards."""
+
+import gzip
+
+from flask import jsonify
+
+from verifiedfirst import compress, leaderboards
+
+BODY = {f"user{i}": i for i in range(100)}
+
+
+def test_get_and_add(app):
+    """Test leaderboards are only returned for the version they were cached for."""
+    with app.test_request_context():
+        leaderboard = leaderboards.add("key", jsonify(BODY), 5)
+
+        assert leaderboards.get("key", 5) is leaderboard
+        assert leaderboards.get("key", 6) is None
+        assert leaderboards.get("other", 5) is None
+        assert leaderboard.mimetype == "application/json"
+        assert leaderboard.body == jsonify(BODY).get_data()
+
+
+def test_response_compressed(app, mocker):
+    """Test compressed variants are created once and have their own ETag."""
+    mock_compress = mocker.patch.object(compress, "compress", wraps=compress.compress)
+    app.extensions["compress_encodings"] = ["gzip"]
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        leaderboard = leaderboards.add("key", jsonify(BODY), 1)
+
+        for _ in range(2):
+            resp = leaderboard.response()
+            assert resp.content_encoding == "gzip"
+            assert gzip.decompress(resp.get_data()) == leaderboard.body
+            assert resp.get_etag() == (f"{leaderboard.etag}-gzip", False)
+            assert {"Accept", "Accept-Encoding"} <= set(resp.vary)
+        assert mock_compress.call_count == 1
+
+    with app.test_request_context():
+        resp = leaderboard.response()
+        assert resp.content_encoding is None
+        assert resp.get_data() == leaderboard.body
+        assert resp.get_etag() == (leaderboard.etag, False)
+
+
+def test_cache_disabled(app):
+    """Test nothing is cached if the ttl is 0."""
+    app.extensions["leaderboard_cache"].ttl = 0
+    with app.test_request_context():
+        leaderboard = leaderboards.add("key", jsonify(BODY), 1)
+
+        assert leaderboards.get("key", 1) is None
+        assert leaderboard.response().status_code == 200
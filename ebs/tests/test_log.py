@@ -0,0 +1,165 @@
+"""Tests for logging configuration."""
+
+import asyncio
+import io
+import json
+import logging
+import sys
+
+import pytest
+
+from verifiedfirst import log, twitch
+from verifiedfirst.twitch_async import AsyncTwitchClient
+
+from . import defaults
+
+
+@pytest.fixture(name="capture_log")
+def fixture_capture_log():
+    """Get a function that returns the lines written by the log handler."""
+    output = io.StringIO()
+    stream = log.handler.setStream(output)
+    yield lambda: output.getvalue().splitlines()
+    log.handler.setStream(stream)
+    log.configure()
+
+
+def make_record(msg, *args, level=logging.INFO, **extra):
+    """Create a log record."""
+    record = logging.LogRecord("verifiedfirst", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.mark.parametrize(
+    "message,expected",
+    [
+        ("Authorization: Bearer abc123", "Authorization: Bearer [REDACTED]"),
+        ("{'Authorization': 'Bearer abc123'}", "{'Authorization': 'Bearer [REDACTED]'}"),
+        ("jwt eyJhbGci.eyJleHAi.c2lnbmF0", "jwt [REDACTED]"),
+        (
+            "/token?refresh_token=abc&grant_type=refresh_token",
+            "/token?refresh_token=[REDACTED]&grant_type=refresh_token",
+        ),
+        (
+            "auth: {'access_token': 'abc', 'expires_in': 1}",
+            "auth: {'access_token': '[REDACTED]', 'expires_in': 1}",
+        ),
+        ('{"client_secret": "abc"}', '{"client_secret": "[REDACTED]"}'),
+        ("retrying with new auth token: abc", "retrying with new auth token: [REDACTED]"),
+        ("code=abc", "code=[REDACTED]"),
+        ("/auth?code=abc&scope=x", "/auth?code=[REDACTED]&scope=x"),
+        ("{'code': 'abc'}", "{'code': '[REDACTED]'}"),
+        ('{"code":"abc"}', '{"code":"[REDACTED]"}'),
+        ("status code: 500", "status code: 500"),
+        ("exit code=1", "exit code=1"),
+        ("status_code=401 user_id=123", "status_code=401 user_id=123"),
+    ],
+)
+def test_redact(message, expected):
+    """Test tokens and secrets are redacted."""
+    assert log.redact(message) == expected
+
+
+def test_json_formatter():
+    """Test log records are formatted as redacted json."""
+    formatter = log.JSONFormatter()
+
+    entry = json.loads(formatter.format(make_record("got token=%s", "abc", request_id="1234")))
+
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "verifiedfirst"
+    assert entry["request_id"] == "1234"
+    assert entry["message"] == "got token=[REDACTED]"
+    assert "exception" not in entry
+
+    try:
+        raise ValueError("bad secret=abc")
+    except ValueError:
+        record = make_record("failed", level=logging.ERROR)
+        record.exc_info = sys.exc_info()
+
+    entry = json.loads(formatter.format(record))
+    assert entry["request_id"] is None
+    assert "ValueError: bad secret=[REDACTED]" in entry["exception"]
+
+
+def test_sampling_filter(mocker):
+    """Test only the sampled fraction of INFO messages logged with extra=SAMPLED are kept."""
+    sampler = log.SamplingFilter(0.1)
+    mocker.patch("verifiedfirst.log.random.random").side_effect = [0.05, 0.5]
+
+    assert sampler.filter(make_record("test", **log.SAMPLED))
+    assert not sampler.filter(make_record("test", **log.SAMPLED))
+    assert sampler.filter(make_record("test"))
+    assert sampler.filter(make_record("test", level=logging.WARNING, **log.SAMPLED))
+
+
+def test_request_id(app, client, capture_log):
+    """Test each request is assigned an id that is logged and returned to the client."""
+    log.configure("json")
+    app.logger.info("outside of a request")
+
+    resp = client.get("/metrics")
+    assert len(resp.headers["X-Request-Id"]) == 32
+
+    resp = client.get("/metrics", headers={"X-Request-Id": "abc-123"})
+    assert resp.headers["X-Request-Id"] == "abc-123"
+
+    resp = client.get("/metrics", headers={"X-Request-Id": "abc 123!"})
+    assert len(resp.headers["X-Request-Id"]) == 32
+
+    with app.test_request_context():
+        log.start_request()
+        app.logger.info("inside a request")
+
+    entries = [json.loads(line) for line in capture_log()]
+    assert [(entry["message"], entry["request_id"]) for entry in entries[:2]] == [
+        ("outside of a request", "-"),
+        ("inside a request", entries[1]["request_id"]),
+    ]
+    assert entries[1]["request_id"]
+
+
+def test_text_format(app, capture_log):
+    """Test the text format includes the request id and redacts secrets."""
+    log.configure("text")
+
+    with app.test_request_context(headers={"X-Request-Id": "abc-123"}):
+        log.start_request()
+        app.logger.info("got token=%s", "abc")
+    app.logger.info("done")
+
+    lines = capture_log()
+    assert lines[0].endswith("INFO verifiedfirst MainThread [abc-123] : got token=[REDACTED]")
+    assert lines[1].endswith("INFO verifiedfirst MainThread [-] : done")
+
+
+def test_request_id_twitch(app, requests_mock):
+    """Test the request id is sent with requests to the twitch api."""
+    url = f"{app.config['TWITCH_API_BASEURL']}/users"
+    mock_users = requests_mock.get(url, json={"data": []})
+
+    with app.test_request_context(headers={"X-Request-Id": "abc-123"}):
+        log.start_request()
+        twitch.request_twitch_api("token", twitch.Request(method="GET", url=url))
+
+    assert mock_users.last_request.headers["X-Request-Id"] == "abc-123"
+
+
+def test_request_id_twitch_async(helix_app, fake_helix, mocker):
+    """Test the request id is sent with requests from the async twitch client."""
+    fake_helix.add_user(defaults.BROADCASTER_ID, defaults.BROADCASTER_NAME)
+    send = mocker.spy(AsyncTwitchClient, "_send")
+
+    async def main():
+        async with AsyncTwitchClient(helix_app.config) as client:
+            await client.get_users_by_login([defaults.BROADCASTER_NAME])
+
+    with helix_app.test_request_context(headers={"X-Request-Id": "abc-123"}):
+        log.start_request()
+        asyncio.run(main())
+
+    api_calls = [call for call in send.call_args_list if "headers" in call.kwargs]
+    assert api_calls
+    assert all(call.kwargs["headers"]["X-Request-Id"] == "abc-123" for call in api_calls)
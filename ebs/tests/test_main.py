@@ -1,8 +1,11 @@
 """Tests for main routes."""
 
+import gzip
+import json
 from datetime import datetime
 
-from flask import url_for
+import msgpack  # type: ignore[import-untyped]
+from flask import jsonify, url_for
 from requests import RequestException
 
 from . import defaults
@@ -20,6 +23,7 @@ def test_firsts(client, mocker):
     mock_get_broadcaster = mocker.patch("verifiedfirst.twitch.get_broadcaster")
     mock_broadcaster = mocker.Mock()
     mock_get_broadcaster.return_value = mock_broadcaster
+    mocker.patch("verifiedfirst.twitch.get_last_first_id").return_value = 1
     mock_get_firsts = mocker.patch("verifiedfirst.twitch.get_firsts")
     mock_get_firsts.return_value = firsts
 
@@ -81,6 +85,7 @@ def test_firsts_no_firsts(client, mocker):
     mock_get_broadcaster = mocker.patch("verifiedfirst.twitch.get_broadcaster")
     mock_broadcaster = mocker.Mock()
     mock_get_broadcaster.return_value = mock_broadcaster
+    mocker.patch("verifiedfirst.twitch.get_last_first_id").return_value = 1
     mock_get_firsts = mocker.patch("verifiedfirst.twitch.get_firsts")
     mock_get_firsts.return_value = {}
 
@@ -92,6 +97,188 @@ def test_firsts_no_firsts(client, mocker):
     assert resp.json == {"error": "could not get firsts"}
 
 
+def test_firsts_formats(client, mocker):
+    """Test /firsts is encoded in the format requested with the Accept header."""
+    firsts = {"user1": 5, "user2": 3}
+    mocker.patch("verifiedfirst.verify.verify_jwt").return_value = (defaults.CHANNEL_ID, "viewer")
+    mocker.patch("verifiedfirst.twitch.get_broadcaster")
+    mocker.patch("verifiedfirst.twitch.get_last_first_id").return_value = 1
+    mocker.patch("verifiedfirst.twitch.get_firsts").return_value = firsts
+
+    resp = client.get(url_for("main.firsts"), headers={"Accept": "*/*"})
+    assert resp.mimetype == "application/json"
+    assert resp.json == firsts
+    assert "Accept" in resp.vary
+
+    resp = client.get(
+        url_for("main.firsts"),
+        headers={"Accept": "application/vnd.verifiedfirst.columns+json, application/json;q=0.5"},
+    )
+    assert resp.mimetype == "application/vnd.verifiedfirst.columns+json"
+    assert json.loads(resp.data) == {"names": ["user1", "user2"], "counts": [5, 3]}
+
+    resp = client.get(url_for("main.firsts"), headers={"Accept": "application/msgpack"})
+    assert resp.mimetype == "application/msgpack"
+    assert msgpack.unpackb(resp.data) == firsts
+
+
+def test_firsts_compressed(app, client, mocker):
+    """Test large /firsts responses are compressed."""
+    firsts = {f"user{i}": i for i in range(1, 1000)}
+    mocker.patch("verifiedfirst.verify.verify_jwt").return_value = (defaults.CHANNEL_ID, "viewer")
+    mocker.patch("verifiedfirst.twitch.get_broadcaster")
+    mocker.patch("verifiedfirst.twitch.get_last_first_id").return_value = 1
+    mocker.patch("verifiedfirst.twitch.get_firsts").return_value = firsts
+
+    resp = client.get(url_for("main.firsts"), headers={"Accept-Encoding": "gzip"})
+    assert resp.content_encoding == "gzip"
+    assert json.loads(gzip.decompress(resp.data)) == firsts
+
+    app.config["COMPRESS_MIN_SIZE"] = 1024 * 1024
+    resp = client.get(url_for("main.firsts"), headers={"Accept-Encoding": "gzip"})
+    assert resp.content_encoding is None
+    assert resp.json == firsts
+
+
+def test_firsts_cached(client, mocker):
+    """Test encoded /firsts responses are cached until a first is added."""
+    mocker.patch("verifiedfirst.verify.verify_jwt").return_value = (defaults.CHANNEL_ID, "viewer")
+    mocker.patch("verifiedfirst.twitch.get_broadcaster").return_value = mocker.Mock(
+        id=defaults.BROADCASTER_ID
+    )
+    mock_last_first_id = mocker.patch("verifiedfirst.twitch.get_last_first_id")
+    mock_last_first_id.return_value = 1
+    mock_get_firsts = mocker.patch("verifiedfirst.twitch.get_firsts")
+    mock_get_firsts.return_value = {"user1": 5}
+    mock_jsonify = mocker.patch("verifiedfirst.main.routes.jsonify", wraps=jsonify)
+
+    resp = client.get(url_for("main.firsts"))
+    etag = resp.headers["ETag"]
+    assert resp.json == {"user1": 5}
+
+    resp = client.get(url_for("main.firsts"))
+    assert resp.json == {"user1": 5}
+    assert resp.headers["ETag"] == etag
+    assert mock_get_firsts.call_count == 1
+    assert mock_jsonify.call_count == 1
+
+    # clients that already have the leaderboard get an empty response
+    resp = client.get(url_for("main.firsts"), headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert not resp.data
+
+    mock_last_first_id.return_value = 2
+    mock_get_firsts.return_value = {"user1": 6}
+    resp = client.get(url_for("main.firsts"), headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json == {"user1": 6}
+    assert resp.headers["ETag"] != etag
+    assert mock_get_firsts.call_count == 2
+
+
+def test_firsts_since(client, mocker):
+    """Test the /firsts/since endpoint returns the firsts added after a given id."""
+    mock_jwt = mocker.patch("verifiedfirst.verify.verify_jwt")
+    mock_jwt.return_value = (defaults.CHANNEL_ID, "viewer")
+    mock_get_broadcaster = mocker.patch("verifiedfirst.twitch.get_broadcaster")
+    mock_broadcaster = mocker.Mock()
+    mock_get_broadcaster.return_value = mock_broadcaster
+    mock_get_firsts_since = mocker.patch("verifiedfirst.twitch.get_firsts_since")
+    mock_get_firsts_since.return_value = ({"user1": 2}, 1234)
+
+    resp = client.get(url_for("main.firsts_since"), query_string={"after_id": "1200"})
+
+    mock_get_broadcaster.assert_called_with(defaults.CHANNEL_ID)
+    mock_get_firsts_since.assert_called_with(mock_broadcaster, 1200)
+    assert resp.status_code == 200
+    assert resp.json == {"firsts": {"user1": 2}, "last_id": 1234}
+
+
+def test_firsts_since_errors(client, mocker):
+    """Test the /firsts/since endpoint validates after_id and checks the broadcaster."""
+    mock_jwt = mocker.patch("verifiedfirst.verify.verify_jwt")
+    mock_jwt.return_value = (defaults.CHANNEL_ID, "viewer")
+    mock_get_broadcaster = mocker.patch("verifiedfirst.twitch.get_broadcaster")
+    mock_get_broadcaster.return_value = None
+
+    for query_string in ({}, {"after_id": "abc"}):
+        resp = client.get(url_for("main.firsts_since"), query_string=query_string)
+        assert resp.status_code == 400
+        assert resp.json == {"error": "after_id must be an integer"}
+
+    resp = client.get(url_for("main.firsts_since"), query_string={"after_id": "0"})
+    assert resp.status_code == 403
+    assert resp.json == {"error": "broadcaster is not authed yet"}
+
+
+def test_firsts_stream(app, client, mocker):
+    """Test the /firsts/stream endpoint sends the leaderboard and then new firsts."""
+    app.config["STREAM_KEEPALIVE"] = 0.01
+    mock_jwt = mocker.patch("verifiedfirst.verify.verify_jwt")
+    mock_jwt.return_value = (defaults.CHANNEL_ID, "viewer")
+    mock_get_broadcaster = mocker.patch("verifiedfirst.twitch.get_broadcaster")
+    mock_broadcaster = mocker.Mock(id=defaults.BROADCASTER_ID)
+    mock_get_broadcaster.return_value = mock_broadcaster
+    mock_get_firsts = mocker.patch("verifiedfirst.twitch.get_firsts")
+    mock_get_firsts.return_value = {"user1": 5}
+    pubsub = app.extensions["firsts_pubsub"]
+
+    resp = client.get(
+        url_for("main.firsts_stream"), query_string={"start_time": "2020-01-01"}, buffered=False
+    )
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    mock_get_firsts.assert_called_with(mock_broadcaster, start_time=datetime(2020, 1, 1))
+
+    events = resp.response
+    assert next(events) == b'event: leaderboard\ndata: {"user1": 5}\n\n'
+    assert next(events) == b": keepalive\n\n"
+    pubsub.publish(defaults.BROADCASTER_ID, "user1")
+    pubsub.publish(defaults.BROADCASTER_ID, "user2")
+    assert next(events) == b'event: first\ndata: {"name": "user1", "count": 6}\n\n'
+    assert next(events) == b'event: first\ndata: {"name": "user2", "count": 1}\n\n'
+
+    # the subscription is removed when the client disconnects
+    resp.close()
+    assert pubsub.publish(defaults.BROADCASTER_ID, "user1") == 0
+
+
+def test_firsts_stream_timeout(app, client, mocker):
+    """Test the /firsts/stream endpoint closes the stream after the timeout."""
+    app.config["STREAM_TIMEOUT"] = 0
+    mocker.patch("verifiedfirst.verify.verify_jwt").return_value = (defaults.CHANNEL_ID, "viewer")
+    mocker.patch("verifiedfirst.twitch.get_broadcaster")
+    mocker.patch("verifiedfirst.twitch.get_firsts").return_value = {}
+
+    resp = client.get(url_for("main.firsts_stream"))
+
+    assert resp.data == b"event: leaderboard\ndata: {}\n\n"
+
+
+def test_firsts_stream_errors(app, client, mocker):
+    """Test the /firsts/stream endpoint returns errors before starting the stream."""
+    mocker.patch("verifiedfirst.verify.verify_jwt").return_value = (defaults.CHANNEL_ID, "viewer")
+    mock_get_broadcaster = mocker.patch("verifiedfirst.twitch.get_broadcaster")
+    mock_get_broadcaster.return_value = None
+    mocker.patch("verifiedfirst.twitch.get_firsts").return_value = {}
+
+    resp = client.get(url_for("main.firsts_stream"))
+    assert resp.status_code == 403
+    assert resp.json == {"error": "broadcaster is not authed yet"}
+
+    app.config["STREAM_MAX_CLIENTS"] = 0
+    resp = client.get(url_for("main.firsts_stream"))
+    assert resp.status_code == 404
+    assert resp.json == {"error": "streams are disabled"}
+    app.config["STREAM_MAX_CLIENTS"] = 80
+
+    mock_get_broadcaster.return_value = mocker.Mock(id=defaults.BROADCASTER_ID)
+    app.extensions["firsts_pubsub"].max_subscribers = 0
+    resp = client.get(url_for("main.firsts_stream"))
+    assert resp.status_code == 503
+    assert resp.json == {"error": "too many open streams"}
+
+
 def test_eventsub_create(client, mocker):
     """Test the /eventsub/create endpoint works."""
     mock_jwt = mocker.patch("verifiedfirst.verify.verify_jwt")
@@ -174,6 +361,7 @@ def test_rewards(client, mocker):
     mock_broadcaster = mocker.Mock()
     mock_get_broadcaster = mocker.patch("verifiedfirst.twitch.get_broadcaster")
     mock_get_broadcaster.return_value = mock_broadcaster
+    mock_broadcaster.id = defaults.BROADCASTER_ID
     mock_get_rewards = mocker.patch("verifiedfirst.twitch.get_rewards")
     rewards_json = defaults.REWARDS_JSON["data"]
     mock_get_rewards.return_value = rewards_json
@@ -181,7 +369,26 @@ def test_rewards(client, mocker):
     resp = client.get(url_for("main.rewards"))
 
     assert resp.status_code == 200
-    assert resp.json == rewards_json
+    assert resp.json == [
+        {
+            "id": reward["id"],
+            "title": reward["title"],
+            "cost": reward["cost"],
+            "is_enabled": reward["is_enabled"],
+        }
+        for reward in rewards_json
+    ]
+
+    # repeat requests are served from the cache
+    assert client.get(url_for("main.rewards")).json == resp.json
+    mock_get_rewards.assert_called_once_with(mock_broadcaster)
+
+    # creating an eventsub invalidates the cache
+    mocker.patch("verifiedfirst.twitch.update_reward").return_value = defaults.REWARD_ID
+    mocker.patch("verifiedfirst.twitch.update_eventsub").return_value = defaults.EVENTSUB_ID
+    client.post(url_for("main.eventsub_create"), query_string={"reward_id": defaults.REWARD_ID})
+    client.get(url_for("main.rewards"))
+    assert mock_get_rewards.call_count == 2
 
 
 def test_rewards_not_broadcaster(client, mocker):
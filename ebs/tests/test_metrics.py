@@ -0,0 +1,295 @@
+"""Tests for metrics."""
+
+import asyncio
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+from flask import url_for
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from requests import Request
+from requests.exceptions import ConnectionError as RequestsConnectionError, RequestException
+from sqlalchemy import text
+
+from verifiedfirst import twitch
+from verifiedfirst.database import db
+from verifiedfirst.metrics import queries, registry
+from verifiedfirst.twitch_async import AsyncTwitchClient
+
+from . import defaults
+from .test_twitch import add_helix_broadcaster
+
+
+def sample(name, **labels):
+    """Get the current value of a sample from the default registry."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_metrics(client, mocker):
+    """Test request counts and latencies are recorded by route template."""
+    mock_jwt = mocker.patch("verifiedfirst.verify.verify_jwt")
+    mock_jwt.return_value = (defaults.CHANNEL_ID, "viewer")
+    mocker.patch("verifiedfirst.twitch.get_broadcaster").return_value = None
+    labels = {"blueprint": "main", "route": "/firsts", "method": "GET"}
+    before_count = sample("verifiedfirst_http_requests_total", **labels, status="403")
+    before_latency = sample("verifiedfirst_http_request_duration_seconds_count", **labels)
+
+    resp = client.get(url_for("main.firsts"))
+
+    assert resp.status_code == 403
+    assert sample("verifiedfirst_http_requests_total", **labels, status="403") == before_count + 1
+    assert (
+        sample("verifiedfirst_http_request_duration_seconds_count", **labels) == before_latency + 1
+    )
+    assert sample("verifiedfirst_http_requests_in_progress", **labels) == 0
+
+
+def test_request_metrics_unmatched(client):
+    """Test requests that don't match a route are grouped together."""
+    labels = {"blueprint": "", "route": "unmatched", "method": "GET"}
+    before = sample("verifiedfirst_http_requests_total", **labels, status="404")
+
+    client.get("/does/not/exist/1234")
+
+    assert sample("verifiedfirst_http_requests_total", **labels, status="404") == before + 1
+
+
+def test_request_in_progress(client, mocker):
+    """Test the in progress gauge is incremented while a request is handled."""
+    labels = {"blueprint": "main", "route": "/rewards", "method": "GET"}
+    in_progress = []
+
+    def verify_jwt(_request):
+        in_progress.append(sample("verifiedfirst_http_requests_in_progress", **labels))
+        raise PermissionError("invalid")
+
+    mocker.patch("verifiedfirst.verify.verify_jwt", side_effect=verify_jwt)
+
+    client.get(url_for("main.rewards"))
+
+    assert in_progress == [1]
+    assert sample("verifiedfirst_http_requests_in_progress", **labels) == 0
+
+
+def test_metrics_endpoint(client):
+    """Test metrics are exposed in the prometheus text format."""
+    client.get(url_for("metrics.metrics"))
+
+    resp = client.get(url_for("metrics.metrics"))
+
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain")
+    assert (
+        b'verifiedfirst_http_requests_total{blueprint="metrics",method="GET",route="/metrics",'
+        b'status="200"}' in resp.data
+    )
+
+
+def test_generate_metrics_multiprocess(tmp_path, monkeypatch):
+    """Test metrics are aggregated from all processes when multiprocess mode is enabled."""
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    for pid in (1, 2):
+        values = MmapedDict(str(tmp_path / f"counter_{pid}.db"))
+        key = mmap_key("test_total", "test_total", [], [], "")
+        values.write_value(key, 2, 0)
+        values.close()
+
+    data, content_type = registry.generate_metrics()
+
+    assert content_type == registry.CONTENT_TYPE_LATEST
+    assert b"test_total 4.0" in data
+
+
+def test_import_registry_multiprocess(tmp_path):
+    """Test the metrics can be defined when the multiprocess directory doesn't exist yet."""
+    multiproc_dir = tmp_path / "prometheus"
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)}
+
+    result = subprocess.run(
+        [sys.executable, "-c", "import verifiedfirst.metrics.registry"],
+        env=env,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+
+    assert result.returncode == 0, result.stderr.decode()
+    assert list(multiproc_dir.glob("*.db"))
+
+
+def test_make_multiproc_dir(tmp_path, monkeypatch):
+    """Test the multiprocess directory is created only when multiprocess mode is enabled."""
+    multiproc_dir = tmp_path / "prometheus"
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    registry.make_multiproc_dir()
+    assert not multiproc_dir.exists()
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(multiproc_dir))
+    registry.make_multiproc_dir()
+    registry.make_multiproc_dir()
+    assert multiproc_dir.is_dir()
+
+
+def test_twitch_metrics_broadcaster_refresh(
+    helix_app, fake_helix
+):  # pylint: disable=unused-argument
+    """Test requests with an expired broadcaster token are counted along with the refresh."""
+    broadcaster = add_helix_broadcaster(fake_helix, db)
+    fake_helix.broadcaster_tokens.clear()
+    labels = {"endpoint": "/channel_points/custom_rewards", "token": "broadcaster"}
+    before_401 = sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="401")
+    before_200 = sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="200")
+    before_latency = sample(
+        "verifiedfirst_twitch_request_duration_seconds_count", **labels, method="GET"
+    )
+    before_retries = sample("verifiedfirst_twitch_retries_total", **labels)
+    before_refreshes = sample(
+        "verifiedfirst_twitch_token_refreshes_total", token="broadcaster", result="success"
+    )
+
+    twitch.get_rewards(broadcaster)
+
+    assert (
+        sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="401")
+        == before_401 + 1
+    )
+    assert (
+        sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="200")
+        == before_200 + 1
+    )
+    assert (
+        sample("verifiedfirst_twitch_request_duration_seconds_count", **labels, method="GET")
+        == before_latency + 2
+    )
+    assert sample("verifiedfirst_twitch_retries_total", **labels) == before_retries + 1
+    assert (
+        sample("verifiedfirst_twitch_token_refreshes_total", token="broadcaster", result="success")
+        == before_refreshes + 1
+    )
+
+
+def test_twitch_metrics_app_refresh(helix_app, fake_helix):
+    """Test concurrent async requests that share an app token refresh are counted."""
+    for user_id in range(250):
+        fake_helix.add_user(user_id, f"user{user_id}")
+    labels = {"endpoint": "/users", "token": "app"}
+    before_401 = sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="401")
+    before_retries = sample("verifiedfirst_twitch_retries_total", **labels)
+    before_refreshes = sample(
+        "verifiedfirst_twitch_token_refreshes_total", token="app", result="success"
+    )
+
+    async def main():
+        async with AsyncTwitchClient(helix_app.config) as client:
+            await client.get_users_by_login([f"user{user_id}" for user_id in range(250)])
+
+    asyncio.run(main())
+
+    # 3 batches, each retried after a 401 but sharing a single refresh
+    assert (
+        sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="401")
+        == before_401 + 3
+    )
+    assert sample("verifiedfirst_twitch_retries_total", **labels) == before_retries + 3
+    assert (
+        sample("verifiedfirst_twitch_token_refreshes_total", token="app", result="success")
+        == before_refreshes + 1
+    )
+
+
+def test_twitch_metrics_refresh_fail(app, requests_mock, mocker):
+    """Test failed token refreshes are counted."""
+    url = f"{app.config['TWITCH_API_BASEURL']}/users"
+    requests_mock.get(url, status_code=401)
+    mocker.patch("verifiedfirst.twitch.get_app_access_token").side_effect = RequestException
+    before = sample("verifiedfirst_twitch_token_refreshes_total", token="app", result="failure")
+
+    with app.app_context(), pytest.raises(RequestException):
+        twitch.request_twitch_api_app(Request(method="GET", url=url))
+
+    assert (
+        sample("verifiedfirst_twitch_token_refreshes_total", token="app", result="failure")
+        == before + 1
+    )
+
+
+def test_twitch_metrics_rate_limited(app, requests_mock):
+    """Test rate limited requests and requests that get no response are counted."""
+    url = f"{app.config['TWITCH_API_BASEURL']}/eventsub/subscriptions"
+    labels = {"endpoint": "/eventsub/subscriptions", "token": "app"}
+    before_429 = sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="429")
+    before_limited = sample("verifiedfirst_twitch_rate_limited_total", **labels)
+    before_error = sample(
+        "verifiedfirst_twitch_requests_total", **labels, method="GET", status="error"
+    )
+
+    with app.app_context():
+        requests_mock.get(url, status_code=429)
+        twitch.request_twitch_api(
+            app.config["APP_ACCESS_TOKEN"],
+            Request(method="GET", url=url, params={"first": 100}),
+        )
+        requests_mock.get(url, exc=RequestsConnectionError)
+        with pytest.raises(RequestsConnectionError):
+            twitch.request_twitch_api(
+                app.config["APP_ACCESS_TOKEN"], Request(method="GET", url=url)
+            )
+
+    assert (
+        sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="429")
+        == before_429 + 1
+    )
+    assert sample("verifiedfirst_twitch_rate_limited_total", **labels) == before_limited + 1
+    assert (
+        sample("verifiedfirst_twitch_requests_total", **labels, method="GET", status="error")
+        == before_error + 1
+    )
+
+
+def test_query_metrics(helix_app, fake_helix, mocker):
+    """Test database queries are counted per request and reported in debug mode."""
+    add_helix_broadcaster(fake_helix, db)
+    for user_id in range(3):
+        twitch.add_first(defaults.BROADCASTER_ID, user_id, f"user{user_id}")
+    db.session.expire_all()
+    mock_jwt = mocker.patch("verifiedfirst.verify.verify_jwt")
+    mock_jwt.return_value = (defaults.BROADCASTER_ID, "viewer")
+    labels = {"blueprint": "main", "route": "/firsts", "method": "GET"}
+    before = sample("verifiedfirst_http_request_db_queries_count", **labels)
+    before_queries = sample("verifiedfirst_http_request_db_queries_sum", **labels)
+    client = helix_app.test_client()
+
+    resp = client.get("/firsts")
+
+    assert resp.status_code == 200
+    assert "Server-Timing" not in resp.headers
+    assert sample("verifiedfirst_http_request_db_queries_count", **labels) == before + 1
+    # broadcaster, latest first id, then the totals joined with the users
+    assert sample("verifiedfirst_http_request_db_queries_sum", **labels) == before_queries + 3
+
+    helix_app.debug = True
+    resp = client.get("/firsts")
+
+    # the leaderboard is cached, so only the broadcaster and latest first id are read
+    assert re.fullmatch(r'db;dur=\d+\.\d;desc="2 queries"', resp.headers["Server-Timing"])
+
+
+def test_slow_query_log(helix_app, mocker, caplog):
+    """Test slow queries are logged without the values of their parameters."""
+    mocker.patch("verifiedfirst.metrics.queries.time.perf_counter").side_effect = [0.0, 1.0]
+
+    db.session.execute(text("SELECT :login"), {"login": "secretlogin"})
+
+    assert "slow query (1000.0 ms): SELECT ? parameters=['str']" in caplog.messages
+    assert "secretlogin" not in caplog.text
+    assert helix_app.config["SLOW_QUERY_THRESHOLD_MS"] == 250
+
+
+def test_redact():
+    """Test redacted parameters only include their types."""
+    assert queries.redact({"id": 1, "name": "test"}) == "{'id': 'int', 'name': 'str'}"
+    assert queries.redact((1, None)) == "['int', 'NoneType']"
+    assert queries.redact(None) == "[]"
+    assert queries.redact([(1, "test"), (2, "test")], executemany=True) == "<2 rows>"
@@ -0,0 +1,68 @@
+"""Tests for request profiling."""
+
+import pstats
+
+import pytest
+
+from verifiedfirst import create_app, profiling
+
+from .conftest import TestConfig
+
+
+@pytest.fixture(name="profile_app")
+def fixture_profile_app(tmp_path):
+    """Create an app with profiling enabled."""
+
+    class ProfileTestConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """Config with profiling enabled."""
+
+        PROFILE_DIR = str(tmp_path / "profiles")
+        PROFILE_SECRET = "profilesecret"
+
+    return create_app(ProfileTestConfig)
+
+
+def test_profiling_disabled(app):
+    """Test no hooks are registered when profiling is disabled."""
+    assert profiling.start_profile not in app.before_request_funcs.get(None, [])
+    assert profiling.stop_profile not in app.teardown_request_funcs.get(None, [])
+
+
+def test_profile_header(profile_app, tmp_path):
+    """Test requests with the profiling header are profiled."""
+    client = profile_app.test_client()
+
+    client.get("/metrics")
+    client.get("/metrics", headers={"X-Profile": "wrongsecret"})
+    resp = client.get("/metrics", headers={"X-Profile": "profilesecret"})
+
+    assert resp.status_code == 200
+    profiles = list((tmp_path / "profiles").iterdir())
+    assert len(profiles) == 1
+    assert profiles[0].name.startswith("metrics.GET.")
+    assert profiles[0].name.endswith(".prof")
+    assert pstats.Stats(str(profiles[0])).total_calls > 0
+
+
+def test_profile_sampling(profile_app, tmp_path):
+    """Test requests are profiled according to the sample rate."""
+    profile_app.config["PROFILE_SAMPLE_RATE"] = 1
+    client = profile_app.test_client()
+
+    client.get("/metrics")
+    client.get("/notfound")
+
+    names = sorted(profile.name for profile in (tmp_path / "profiles").iterdir())
+    assert [name.split(".")[:2] for name in names] == [["metrics", "GET"], ["unmatched", "GET"]]
+
+
+def test_profile_already_active(profile_app, tmp_path, mocker, caplog):
+    """Test requests are not profiled if another profiler is already running."""
+    mocker.patch("cProfile.Profile.enable").side_effect = ValueError("profiler already enabled")
+    client = profile_app.test_client()
+
+    resp = client.get("/metrics", headers={"X-Profile": "profilesecret"})
+
+    assert resp.status_code == 200
+    assert not list((tmp_path / "profiles").iterdir())
+    assert "could not start profiling request: profiler already enabled" in caplog.messages
@@ -0,0 +1,42 @@
+"""Tests for in-process pubsub."""
+
+from verifiedfirst.pubsub import PubSub
+
+
+def test_pubsub():
+    """Test messages are only sent to the subscribers of a topic."""
+    pubsub = PubSub()
+    sub1 = pubsub.subscribe(1)
+    sub2 = pubsub.subscribe(1)
+    sub3 = pubsub.subscribe(2)
+
+    assert pubsub.publish(1, "user1") == 2
+    assert sub1.get(0) == "user1"
+    assert sub2.get(0) == "user1"
+    assert sub3.get(0) is None
+
+    pubsub.unsubscribe(sub1)
+    pubsub.unsubscribe(sub1)
+    assert not sub1.active
+    assert pubsub.publish(1, "user2") == 1
+    assert sub1.get(0) is None
+    assert sub2.get(0) == "user2"
+
+    pubsub.unsubscribe(sub2)
+    assert pubsub.publish(1, "user3") == 0
+
+
+def test_pubsub_limits():
+    """Test the number of subscribers is limited and slow subscribers are dropped."""
+    pubsub = PubSub(max_subscribers=2, maxsize=1)
+    slow = pubsub.subscribe(1)
+    fast = pubsub.subscribe(1)
+    assert pubsub.subscribe(2) is None
+
+    assert pubsub.publish(1, "user1") == 2
+    assert fast.get(0) == "user1"
+    assert pubsub.publish(1, "user2") == 1
+    assert not slow.active
+    assert fast.active
+
+    assert pubsub.subscribe(2) is not None
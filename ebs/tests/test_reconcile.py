@@ -0,0 +1,173 @@
+"""Tests for the eventsub reconciliation job."""
+
+import asyncio
+import sys
+
+from verifiedfirst.database import db
+from verifiedfirst.models.broadcasters import Broadcaster
+from verifiedfirst.reconcile import ReconcileStats, main, reconcile
+
+
+def add_broadcasters(fake_helix, count):
+    """Add broadcasters with a reward configured to the fake api and the database."""
+    broadcasters = []
+    for broadcaster_id in range(count):
+        access_token = f"token{broadcaster_id}"
+        refresh_token = fake_helix.add_broadcaster(
+            broadcaster_id, f"broadcaster{broadcaster_id}", access_token
+        )
+        broadcaster = Broadcaster(
+            id=broadcaster_id,
+            name=f"broadcaster{broadcaster_id}",
+            access_token=access_token,
+            refresh_token=refresh_token,
+            reward_id=f"reward{broadcaster_id}",
+        )
+        db.session.add(broadcaster)
+        broadcasters.append(broadcaster)
+    db.session.commit()
+    return broadcasters
+
+
+def respond_500(handler, *_args):
+    """Replacement for a fake api route that always fails."""
+    handler._respond(500)  # pylint: disable=protected-access
+
+
+def eventsub_keys(fake_helix):
+    """Get the sorted (broadcaster_id, reward_id, callback) of all eventsubs."""
+    return sorted(
+        (
+            eventsub["condition"]["broadcaster_user_id"],
+            eventsub["condition"]["reward_id"],
+            eventsub["transport"]["callback"],
+        )
+        for eventsub in fake_helix.eventsubs.values()
+    )
+
+
+def test_reconcile(helix_app, fake_helix, caplog):
+    """Test all eventsubs are brought in line with the broadcaster table."""
+    fake_helix.page_size = 2
+    broadcasters = add_broadcasters(fake_helix, 7)
+    callback = helix_app.config["EVENTSUB_CALLBACK_URL"]
+    # 0: correct, 1: stale id in the db, 2: failed, 3: only has another deployment's eventsub,
+    # 4: duplicated, 5: pending, 6: missing
+    broadcasters[0].eventsub_id = fake_helix.add_eventsub(0, "reward0")["id"]
+    kept = fake_helix.add_eventsub(1, "reward1")
+    broadcasters[1].eventsub_id = "stale"
+    fake_helix.add_eventsub(2, "reward2", status="webhook_callback_verification_failed")
+    fake_helix.add_eventsub(4, "reward4")
+    fake_helix.add_eventsub(4, "reward4", status="notification_failures_exceeded")
+    fake_helix.add_eventsub(5, "reward5", status="webhook_callback_verification_pending")
+    # orphaned eventsubs for an old reward and an unknown broadcaster
+    fake_helix.add_eventsub(0, "oldreward")
+    fake_helix.add_eventsub(1234, "reward1234")
+    # belong to another deployment
+    fake_helix.add_eventsub(3, "reward3", callback="https://example.com/eventsub")
+    fake_helix.add_eventsub(1234, "reward1234", callback="https://example.com/eventsub")
+    db.session.commit()
+
+    stats = asyncio.run(reconcile())
+
+    assert stats == ReconcileStats(
+        eventsubs=10, skipped=2, kept=4, deleted=4, created=2, updated=5, failed=0
+    )
+    assert eventsub_keys(fake_helix) == sorted(
+        [(str(i), f"reward{i}", callback) for i in range(7) if i != 3]
+        + [
+            ("1234", "reward1234", "https://example.com/eventsub"),
+            ("3", "reward3", "https://example.com/eventsub"),
+        ]
+    )
+    assert "eventsub for ('3', 'reward3') belongs to another deployment" in caplog.text
+    assert db.session.get(Broadcaster, 1).eventsub_id == kept["id"]
+    assert db.session.get(Broadcaster, 3).eventsub_id is None
+    for broadcaster in Broadcaster.query.filter(Broadcaster.eventsub_id.is_not(None)):
+        eventsub = fake_helix.eventsubs[broadcaster.eventsub_id]
+        assert eventsub["condition"]["broadcaster_user_id"] == str(broadcaster.id)
+    # the subscriptions were only listed once (5 pages, plus a retry for the new app token)
+    assert fake_helix.count("GET", "/helix/eventsub/subscriptions") == 6
+
+    assert asyncio.run(reconcile()) == ReconcileStats(eventsubs=8, skipped=2, kept=6)
+
+
+def test_reconcile_other_deployment(helix_app, fake_helix):  # pylint: disable=unused-argument
+    """Test another deployment's eventsubs are never deleted, even for known broadcasters."""
+    add_broadcasters(fake_helix, 1)
+    other = fake_helix.add_eventsub(0, "reward0", callback="https://example.com/eventsub")
+    failed = fake_helix.add_eventsub(0, "reward0", status="webhook_callback_verification_failed")
+
+    stats = asyncio.run(reconcile())
+
+    assert stats == ReconcileStats(eventsubs=2, skipped=1, deleted=1)
+    assert list(fake_helix.eventsubs) == [other["id"]]
+    assert failed["id"] not in fake_helix.eventsubs
+
+
+def test_reconcile_dry_run(helix_app, fake_helix):  # pylint: disable=unused-argument
+    """Test a dry run doesn't make any changes."""
+    add_broadcasters(fake_helix, 2)
+    fake_helix.add_eventsub(0, "reward0", status="webhook_callback_verification_failed")
+    fake_helix.add_eventsub(1234, "reward1234")
+    eventsubs = dict(fake_helix.eventsubs)
+
+    stats = asyncio.run(reconcile(dry_run=True))
+
+    assert stats == ReconcileStats(eventsubs=2, deleted=2, created=2)
+    assert fake_helix.eventsubs == eventsubs
+    assert all(broadcaster.eventsub_id is None for broadcaster in Broadcaster.query.all())
+
+
+def test_reconcile_failures(helix_app, fake_helix, mocker):  # pylint: disable=unused-argument
+    """Test failed deletes and creates are counted and don't stop other changes."""
+    broadcasters = add_broadcasters(fake_helix, 3)
+    failed = fake_helix.add_eventsub(0, "reward0", status="webhook_callback_verification_failed")
+    mocker.patch(
+        "tests.fake_helix._Handler._delete_helix_eventsub_subscriptions",
+        side_effect=respond_500,
+        autospec=True,
+    )
+    fake_helix.add_eventsub(1, "reward1", status="authorization_revoked")
+
+    stats = asyncio.run(reconcile())
+
+    # both deletes fail, so neither broadcaster can have its eventsub recreated
+    assert stats == ReconcileStats(eventsubs=2, created=1, updated=1, failed=2)
+    assert failed["id"] in fake_helix.eventsubs
+    assert broadcasters[0].eventsub_id is None
+    assert broadcasters[2].eventsub_id in fake_helix.eventsubs
+
+
+def test_reconcile_create_failure(helix_app, fake_helix, mocker):  # pylint: disable=unused-argument
+    """Test a failed create is counted and the broadcaster is left unchanged."""
+    broadcasters = add_broadcasters(fake_helix, 1)
+    mocker.patch(
+        "tests.fake_helix._Handler._post_helix_eventsub_subscriptions",
+        side_effect=respond_500,
+        autospec=True,
+    )
+
+    stats = asyncio.run(reconcile())
+
+    assert stats == ReconcileStats(failed=1)
+    assert broadcasters[0].eventsub_id is None
+
+
+def test_main(helix_app, fake_helix, mocker, caplog):
+    """Test the command line entry point."""
+    add_broadcasters(fake_helix, 1)
+    mocker.patch("verifiedfirst.reconcile.create_app", return_value=helix_app)
+    mocker.patch.object(sys, "argv", ["verifiedfirst-reconcile", "--dry-run", "--concurrency", "2"])
+
+    main()
+
+    assert "dry run: eventsubs=0 skipped=0 kept=0 deleted=0 created=1" in caplog.text
+    assert not fake_helix.eventsubs
+
+    mocker.patch.object(sys, "argv", ["verifiedfirst-reconcile"])
+
+    main()
+
+    assert "reconciled: eventsubs=0 skipped=0 kept=0 deleted=0 created=1" in caplog.text
+    assert len(fake_helix.eventsubs) == 1
@@ -1,5 +1,6 @@
 """Integration tests for console scripts."""
 
+import os
 import subprocess
 import sys
 import signal
@@ -8,7 +9,7 @@ from threading import Timer
 
 import requests
 
-from verifiedfirst import create_app
+from verifiedfirst import create_app, totals
 from verifiedfirst.database import db
 from verifiedfirst.models.broadcasters import Broadcaster
 from verifiedfirst.models.firsts import First
@@ -56,6 +57,8 @@ def test_init_db(integrationtestconfig):
                 first = First(broadcaster_id=defaults.BROADCASTER_ID, name=user)
                 db.session.add(first)
                 db.session.commit()
+        totals.rebuild(db.session.connection())
+        db.session.commit()
 
 
 def test_main(integrationtestconfig, generate_jwt):  # pylint: disable=unused-argument
@@ -69,7 +72,13 @@ def test_main(integrationtestconfig, generate_jwt):  # pylint: disable=unused-ar
         timer.start()
 
         # give the server some time to start up
-        time.sleep(1)
+        for _ in range(40):
+            time.sleep(0.1)
+            try:
+                requests.get("http://localhost:5000/", timeout=1)
+                break
+            except requests.ConnectionError:
+                continue
 
         # test getting firsts
         headers = {
@@ -91,3 +100,74 @@ def test_main(integrationtestconfig, generate_jwt):  # pylint: disable=unused-ar
 
         # ensure the webserver closed gracefully
         assert webserver.returncode == 0
+
+
+def test_reconcile(integrationtestconfig, fake_helix):
+    """Test that eventsubs can be reconciled using the reconcile.py script."""
+    with create_app(integrationtestconfig).app_context():
+        db.drop_all()
+        db.create_all()
+
+    env = dict(
+        os.environ,
+        VFIRST_TWITCH_API_BASEURL=fake_helix.base_url,
+        VFIRST_TWITCH_AUTH_URL=fake_helix.auth_url,
+    )
+    fake_helix.add_eventsub(defaults.BROADCASTER_ID, defaults.REWARD_ID)
+
+    reconcile = subprocess.run(
+        [sys.executable, "verifiedfirst/reconcile.py", "--dry-run"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        env=env,
+        check=True,
+    )
+
+    assert b"dry run: eventsubs=1 skipped=0 kept=0 deleted=1 created=0" in reconcile.stdout
+    assert len(fake_helix.eventsubs) == 1
+
+
+def test_add_first(integrationtestconfig):
+    """Test that firsts added by the add_first.py script are counted in the totals."""
+    with create_app(integrationtestconfig).app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(
+            Broadcaster(
+                id=25819608,
+                name=defaults.BROADCASTER_NAME,
+                access_token=defaults.AUTH_ACCESS_TOKEN,
+                refresh_token=defaults.AUTH_REFRESH_TOKEN,
+            )
+        )
+        db.session.commit()
+
+    subprocess.run(
+        [sys.executable, "-m", "scripts.add_first"],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+
+    with create_app(integrationtestconfig).app_context():
+        assert totals.get_totals(25819608) == {"test1": 2, "test2": 1, "test3": 1}
+        assert not totals.check(db.session.connection())
+
+
+def test_setup_test_env(integrationtestconfig):
+    """Test that the first added by the setup_test_env.py script is counted in the totals."""
+    with create_app(integrationtestconfig).app_context():
+        db.drop_all()
+        db.create_all()
+
+    subprocess.run(
+        [sys.executable, "-m", "scripts.setup_test_env"],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+
+    with create_app(integrationtestconfig).app_context():
+        assert totals.get_totals(15991044) == {"liondeveloper306": 1}
+        assert not totals.check(db.session.connection())
@@ -0,0 +1,204 @@
+"""Tests for the running totals of each user's firsts."""
+
+import pytest
+from sqlalchemy import insert, inspect, update
+from sqlalchemy.exc import OperationalError
+
+from verifiedfirst import create_app, totals, twitch
+from verifiedfirst.database import db
+from verifiedfirst.models.first_totals import FirstTotal
+from verifiedfirst.models.firsts import First
+from verifiedfirst.models.users import User
+
+from . import defaults
+
+
+@pytest.fixture(name="upgraded_config")
+def fixture_upgraded_config(testconfig, tmp_path):
+    """Config for a database with firsts that was created before the first_totals table."""
+
+    class UpgradedConfig(testconfig):  # pylint: disable=too-few-public-methods
+        """Config with a file based sqlite db."""
+
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'upgraded.db'}"
+
+    with create_app(UpgradedConfig).app_context():
+        db.create_all()
+        db.session.add(User(id=1001, name="user1"))
+        db.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="user1", user_id=1001))
+        db.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="user1", user_id=1001))
+        db.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="legacy"))
+        db.session.commit()
+        FirstTotal.__table__.drop(db.engine)
+
+    return UpgradedConfig
+
+
+def test_init_app_creates_totals(upgraded_config):
+    """Test the totals of a database created before first_totals are created at startup."""
+    app = create_app(upgraded_config)
+
+    with app.app_context():
+        assert totals.get_totals(defaults.BROADCASTER_ID) == {"user1": 2, "legacy": 1}
+
+        # totals that already exist are left alone
+        db.session.execute(update(FirstTotal).values(count=10))
+        db.session.commit()
+        create_app(upgraded_config)
+        assert totals.get_totals(defaults.BROADCASTER_ID) == {"user1": 10, "legacy": 10}
+
+
+def test_init_app_new_database(app):
+    """Test no tables are created in a new database, which is left to create_all."""
+    with app.app_context():
+        assert not inspect(db.engine).get_table_names()
+
+
+def test_init_app_concurrent_create(upgraded_config, mocker):
+    """Test startup continues if another worker created the totals first."""
+    create = FirstTotal.__table__.create
+
+    def create_elsewhere(conn):  # pylint: disable=unused-argument
+        create(db.engine)
+        raise OperationalError("CREATE TABLE first_totals", {}, Exception("already exists"))
+
+    mock_create = mocker.patch.object(FirstTotal.__table__, "create", side_effect=create_elsewhere)
+    app = create_app(upgraded_config)
+    mocker.stop(mock_create)
+
+    with app.app_context():
+        assert inspect(db.engine).has_table(FirstTotal.__tablename__)
+
+
+def test_init_app_create_fails(upgraded_config, mocker):
+    """Test startup fails if the totals can't be created."""
+    mocker.patch.object(
+        FirstTotal.__table__,
+        "create",
+        side_effect=OperationalError("CREATE TABLE first_totals", {}, Exception("disk full")),
+    )
+
+    with pytest.raises(OperationalError):
+        create_app(upgraded_config)
+
+
+def test_add_first_increments_totals(app, init_db):
+    """Test add_first keeps the totals in line with the firsts."""
+    database = init_db(app)
+    with app.app_context():
+        twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+        twitch.add_first(defaults.BROADCASTER_ID, 1001, "user1")
+        twitch.add_first(defaults.BROADCASTER_ID, 1002, "user2")
+        twitch.add_first(defaults.BROADCASTER_ID + 1, 1001, "user1")
+
+        assert totals.get_totals(defaults.BROADCASTER_ID) == {"user1": 2, "user2": 1}
+        assert totals.get_totals(defaults.BROADCASTER_ID + 1) == {"user1": 1}
+        assert not totals.check(database.session.connection())
+
+
+def test_increment_renamed_user(app, init_db):
+    """Test totals follow a user's current name."""
+    init_db(app)
+    with app.app_context():
+        twitch.add_first(defaults.BROADCASTER_ID, 1001, "oldname")
+        twitch.add_first(defaults.BROADCASTER_ID, 1001, "newname")
+
+        assert totals.get_totals(defaults.BROADCASTER_ID) == {"newname": 2}
+
+
+def test_increment_concurrent_insert(app, init_db, mocker):
+    """Test a total created by another worker between the update and insert is incremented."""
+    database = init_db(app)
+    with app.app_context():
+        execute = database.session.execute
+
+        def execute_then_insert(statement, *args, **kwargs):
+            result = execute(statement, *args, **kwargs)
+            if mock_execute.call_count == 1:
+                execute(
+                    insert(FirstTotal).values(
+                        broadcaster_id=defaults.BROADCASTER_ID, user_id=1001, name="user1", count=4
+                    )
+                )
+            return result
+
+        mock_execute = mocker.patch.object(
+            database.session, "execute", side_effect=execute_then_insert
+        )
+        totals.increment(defaults.BROADCASTER_ID, 1001, "user1")
+        mocker.stop(mock_execute)
+        database.session.add(User(id=1001, name="user1"))
+        database.session.commit()
+
+        assert totals.get_totals(defaults.BROADCASTER_ID) == {"user1": 5}
+
+
+def test_get_totals(app, init_db):
+    """Test totals are read by current username, merged with legacy firsts of the same name."""
+    database = init_db(app)
+    with app.app_context():
+        database.session.add(User(id=1001, name="user1"))
+        database.session.add_all(
+            [
+                FirstTotal(
+                    broadcaster_id=defaults.BROADCASTER_ID, user_id=1001, name="old", count=3
+                ),
+                FirstTotal(broadcaster_id=defaults.BROADCASTER_ID, name="user1", count=2),
+                FirstTotal(broadcaster_id=defaults.BROADCASTER_ID, name="user2", count=1),
+                FirstTotal(broadcaster_id=defaults.BROADCASTER_ID + 1, name="user3", count=1),
+            ]
+        )
+        database.session.commit()
+
+        assert totals.get_totals(defaults.BROADCASTER_ID) == {"user1": 5, "user2": 1}
+        assert not totals.get_totals(defaults.BROADCASTER_ID + 2)
+
+        database.session.add(
+            FirstTotal(broadcaster_id=defaults.BROADCASTER_ID, user_id=9999, name="ghost", count=1)
+        )
+        database.session.commit()
+        with pytest.raises(ValueError):
+            totals.get_totals(defaults.BROADCASTER_ID)
+
+
+def test_rebuild_and_check(app, init_db):
+    """Test totals are recomputed from the firsts and inconsistencies are found."""
+    database = init_db(app)
+    with app.app_context():
+        database.session.add(User(id=1001, name="user1"))
+        database.session.add_all(
+            [
+                First(broadcaster_id=defaults.BROADCASTER_ID, name="old", user_id=1001),
+                First(broadcaster_id=defaults.BROADCASTER_ID, name="user1", user_id=1001),
+                First(broadcaster_id=defaults.BROADCASTER_ID, name="user1"),
+                First(broadcaster_id=defaults.BROADCASTER_ID, name="legacy"),
+                First(broadcaster_id=defaults.BROADCASTER_ID + 1, name="legacy"),
+            ]
+        )
+        database.session.commit()
+        conn = database.session.connection()
+
+        assert totals.check(conn) == {
+            (defaults.BROADCASTER_ID, 1001): (2, 0),
+            (defaults.BROADCASTER_ID, "user1"): (1, 0),
+            (defaults.BROADCASTER_ID, "legacy"): (1, 0),
+            (defaults.BROADCASTER_ID + 1, "legacy"): (1, 0),
+        }
+
+        assert totals.rebuild(conn, defaults.BROADCASTER_ID) == 3
+        assert totals.check(conn) == {(defaults.BROADCASTER_ID + 1, "legacy"): (1, 0)}
+        assert not totals.check(conn, defaults.BROADCASTER_ID)
+        assert totals.get_totals(defaults.BROADCASTER_ID) == {"user1": 3, "legacy": 1}
+
+        assert totals.rebuild(conn) == 4
+        assert not totals.check(conn)
+
+        conn.execute(update(FirstTotal).values(count=FirstTotal.count + 1))
+        database.session.add(FirstTotal(broadcaster_id=defaults.BROADCASTER_ID, name="x", count=1))
+        database.session.flush()
+        assert totals.check(conn, defaults.BROADCASTER_ID) == {
+            (defaults.BROADCASTER_ID, 1001): (2, 3),
+            (defaults.BROADCASTER_ID, "user1"): (1, 2),
+            (defaults.BROADCASTER_ID, "legacy"): (1, 2),
+            (defaults.BROADCASTER_ID, "x"): (0, 1),
+        }
@@ -1,5 +1,9 @@
 """Tests for functions that interact with the Twitch API."""
 
+# pylint: disable=too-many-lines
+
+import asyncio
+import time
 from datetime import datetime
 from urllib.parse import quote
 
@@ -7,7 +11,8 @@ import pytest
 from requests import Request
 from requests.exceptions import RequestException
 
-from verifiedfirst import twitch
+from verifiedfirst import totals, twitch
+from verifiedfirst.database import db
 from verifiedfirst.models.broadcasters import Broadcaster
 from verifiedfirst.models.firsts import First
 
@@ -530,6 +535,8 @@ def test_get_firsts(app, mocker, init_db):
         for _ in range(0, count):
             first = First(broadcaster_id=defaults.BROADCASTER_ID, name=user)
             database.session.add(first)
+    database.session.flush()
+    totals.rebuild(database.session.connection())
     database.session.commit()
 
     # tests the first counts match what is in the db
@@ -539,6 +546,8 @@ def test_get_firsts(app, mocker, init_db):
     assert firsts["user1"] == users["user1"]
     assert firsts["user2"] == users["user2"]
     assert firsts["user3"] == users["user3"]
+    # the totals match counting the firsts directly
+    assert twitch.get_firsts(broadcaster, end_time=datetime.max) == firsts
 
 
 def test_get_firsts_date_ranges(app, mocker, init_db, patch_current_time):
@@ -563,6 +572,8 @@ def test_get_firsts_date_ranges(app, mocker, init_db, patch_current_time):
     with patch_current_time("2020-03-01"):
         database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="user3"))
         database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="user3"))
+        database.session.flush()
+        totals.rebuild(database.session.connection())
         database.session.commit()
 
     with patch_current_time("2020-03-02"):
@@ -706,6 +717,43 @@ def test_get_eventsub_fail(app, mocker):  # pylint: disable=unused-argument
         twitch.get_eventsubs(mock_broadcaster)
 
 
+def test_iter_eventsubs(helix_app, fake_helix):  # pylint: disable=unused-argument
+    """Test iter_eventsubs follows the pagination cursor and applies filters."""
+    fake_helix.page_size = 2
+    for i in range(5):
+        fake_helix.add_eventsub(defaults.BROADCASTER_ID, f"reward{i}")
+    failed = fake_helix.add_eventsub(
+        defaults.BROADCASTER_ID, "failedreward", status="notification_failures_exceeded"
+    )
+    other = fake_helix.add_eventsub(1234, "otherreward")
+    fake_helix.app_tokens.add("apptoken")
+    helix_app.config["APP_ACCESS_TOKEN"] = "apptoken"
+
+    eventsubs = twitch.iter_eventsubs(user_id=defaults.BROADCASTER_ID)
+
+    # pages are only requested as they are consumed
+    assert next(eventsubs)["condition"]["reward_id"] == "reward0"
+    assert fake_helix.count("GET", "/helix/eventsub/subscriptions") == 1
+    assert len(list(eventsubs)) == 5
+    assert fake_helix.count("GET", "/helix/eventsub/subscriptions") == 3
+
+    # only one filter can be sent to the api, the others are applied locally
+    fake_helix.requests.clear()
+    enabled = list(
+        twitch.iter_eventsubs(
+            user_id=defaults.BROADCASTER_ID,
+            status="enabled",
+            eventsub_type="channel.channel_points_custom_reward_redemption.add",
+        )
+    )
+    assert len(enabled) == 5
+    assert failed not in enabled
+    assert [req[2] for req in fake_helix.requests][0] == {"user_id": [str(defaults.BROADCASTER_ID)]}
+
+    assert list(twitch.iter_eventsubs(status="notification_failures_exceeded")) == [failed]
+    assert len(list(twitch.iter_eventsubs(eventsub_type=other["type"], status="enabled"))) == 6
+
+
 def test_delete_eventsub(app, mocker):  # pylint: disable=unused-argument
     """Test delete_eventsub function."""
     mock_response = mocker.Mock()
@@ -716,95 +764,123 @@ def test_delete_eventsub(app, mocker):  # pylint: disable=unused-argument
     twitch.delete_eventsub(defaults.EVENTSUB_ID)
 
 
-def test_update_eventsub(app, init_db, mocker):
-    """Test new eventsub gets created if it doesn't exist."""
-    database = init_db(app)
-
-    mock_get_eventsubs = mocker.patch("verifiedfirst.twitch.get_eventsubs")
-    mock_get_eventsubs.return_value = []
-
-    mock_create_eventsub = mocker.patch("verifiedfirst.twitch.create_eventsub")
-    mock_create_eventsub.return_value = defaults.EVENTSUB_ID
-
-    mock_delete_eventsub = mocker.patch("verifiedfirst.twitch.delete_eventsub")
-
+def add_helix_broadcaster(fake_helix, database):
+    """Add a broadcaster to the fake twitch api and the database."""
+    refresh_token = fake_helix.add_broadcaster(
+        defaults.BROADCASTER_ID, defaults.BROADCASTER_NAME, "aaaaaaaaaaaaaaaaaaaaaaaa"
+    )
     broadcaster = Broadcaster(
         id=defaults.BROADCASTER_ID,
         name=defaults.BROADCASTER_NAME,
         access_token="aaaaaaaaaaaaaaaaaaaaaaaa",
-        refresh_token="bbbbbbbbbbbbbbbbbbbbbbbb",
+        refresh_token=refresh_token,
     )
     database.session.add(broadcaster)
     database.session.commit()
+    return broadcaster
+
+
+def test_update_eventsub(helix_app, fake_helix):  # pylint: disable=unused-argument
+    """Test eventsubs are created, reused and replaced as the reward changes."""
+    broadcaster = add_helix_broadcaster(fake_helix, db)
 
     # Test new eventsub gets created if it doesn't exist
     matching_eventsub = twitch.update_eventsub(broadcaster, defaults.REWARD_ID)
     updated_broadcaster = Broadcaster.query.filter(Broadcaster.id == defaults.BROADCASTER_ID).one()
 
-    assert not mock_delete_eventsub.called
-    mock_get_eventsubs.assert_has_calls(
-        [
-            mocker.call(broadcaster),
-        ]
-    )
-    mock_create_eventsub.assert_has_calls(
-        [
-            mocker.call(broadcaster, defaults.REWARD_ID),
-        ]
-    )
-    assert matching_eventsub == defaults.EVENTSUB_ID
-    assert updated_broadcaster.eventsub_id == defaults.EVENTSUB_ID
+    assert list(fake_helix.eventsubs) == [matching_eventsub]
+    assert updated_broadcaster.eventsub_id == matching_eventsub
+    assert fake_helix.count("POST", "/helix/eventsub/subscriptions") == 1
 
     # Test that eventsub is not updated if it is already correct in the database
-    mock_get_eventsubs.reset_mock()
-    mock_create_eventsub.reset_mock()
-    mock_delete_eventsub.reset_mock()
-    mock_get_eventsubs.return_value = defaults.EVENTSUB_JSON["data"]
-
-    matching_eventsub = twitch.update_eventsub(broadcaster, defaults.REWARD_ID)
-    updated_broadcaster = Broadcaster.query.filter(Broadcaster.id == defaults.BROADCASTER_ID).one()
+    fake_helix.eventsubs[matching_eventsub]["status"] = "enabled"
+    fake_helix.requests.clear()
 
-    assert not mock_delete_eventsub.called
-    assert not mock_create_eventsub.called
-    mock_get_eventsubs.assert_has_calls(
-        [
-            mocker.call(broadcaster),
-        ]
-    )
-    assert matching_eventsub == defaults.EVENTSUB_ID
-    assert updated_broadcaster.eventsub_id == defaults.EVENTSUB_ID
+    assert twitch.update_eventsub(broadcaster, defaults.REWARD_ID) == matching_eventsub
+    assert fake_helix.count("POST", "/helix/eventsub/subscriptions") == 0
+    assert fake_helix.count("DELETE", "/helix/eventsub/subscriptions") == 0
 
     # Test that the eventsub gets updated if the reward_id changes
     new_reward_id = "79f26a1a-fd0e-48d9-a0e8-a91247261e43"
-    new_eventsub_id = "18462e51-08b5-4a54-bbe8-b818a48d7a0c"
-    mock_get_eventsubs.reset_mock()
-    mock_create_eventsub.reset_mock()
-    mock_delete_eventsub.reset_mock()
-    mock_get_eventsubs.return_value = defaults.EVENTSUB_JSON["data"]
-    mock_create_eventsub.return_value = new_eventsub_id
-    broadcaster = updated_broadcaster
-
-    matching_eventsub = twitch.update_eventsub(broadcaster, new_reward_id)
+    fake_helix.requests.clear()
+
+    new_eventsub = twitch.update_eventsub(broadcaster, new_reward_id)
     updated_broadcaster = Broadcaster.query.filter(Broadcaster.id == defaults.BROADCASTER_ID).one()
 
-    mock_delete_eventsub.assert_has_calls(
-        [
-            mocker.call(defaults.EVENTSUB_ID),
-        ]
+    assert new_eventsub != matching_eventsub
+    assert list(fake_helix.eventsubs) == [new_eventsub]
+    assert fake_helix.eventsubs[new_eventsub]["condition"]["reward_id"] == new_reward_id
+    assert updated_broadcaster.eventsub_id == new_eventsub
+    assert fake_helix.count("DELETE", "/helix/eventsub/subscriptions") == 1
+
+
+def test_update_eventsub_many_stale(helix_app, fake_helix):  # pylint: disable=unused-argument
+    """Test all stale and duplicate eventsubs are deleted, including failed ones for the reward."""
+    broadcaster = add_helix_broadcaster(fake_helix, db)
+    for i in range(20):
+        fake_helix.add_eventsub(defaults.BROADCASTER_ID, f"reward{i}")
+    fake_helix.add_eventsub(
+        defaults.BROADCASTER_ID, defaults.REWARD_ID, status="webhook_callback_verification_failed"
     )
-    mock_get_eventsubs.assert_has_calls(
-        [
-            mocker.call(broadcaster),
-        ]
+    other = fake_helix.add_eventsub(1234, defaults.REWARD_ID)
+
+    eventsub_id = twitch.update_eventsub(broadcaster, defaults.REWARD_ID)
+
+    assert sorted(fake_helix.eventsubs) == sorted([eventsub_id, other["id"]])
+    assert fake_helix.count("DELETE", "/helix/eventsub/subscriptions") == 21
+
+    # a failed eventsub for the reward is deleted alongside the stale ones if one is enabled
+    fake_helix.eventsubs[eventsub_id]["status"] = "enabled"
+    failed = fake_helix.add_eventsub(
+        defaults.BROADCASTER_ID, defaults.REWARD_ID, status="notification_failures_exceeded"
     )
-    mock_create_eventsub.assert_has_calls(
-        [
-            mocker.call(broadcaster, new_reward_id),
-        ]
+
+    assert twitch.update_eventsub(broadcaster, defaults.REWARD_ID) == eventsub_id
+    assert failed["id"] not in fake_helix.eventsubs
+
+
+def test_update_eventsub_delete_fail(helix_app, fake_helix, mocker, caplog):
+    """Test a failure to delete a stale eventsub is logged and doesn't stop the update."""
+    broadcaster = add_helix_broadcaster(fake_helix, db)
+    stale = fake_helix.add_eventsub(defaults.BROADCASTER_ID, "oldreward")
+    mocker.patch(
+        "verifiedfirst.twitch_async.AsyncTwitchClient.delete_eventsub",
+        side_effect=RequestException("test exception"),
     )
 
-    assert matching_eventsub == new_eventsub_id
-    assert updated_broadcaster.eventsub_id == new_eventsub_id
+    eventsub_id = twitch.update_eventsub(broadcaster, defaults.REWARD_ID)
+
+    assert sorted(fake_helix.eventsubs) == sorted([eventsub_id, stale["id"]])
+    assert helix_app.config["APP_ACCESS_TOKEN"] in fake_helix.app_tokens
+    assert f"failed to delete eventsub_id={stale['id']}: test exception" in [
+        rec.message for rec in caplog.records
+    ]
+
+
+def test_update_eventsub_slow_delete(helix_app, fake_helix, mocker, caplog):
+    """Test the eventsub is returned without waiting for slow deletes of stale eventsubs."""
+    broadcaster = add_helix_broadcaster(fake_helix, db)
+    existing = fake_helix.add_eventsub(defaults.BROADCASTER_ID, defaults.REWARD_ID)
+    stale = fake_helix.add_eventsub(defaults.BROADCASTER_ID, "oldreward")
+
+    async def slow_delete(eventsub_id):  # pylint: disable=unused-argument
+        await asyncio.sleep(60)
+
+    mocker.patch(
+        "verifiedfirst.twitch_async.AsyncTwitchClient.delete_eventsub", side_effect=slow_delete
+    )
+    helix_app.config["EVENTSUB_DELETE_TIMEOUT"] = 0.01
+
+    start = time.monotonic()
+    eventsub_id = twitch.update_eventsub(broadcaster, defaults.REWARD_ID)
+
+    assert time.monotonic() - start < 5
+    assert eventsub_id == existing["id"]
+    assert sorted(fake_helix.eventsubs) == sorted([existing["id"], stale["id"]])
+    assert (
+        f"left 1 stale eventsub(s) for broadcaster_id={defaults.BROADCASTER_ID} to "
+        "verifiedfirst-reconcile" in [rec.message for rec in caplog.records]
+    )
 
 
 def test_get_users_by_login(app, requests_mock):  # pylint: disable=unused-argument
@@ -867,6 +943,7 @@ def test_upsert_user_update(app, init_db):
 
 def test_add_first(app, init_db, patch_current_time):
     """Test add_first function."""
+    subscription = app.extensions["firsts_pubsub"].subscribe(defaults.BROADCASTER_ID)
     with patch_current_time("2000-01-01"):
         init_db(app)
         first1 = twitch.add_first(defaults.BROADCASTER_ID, 1001, "testuser1")
@@ -881,6 +958,9 @@ def test_add_first(app, init_db, patch_current_time):
         assert first2.broadcaster_id == defaults.BROADCASTER_ID
         assert first2.timestamp == datetime(2000, 1, 1, 0, 0, 0)
 
+    # new firsts are published for /firsts/stream connections
+    assert [subscription.get(0), subscription.get(0)] == ["testuser1", "testuser2"]
+
 
 def test_get_firsts_with_user_ids(app, init_db):
     """Test get_firsts aggregates by user_id and returns the current cached username."""
@@ -897,6 +977,8 @@ def test_get_firsts_with_user_ids(app, init_db):
         database.session.add(
             First(broadcaster_id=defaults.BROADCASTER_ID, name="oldname", user_id=1001)
         )
+    database.session.flush()
+    totals.rebuild(database.session.connection())
     database.session.commit()
 
     firsts = twitch.get_firsts(broadcaster)
@@ -904,6 +986,43 @@ def test_get_firsts_with_user_ids(app, init_db):
     assert firsts == {"currentname": 3}
 
 
+def test_get_firsts_since(app, init_db):
+    """Test get_firsts_since only counts the firsts added after the given id."""
+    from verifiedfirst.models.users import User  # pylint: disable=import-outside-toplevel
+
+    database = init_db(app)
+
+    broadcaster = type("B", (), {"id": defaults.BROADCASTER_ID})()
+
+    database.session.add(User(id=1001, name="currentname"))
+    database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="legacyuser"))
+    for _ in range(3):
+        database.session.add(
+            First(broadcaster_id=defaults.BROADCASTER_ID, name="oldname", user_id=1001)
+        )
+    database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID + 1, name="otheruser"))
+    database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="legacyuser"))
+    database.session.commit()
+
+    assert twitch.get_firsts_since(broadcaster, 0) == ({"legacyuser": 2, "currentname": 3}, 6)
+    assert twitch.get_firsts_since(broadcaster, 3) == ({"legacyuser": 1, "currentname": 1}, 6)
+    assert twitch.get_firsts_since(broadcaster, 6) == ({}, 6)
+
+
+def test_get_last_first_id(app, init_db):
+    """Test the id of a broadcaster's latest first is returned."""
+    database = init_db(app)
+
+    assert twitch.get_last_first_id(defaults.BROADCASTER_ID) is None
+
+    database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="user1"))
+    database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="user2"))
+    database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID + 1, name="user1"))
+    database.session.commit()
+
+    assert twitch.get_last_first_id(defaults.BROADCASTER_ID) == 2
+
+
 def test_get_firsts_mixed_legacy_and_new(app, init_db):
     """Test get_firsts handles a mix of rows with and without user_id."""
     from verifiedfirst.models.users import User  # pylint: disable=import-outside-toplevel
@@ -924,12 +1043,15 @@ def test_get_firsts_mixed_legacy_and_new(app, init_db):
     database.session.add(
         First(broadcaster_id=defaults.BROADCASTER_ID, name="legacyuser", user_id=None)
     )
+    database.session.flush()
+    totals.rebuild(database.session.connection())
     database.session.commit()
 
     firsts = twitch.get_firsts(broadcaster)
 
     assert firsts["newuser"] == 2
     assert firsts["legacyuser"] == 1
+    assert twitch.get_firsts(broadcaster, end_time=datetime.max) == firsts
 
 
 def test_get_firsts_missing_user(app, init_db):
@@ -940,10 +1062,14 @@ def test_get_firsts_missing_user(app, init_db):
 
     # Add a First with a user_id that has no matching User row (data inconsistency)
     database.session.add(First(broadcaster_id=defaults.BROADCASTER_ID, name="ghost", user_id=9999))
+    database.session.flush()
+    totals.rebuild(database.session.connection())
     database.session.commit()
 
     with pytest.raises(ValueError):
         twitch.get_firsts(broadcaster)
+    with pytest.raises(ValueError):
+        twitch.get_firsts(broadcaster, start_time=datetime.min)
 
 
 def test_update_reward(app, init_db):
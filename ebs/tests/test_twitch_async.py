@@ -0,0 +1,241 @@
+"""Tests for the asyncio twitch api client."""
+
+import asyncio
+
+import httpx
+import pytest
+from requests.exceptions import RequestException
+
+from verifiedfirst.database import db
+from verifiedfirst.models.broadcasters import Broadcaster
+from verifiedfirst.twitch_async import AsyncTwitchClient, _get_cursor, _get_data
+
+from . import defaults
+
+
+def run(helix_app, coro_func):
+    """Run a coroutine function with a new client bound to the app config."""
+
+    async def main():
+        async with AsyncTwitchClient(helix_app.config) as client:
+            return await coro_func(client)
+
+    return asyncio.run(main())
+
+
+def add_broadcaster(fake_helix, access_token="aaaaaaaaaaaaaaaaaaaaaaaa"):
+    """Add a broadcaster to the fake api and the database."""
+    refresh_token = fake_helix.add_broadcaster(
+        defaults.BROADCASTER_ID, defaults.BROADCASTER_NAME, access_token
+    )
+    broadcaster = Broadcaster(
+        id=defaults.BROADCASTER_ID,
+        name=defaults.BROADCASTER_NAME,
+        access_token=access_token,
+        refresh_token=refresh_token,
+    )
+    db.session.add(broadcaster)
+    db.session.commit()
+    return broadcaster
+
+
+def test_get_users_by_login(helix_app, fake_helix):
+    """Test users are looked up in concurrent batches of 100 with a fresh app token."""
+    for user_id in range(250):
+        fake_helix.add_user(user_id, f"user{user_id}")
+    logins = [f"user{user_id}" for user_id in range(250)] + ["unknownuser"]
+
+    result = run(helix_app, lambda client: client.get_users_by_login(logins))
+
+    assert result == {f"user{user_id}": user_id for user_id in range(250)}
+    assert fake_helix.count("GET", "/helix/users") == 6  # 3 batches, each retried after a 401
+    assert fake_helix.count("POST", "/oauth2/token") == 1
+    assert helix_app.config["APP_ACCESS_TOKEN"] in fake_helix.app_tokens
+
+
+def test_get_users_by_id(helix_app, fake_helix):
+    """Test users can be looked up by id."""
+    fake_helix.add_user(defaults.TEST_USER_ID, defaults.TEST_USER_NAME)
+
+    result = run(helix_app, lambda client: client.get_users_by_id([defaults.TEST_USER_ID, 1]))
+
+    assert result == {defaults.TEST_USER_ID: defaults.TEST_USER_NAME}
+
+
+def test_eventsubs(helix_app, fake_helix):
+    """Test eventsubs can be created, listed and deleted concurrently."""
+    broadcaster = add_broadcaster(fake_helix)
+    stale = [fake_helix.add_eventsub(defaults.BROADCASTER_ID, f"reward{i}") for i in range(5)]
+    fake_helix.add_eventsub(1234, "otherreward")
+
+    async def update(client):
+        eventsubs = await client.get_eventsubs(broadcaster)
+        results = await asyncio.gather(
+            client.create_eventsub(broadcaster, defaults.REWARD_ID),
+            *(client.delete_eventsub(eventsub["id"]) for eventsub in eventsubs),
+        )
+        return eventsubs, results[0], await client.get_eventsubs(broadcaster)
+
+    eventsubs, eventsub_id, remaining = run(helix_app, update)
+
+    assert sorted(e["id"] for e in eventsubs) == sorted(e["id"] for e in stale)
+    assert [e["id"] for e in remaining] == [eventsub_id]
+    assert remaining[0]["condition"]["reward_id"] == defaults.REWARD_ID
+    assert fake_helix.count("POST", "/oauth2/token") == 1
+
+
+def test_iter_eventsubs(helix_app, fake_helix):
+    """Test iter_eventsubs follows the pagination cursor and applies filters."""
+    fake_helix.page_size = 3
+    for i in range(7):
+        fake_helix.add_eventsub(i, f"reward{i}")
+    failed = fake_helix.add_eventsub(8, "reward8", status="webhook_callback_verification_failed")
+
+    async def list_eventsubs(client):
+        all_eventsubs = [e async for e in client.iter_eventsubs()]
+        failed_eventsubs = [
+            e
+            async for e in client.iter_eventsubs(
+                status=failed["status"], eventsub_type=failed["type"]
+            )
+        ]
+        return all_eventsubs, failed_eventsubs
+
+    all_eventsubs, failed_eventsubs = run(helix_app, list_eventsubs)
+
+    assert all_eventsubs == list(fake_helix.eventsubs.values())
+    assert failed_eventsubs == [failed]
+
+
+def test_create_eventsub_conflict(helix_app, fake_helix):
+    """Test creating a duplicate eventsub raises a RequestException."""
+    broadcaster = add_broadcaster(fake_helix)
+    fake_helix.add_eventsub(defaults.BROADCASTER_ID, defaults.REWARD_ID)
+
+    with pytest.raises(RequestException, match="409"):
+        run(helix_app, lambda client: client.create_eventsub(broadcaster, defaults.REWARD_ID))
+
+
+def test_create_eventsub_bad_format(helix_app, mocker):
+    """Test create_eventsub raises a RequestException if the response has no eventsub id."""
+    broadcaster = mocker.Mock()
+    broadcaster.id = defaults.BROADCASTER_ID
+    mock_request = mocker.patch.object(AsyncTwitchClient, "request_twitch_api_app")
+    mock_request.return_value = httpx.Response(200, json={"data": []})
+
+    with pytest.raises(RequestException, match="could not create eventsub"):
+        run(helix_app, lambda client: client.create_eventsub(broadcaster, defaults.REWARD_ID))
+
+
+def test_delete_eventsub_not_found(helix_app, fake_helix):  # pylint: disable=unused-argument
+    """Test deleting an eventsub that doesn't exist raises a RequestException."""
+    with pytest.raises(RequestException, match="404"):
+        run(helix_app, lambda client: client.delete_eventsub(defaults.EVENTSUB_ID))
+
+
+def test_get_rewards(helix_app, fake_helix):
+    """Test rewards are requested with the broadcaster token."""
+    broadcaster = add_broadcaster(fake_helix)
+    fake_helix.rewards[defaults.BROADCASTER_ID] = defaults.REWARDS_JSON["data"]
+
+    rewards = run(helix_app, lambda client: client.get_rewards(broadcaster))
+
+    assert rewards == defaults.REWARDS_JSON["data"]
+    assert fake_helix.count("POST", "/oauth2/token") == 0
+
+
+def test_get_rewards_refresh(helix_app, fake_helix):
+    """Test an expired broadcaster token is refreshed and saved to the database."""
+    broadcaster = add_broadcaster(fake_helix)
+    fake_helix.rewards[defaults.BROADCASTER_ID] = defaults.REWARDS_JSON["data"]
+    del fake_helix.broadcaster_tokens[broadcaster.access_token]
+
+    rewards = run(helix_app, lambda client: client.get_rewards(broadcaster))
+
+    stored = db.session.get(Broadcaster, defaults.BROADCASTER_ID)
+    assert rewards == defaults.REWARDS_JSON["data"]
+    assert stored.access_token in fake_helix.broadcaster_tokens
+    assert stored.refresh_token in fake_helix.refresh_tokens
+    assert fake_helix.count("GET", "/helix/channel_points/custom_rewards") == 2
+
+
+def test_get_rewards_refresh_fail(helix_app, fake_helix):
+    """Test a RequestException is raised if the broadcaster token can't be refreshed."""
+    broadcaster = add_broadcaster(fake_helix)
+    del fake_helix.broadcaster_tokens[broadcaster.access_token]
+    fake_helix.refresh_tokens.clear()
+
+    with pytest.raises(RequestException, match="400"):
+        run(helix_app, lambda client: client.get_rewards(broadcaster))
+
+
+def test_refresh_auth_token_bad_format(helix_app, mocker):
+    """Test refresh_auth_token raises a RequestException if the response is missing tokens."""
+    mock_send = mocker.patch.object(AsyncTwitchClient, "_send")
+    mock_send.return_value = httpx.Response(
+        200, json={"access_token": "aaaa"}, request=httpx.Request("POST", "http://test")
+    )
+
+    with pytest.raises(RequestException, match="could not refresh auth token"):
+        run(helix_app, lambda client: client.refresh_auth_token(mocker.Mock()))
+
+
+def test_get_app_access_token_bad_format(helix_app, mocker):
+    """Test get_app_access_token raises a RequestException for invalid responses."""
+    mock_send = mocker.patch.object(AsyncTwitchClient, "_send")
+    request = httpx.Request("POST", "http://test")
+
+    mock_send.return_value = httpx.Response(200, json={}, request=request)
+    with pytest.raises(RequestException, match="could not get app access token"):
+        run(helix_app, lambda client: client.get_app_access_token())
+
+    mock_send.return_value = httpx.Response(200, json=["not", "a", "dict"], request=request)
+    with pytest.raises(RequestException, match="invalid response from oauth endpoint"):
+        run(helix_app, lambda client: client.get_app_access_token())
+
+
+def test_get_broadcaster_from_token(helix_app, fake_helix):
+    """Test the broadcaster that owns a token can be found."""
+    add_broadcaster(fake_helix, access_token="bbbbbbbbbbbbbbbbbbbbbbbb")
+
+    result = run(
+        helix_app, lambda client: client.get_broadcaster_from_token("bbbbbbbbbbbbbbbbbbbbbbbb")
+    )
+
+    assert result == (defaults.BROADCASTER_NAME, defaults.BROADCASTER_ID)
+
+
+def test_get_broadcaster_from_token_invalid(
+    helix_app, fake_helix
+):  # pylint: disable=unused-argument
+    """Test get_broadcaster_from_token raises a RequestException for an invalid token."""
+    with pytest.raises(RequestException, match="could not get broadcaster"):
+        run(helix_app, lambda client: client.get_broadcaster_from_token("invalid"))
+
+
+def test_connection_error(helix_app, fake_helix):
+    """Test transport errors are raised as a RequestException."""
+    fake_helix.stop()
+
+    with pytest.raises(RequestException, match="request to .* failed"):
+        run(helix_app, lambda client: client.delete_eventsub(defaults.EVENTSUB_ID))
+
+
+def test_get_cursor():
+    """Test _get_cursor only returns valid pagination cursors."""
+    assert _get_cursor(httpx.Response(200, json={"pagination": {"cursor": "abc"}})) == "abc"
+    assert _get_cursor(httpx.Response(200, json={"pagination": {}})) is None
+    assert _get_cursor(httpx.Response(200, json={"pagination": {"cursor": 1}})) is None
+    assert _get_cursor(httpx.Response(200, text="{")) is None
+
+
+def test_get_data_bad_format():
+    """Test _get_data raises a RequestException if the response has no data list."""
+    for response in [
+        httpx.Response(200, json={"data": {}}),
+        httpx.Response(200, json={}),
+        httpx.Response(200, json="not json"),
+        httpx.Response(200, text="{"),
+    ]:
+        with pytest.raises(RequestException, match="test error"):
+            _get_data(response, "test error")
@@ -1,19 +1,21 @@
 """Initialize the app."""
 
-import logging
 import sys
 from typing import TypeVar
 
 from flask import Flask
 from flask_cors import CORS
 
+from verifiedfirst import compress, log, profiling, totals
+from verifiedfirst.cache import TTLCache
 from verifiedfirst.config import Config
 from verifiedfirst.database import db
+from verifiedfirst.extension_jwt import ExtensionJWTSigner
+from verifiedfirst.extension_pubsub import ExtensionPubSub
+from verifiedfirst.metrics import queries
+from verifiedfirst.pubsub import PubSub
 
-logging.basicConfig(
-    stream=sys.stdout,
-    format="%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s",
-)
+log.configure()
 
 
 def create_app(config_class: type = Config) -> Flask:
@@ -41,20 +43,42 @@ def create_app(config_class: type = Config) -> Flask:
         app.logger.error("error setting log level: %s", exp)
         sys.exit(1)
 
+    # configure log format and request ids
+    log.init_app(app)
+
     # initialize database
     db.init_app(app)
+    with app.app_context():
+        queries.init_app(app, db.engine)
+    totals.init_app(app)
+
+    # initialize caches
+    app.extensions["rewards_cache"] = TTLCache(app.config["REWARDS_CACHE_TTL"])
+    app.extensions["leaderboard_cache"] = TTLCache(
+        app.config["LEADERBOARD_CACHE_TTL"], app.config["LEADERBOARD_CACHE_SIZE"]
+    )
+    app.extensions["extension_jwt"] = ExtensionJWTSigner(app.config["EXTENSION_SECRET"])
+    app.extensions["firsts_pubsub"] = PubSub(app.config["STREAM_MAX_CLIENTS"])
+    app.extensions["extension_pubsub"] = ExtensionPubSub(
+        app.config, app.extensions["extension_jwt"], app.logger
+    )
 
     # import blueprints
     # pylint: disable=import-outside-toplevel
     import verifiedfirst.errors.handlers as error_handlers
     import verifiedfirst.main.routes as main_routes
     import verifiedfirst.auth.routes as auth_routes
+    import verifiedfirst.metrics.routes as metrics_routes
 
     # pylint: disable=
 
     app.register_blueprint(error_handlers.bp)
     app.register_blueprint(main_routes.bp)
     app.register_blueprint(auth_routes.bp)
+    app.register_blueprint(metrics_routes.bp)
+
+    compress.init_app(app)
+    profiling.init_app(app)
 
     return app
 
@@ -88,3 +112,9 @@ def validate_config(config_class: type[C]) -> None:
 
     if not config_class.SQLALCHEMY_DATABASE_URI:
         raise ValueError(f"Missing env var {config_class.PREFIX}SQLALCHEMY_DATABASE_URI")
+
+    if config_class.LOG_FORMAT not in ("text", "json"):
+        raise ValueError(f"{config_class.PREFIX}LOG_FORMAT must be 'text' or 'json'")
+
+    if not 1 <= config_class.COMPRESS_LEVEL <= 9:
+        raise ValueError(f"{config_class.PREFIX}COMPRESS_LEVEL must be between 1 and 9")
@@ -0,0 +1,72 @@
+"""Simple in-process caches."""
+
+import threading
+import time
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """Thread safe mapping where entries expire after a fixed number of seconds.
+
+    Each worker process has its own cache, so the ttl should be short enough that serving a stale
+    value from one worker after another has invalidated its copy is acceptable.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024) -> None:
+        """Create a new cache.
+
+        :param ttl: number of seconds entries are kept for, caching is disabled if this is 0
+        :param maxsize: maximum number of entries, the oldest entries are evicted first
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: dict[K, tuple[float, V]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        """Get a value from the cache.
+
+        :param key: key to look up
+        :return: the cached value, or None if it is missing or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        """Add a value to the cache.
+
+        :param key: key to store the value under
+        :param value: value to store
+        """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            # re-insert so the dict stays ordered by expiry time
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.maxsize:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def delete(self, key: K) -> None:
+        """Remove a value from the cache if it exists.
+
+        :param key: key to remove
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all values from the cache."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,130 @@
+"""Compression of response bodies, negotiated with the Accept-Encoding header.
+
+Responses are compressed with the first of COMPRESS_ENCODINGS that is installed and accepted by the
+client. Only json, msgpack and text bodies of at least COMPRESS_MIN_SIZE bytes are compressed.
+Streamed responses (e.g. /firsts/stream), responses without a body (e.g. 304) and already encoded
+ones are left alone.
+
+zstd (in the standard library from python 3.14) and brotli (the optional brotli extra) give smaller
+bodies than gzip for the same CPU on repetitive json like leaderboards, see
+tests/benchmarks/test_compress.py.
+"""
+
+import gzip
+import importlib
+from typing import Any
+
+from flask import Flask, Response, current_app, request
+
+# bodies of other types are usually small or already compressed e.g. images
+COMPRESSIBLE_MIMETYPES = ("application/msgpack",)
+
+
+def import_optional(name: str) -> Any:
+    """Import a module that may not be installed.
+
+    :param name: name of the module
+    :return: the module, or None if it isn't installed
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+brotli = import_optional("brotli")
+zstd = import_optional("compression.zstd")
+
+
+def available(encodings: list[str]) -> list[str]:
+    """Filter content encodings to the ones that are installed.
+
+    :param encodings: names of the encodings, in order of preference
+    :return: names of the installed encodings, in the same order
+    """
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstd is not None}
+    return [encoding for encoding in encodings if installed.get(encoding)]
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Compress data with a content encoding.
+
+    :param data: data to compress
+    :param encoding: one of the installed content encodings
+    :param level: compression level, from 1 (fastest) to 9 (smallest)
+    :return: the compressed data
+    """
+    compressed: bytes
+    if encoding == "zstd":
+        compressed = zstd.compress(data, level)
+    elif encoding == "br":
+        compressed = brotli.compress(data, quality=level)
+    else:
+        # a fixed mtime so the same body always compresses to the same bytes
+        compressed = gzip.compress(data, level, mtime=0)
+
+    return compressed
+
+
+def init_app(app: Flask) -> None:
+    """Compress the responses of an app, unless none of the configured encodings are installed.
+
+    :param app: app to compress responses for
+    """
+    encodings = available(app.config["COMPRESS_ENCODINGS"])
+    app.extensions["compress_encodings"] = encodings
+    if encodings:
+        app.after_request(compress_response)
+
+
+def compressible(response: Response) -> bool:
+    """Check if the body of a response is worth compressing.
+
+    :param response: response to check
+    :return: True if the response has a complete json, msgpack or text body with no encoding
+    """
+    if response.direct_passthrough or response.is_streamed or response.content_encoding:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if response.cache_control.no_transform:
+        return False
+
+    mimetype = response.mimetype or ""
+    return response.is_json or mimetype.startswith("text/") or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def negotiate(size: int) -> str | None:
+    """Choose the content encoding for a body sent in response to the current request.
+
+    :param size: size of the uncompressed body in bytes
+    :return: name of the encoding, or None if the body should be sent uncompressed
+    """
+    if size < current_app.config["COMPRESS_MIN_SIZE"]:
+        return None
+
+    encoding: str | None = request.accept_encodings.best_match(
+        current_app.extensions["compress_encodings"]
+    )
+    return encoding
+
+
+def compress_response(response: Response) -> Response:
+    """Compress the body of a response if the client accepts one of the installed encodings.
+
+    :param response: response to compress
+    :return: the response
+    """
+    if not compressible(response):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    encoding = negotiate(len(data))
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding, current_app.config["COMPRESS_LEVEL"]))
+    response.content_encoding = encoding
+
+    return response
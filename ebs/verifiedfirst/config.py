@@ -24,4 +24,53 @@ class Config:
     TWITCH_API_BASEURL: str = (
         os.environ.get(f"{PREFIX}TWITCH_API_BASEURL") or "https://api.twitch.tv/helix"
     )
+    TWITCH_AUTH_URL: str = (
+        os.environ.get(f"{PREFIX}TWITCH_AUTH_URL") or "https://id.twitch.tv/oauth2/token"
+    )
     REQUEST_TIMEOUT: int = int((os.environ.get(f"{PREFIX}REQUEST_TIMEOUT") or 5))
+    # maximum number of concurrent requests to the twitch api for a single operation
+    TWITCH_MAX_CONCURRENCY: int = int((os.environ.get(f"{PREFIX}TWITCH_MAX_CONCURRENCY") or 10))
+    # seconds a config page save waits for stale eventsubs to be deleted once the eventsub is known,
+    # any left are deleted by verifiedfirst-reconcile, set to 0 to not wait for them at all
+    EVENTSUB_DELETE_TIMEOUT: float = float(
+        (os.environ.get(f"{PREFIX}EVENTSUB_DELETE_TIMEOUT") or 1)
+    )
+    # number of seconds reward lists are cached for, set to 0 to disable caching
+    REWARDS_CACHE_TTL: int = int((os.environ.get(f"{PREFIX}REWARDS_CACHE_TTL") or 30))
+    # database queries taking longer than this many milliseconds are logged, set to 0 to disable
+    SLOW_QUERY_THRESHOLD_MS: int = int((os.environ.get(f"{PREFIX}SLOW_QUERY_THRESHOLD_MS") or 250))
+    # directory to write request profiles to, profiling is disabled (with no overhead) if unset
+    PROFILE_DIR = os.environ.get(f"{PREFIX}PROFILE_DIR") or ""
+    # requests with an X-Profile header matching this secret are profiled
+    PROFILE_SECRET = os.environ.get(f"{PREFIX}PROFILE_SECRET") or ""
+    # fraction of all requests to profile e.g. 0.01 for 1%
+    PROFILE_SAMPLE_RATE: float = float((os.environ.get(f"{PREFIX}PROFILE_SAMPLE_RATE") or 0))
+    # format of the logs written to stdout, "text" or "json"
+    LOG_FORMAT = os.environ.get(f"{PREFIX}LOG_FORMAT") or "text"
+    # fraction of high volume INFO messages (e.g. per webhook) to log
+    LOG_SAMPLE_RATE: float = float((os.environ.get(f"{PREFIX}LOG_SAMPLE_RATE") or 1))
+    # seconds between keepalive comments sent on idle /firsts/stream connections
+    STREAM_KEEPALIVE: int = int((os.environ.get(f"{PREFIX}STREAM_KEEPALIVE") or 15))
+    # seconds a /firsts/stream connection is kept open before the client has to reconnect
+    STREAM_TIMEOUT: int = int((os.environ.get(f"{PREFIX}STREAM_TIMEOUT") or 300))
+    # maximum number of open /firsts/stream connections per worker, each one needs a gunicorn
+    # thread (see GUNICORN_THREADS), set to 0 to disable streams
+    STREAM_MAX_CLIENTS: int = int((os.environ.get(f"{PREFIX}STREAM_MAX_CLIENTS") or 0))
+    # seconds encoded /firsts responses are cached for, they are refreshed as soon as a first is
+    # added so this only bounds how long other changes take to show, set to 0 to disable caching
+    LEADERBOARD_CACHE_TTL: int = int((os.environ.get(f"{PREFIX}LEADERBOARD_CACHE_TTL") or 300))
+    # maximum number of encoded /firsts responses cached per worker
+    LEADERBOARD_CACHE_SIZE: int = int((os.environ.get(f"{PREFIX}LEADERBOARD_CACHE_SIZE") or 256))
+    # content encodings to compress responses with, in order of preference, encodings that aren't
+    # installed are skipped, set to "identity" to disable compression
+    COMPRESS_ENCODINGS: list[str] = (
+        os.environ.get(f"{PREFIX}COMPRESS_ENCODINGS") or "zstd,br,gzip"
+    ).split(",")
+    # responses smaller than this many bytes are not compressed
+    COMPRESS_MIN_SIZE: int = int((os.environ.get(f"{PREFIX}COMPRESS_MIN_SIZE") or 1024))
+    # compression level, from 1 (fastest) to 9 (smallest)
+    COMPRESS_LEVEL: int = int((os.environ.get(f"{PREFIX}COMPRESS_LEVEL") or 5))
+    # minimum seconds between extension pubsub messages to a channel, set to 0 to disable them
+    EXTENSION_PUBSUB_INTERVAL: float = float(
+        (os.environ.get(f"{PREFIX}EXTENSION_PUBSUB_INTERVAL") or 1)
+    )
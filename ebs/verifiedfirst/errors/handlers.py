@@ -3,7 +3,14 @@
 from typing import cast
 
 from flask import Blueprint, Response, jsonify
-from werkzeug.exceptions import BadRequest, Forbidden, InternalServerError, NotFound, Unauthorized
+from werkzeug.exceptions import (
+    BadRequest,
+    Forbidden,
+    InternalServerError,
+    NotFound,
+    ServiceUnavailable,
+    Unauthorized,
+)
 
 bp = Blueprint("errors", __name__)
 
@@ -66,3 +73,15 @@ def internal_server_error(exception: InternalServerError) -> Response:
     response = jsonify({"error": exception.description})
     response.status_code = 500
     return cast(Response, response)
+
+
+@bp.app_errorhandler(503)  # type: ignore
+def service_unavailable(exception: ServiceUnavailable) -> Response:
+    """503 error response (service unavailable).
+
+    :param exception: the exception that was raised
+    :return: json formatted response
+    """
+    response = jsonify({"error": exception.description})
+    response.status_code = 503
+    return cast(Response, response)
@@ -0,0 +1,94 @@
+"""Signing of JWTs used to call the Twitch Extensions API."""
+
+import base64
+import time
+from typing import Any
+
+import jwt
+from flask import current_app
+
+from verifiedfirst.cache import TTLCache
+
+# how long each signed token is valid for
+DEFAULT_EXPIRY_SECONDS = 60
+# stop handing out a cached token this many seconds before it expires
+REFRESH_MARGIN_SECONDS = 10
+
+
+class ExtensionJWTSigner:
+    """Signs extension JWTs with the extension secret, reusing tokens until shortly before expiry.
+
+    Signed tokens are cached per (user_id, role, channel_id) so repeated calls for the same
+    broadcaster don't re-sign a token for every request.
+    """
+
+    def __init__(
+        self,
+        extension_secret: str,
+        expiry: int = DEFAULT_EXPIRY_SECONDS,
+        refresh_margin: int = REFRESH_MARGIN_SECONDS,
+    ) -> None:
+        """Create a new signer.
+
+        :param extension_secret: base64 encoded extension secret
+        :param expiry: number of seconds each token is valid for
+        :param refresh_margin: number of seconds before expiry that a new token is signed
+        """
+        self.secret = base64.b64decode(extension_secret)
+        self.expiry = expiry
+        self._tokens: TTLCache[tuple[str, str, str], str] = TTLCache(
+            max(expiry - refresh_margin, 0)
+        )
+
+    def sign(
+        self, user_id: str | int, role: str = "external", channel_id: str | int | None = None
+    ) -> str:
+        """Get a signed JWT for a user and role.
+
+        :param user_id: twitch user id the token is for
+        :param role: role to include in the token
+        :param channel_id: channel the token allows extension pubsub messages to be broadcast to
+        :return: signed JWT
+        """
+        key = (str(user_id), role, "" if channel_id is None else str(channel_id))
+        token = self._tokens.get(key)
+        if token is None:
+            payload: dict[str, Any] = {
+                "exp": int(time.time() + self.expiry),
+                "user_id": key[0],
+                "role": role,
+            }
+            if channel_id is not None:
+                payload["channel_id"] = key[2]
+                payload["pubsub_perms"] = {"send": ["broadcast"]}
+            token = jwt.encode(payload=payload, key=self.secret, algorithm="HS256")
+            self._tokens.set(key, token)
+
+        return token
+
+    def headers(
+        self,
+        client_id: str,
+        user_id: str | int,
+        role: str = "external",
+        channel_id: str | int | None = None,
+    ) -> dict[str, str]:
+        """Get headers to authenticate a request to the Extensions API.
+
+        :param client_id: client id of the extension
+        :param user_id: twitch user id the token is for
+        :param role: role to include in the token
+        :param channel_id: channel the token allows extension pubsub messages to be broadcast to
+        :return: Authorization and Client-Id headers
+        """
+        token = self.sign(user_id, role, channel_id)
+        return {"Authorization": f"Bearer {token}", "Client-Id": client_id}
+
+
+def get_signer() -> ExtensionJWTSigner:
+    """Get the JWT signer for the current app.
+
+    :return: the app's JWT signer
+    """
+    signer: ExtensionJWTSigner = current_app.extensions["extension_jwt"]
+    return signer
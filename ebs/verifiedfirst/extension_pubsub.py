@@ -0,0 +1,176 @@
+"""Broadcast leaderboard deltas to viewers with the Twitch Extension PubSub API.
+
+Instead of every open panel refetching /firsts when a first is added, the new count of the user is
+sent to the broadcast target of the channel and each viewer updates its leaderboard locally.
+
+Twitch limits how often messages can be sent to a channel, so deltas are coalesced per broadcaster
+and sent from a background thread at most once every EXTENSION_PUBSUB_INTERVAL seconds. Each worker
+process has its own sender, started when the first delta is added.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Mapping
+
+import requests
+
+from verifiedfirst.extension_jwt import ExtensionJWTSigner
+from verifiedfirst.metrics import registry as metrics
+
+ENDPOINT = "/extensions/pubsub"
+# deltas per message, keeps messages well under the 5KB limit
+MAX_DELTAS_PER_MESSAGE = 50
+
+
+class ExtensionPubSub:  # pylint: disable=too-many-instance-attributes
+    """Coalesces leaderboard deltas per broadcaster and broadcasts them to the extension."""
+
+    def __init__(
+        self, config: Mapping[str, Any], signer: ExtensionJWTSigner, logger: logging.Logger
+    ) -> None:
+        """Create a new sender.
+
+        :param config: app config containing the twitch api settings
+        :param signer: signer for the extension JWTs used to authenticate the messages
+        :param logger: logger to log failed messages to
+        """
+        self.client_id = config["CLIENT_ID"]
+        self.url = f"{config['TWITCH_API_BASEURL']}{ENDPOINT}"
+        self.timeout = config["REQUEST_TIMEOUT"]
+        self.interval: float = config["EXTENSION_PUBSUB_INTERVAL"]
+        self.signer = signer
+        self.logger = logger
+        self.session = requests.Session()
+        # broadcaster id -> user name -> latest delta for the user
+        self._pending: dict[int, dict[str, dict[str, Any]]] = {}
+        # broadcaster id -> time a message can next be sent to the channel
+        self._next_send: dict[int, float] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether deltas are broadcast, disabled by setting EXTENSION_PUBSUB_INTERVAL to 0."""
+        return self.interval > 0
+
+    def add(self, broadcaster_id: int, name: str, count: int, first_id: int) -> None:
+        """Queue a delta to be broadcast to a channel.
+
+        Deltas for the same user are merged, so only the latest count is sent.
+
+        :param broadcaster_id: id of the channel
+        :param name: name of the user that was first
+        :param count: new total count of the user's firsts
+        :param first_id: id of the first that was added
+        """
+        with self._cond:
+            deltas = self._pending.setdefault(broadcaster_id, {})
+            added = deltas[name]["added"] + 1 if name in deltas else 1
+            deltas[name] = {"name": name, "count": count, "added": added, "id": first_id}
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self) -> float | None:
+        """Send the pending deltas of the channels that can be sent to now.
+
+        :return: seconds until more deltas can be sent, or None if there are none pending
+        """
+        now = time.monotonic()
+        messages = []
+        with self._cond:
+            for broadcaster_id, deltas in list(self._pending.items()):
+                if self._next_send.get(broadcaster_id, 0.0) > now:
+                    continue
+                names = list(deltas)[:MAX_DELTAS_PER_MESSAGE]
+                messages.append((broadcaster_id, [deltas.pop(name) for name in names]))
+                if not deltas:
+                    del self._pending[broadcaster_id]
+                self._next_send[broadcaster_id] = now + self.interval
+
+        for broadcaster_id, message in messages:
+            self.send(broadcaster_id, message)
+
+        with self._cond:
+            now = time.monotonic()
+            for broadcaster_id, next_send in list(self._next_send.items()):
+                if next_send <= now and broadcaster_id not in self._pending:
+                    del self._next_send[broadcaster_id]
+            if not self._pending:
+                return None
+            next_send = min(
+                self._next_send.get(broadcaster_id, 0.0) for broadcaster_id in self._pending
+            )
+            return max(next_send - now, 0.0)
+
+    def send(self, broadcaster_id: int, deltas: list[dict[str, Any]]) -> None:
+        """Broadcast deltas to the viewers of a channel.
+
+        Deltas that were rate limited are queued again, other failures are logged and dropped.
+
+        :param broadcaster_id: id of the channel
+        :param deltas: deltas to send
+        """
+        body = {
+            "target": ["broadcast"],
+            "broadcaster_id": str(broadcaster_id),
+            "is_global_broadcast": False,
+            "message": json.dumps({"firsts": deltas}),
+        }
+        headers = self.signer.headers(self.client_id, broadcaster_id, channel_id=broadcaster_id)
+        start = time.perf_counter()
+        try:
+            resp = self.session.post(self.url, json=body, headers=headers, timeout=self.timeout)
+        except requests.RequestException as exp:
+            metrics.observe_twitch_request(
+                ENDPOINT, "POST", "extension", None, time.perf_counter() - start
+            )
+            self.logger.warning(
+                "could not send pubsub message for broadcaster_id=%s: %s", broadcaster_id, exp
+            )
+            return
+
+        metrics.observe_twitch_request(
+            ENDPOINT, "POST", "extension", resp.status_code, time.perf_counter() - start
+        )
+        if resp.status_code == requests.codes.too_many_requests:
+            reset = float(resp.headers.get("Ratelimit-Reset") or time.time() + self.interval)
+            with self._cond:
+                self._next_send[broadcaster_id] = time.monotonic() + max(
+                    reset - time.time(), self.interval
+                )
+                pending = self._pending.setdefault(broadcaster_id, {})
+                for delta in deltas:
+                    # keep newer deltas for the same user that were added while sending
+                    if delta["name"] in pending:
+                        pending[delta["name"]]["added"] += delta["added"]
+                    else:
+                        pending[delta["name"]] = delta
+            self.logger.warning(
+                "pubsub messages rate limited for broadcaster_id=%s", broadcaster_id
+            )
+        elif not resp.ok:
+            self.logger.warning(
+                "could not send pubsub message for broadcaster_id=%s: %s %s",
+                broadcaster_id,
+                resp.status_code,
+                resp.text,
+            )
+
+    def _run(self) -> None:
+        """Send deltas as they are added, until the process exits."""
+        while True:
+            try:
+                delay = self.flush()
+            except Exception:  # pylint: disable=broad-exception-caught
+                # an unexpected error must not stop broadcasts for the rest of the worker's life
+                self.logger.exception("could not send pubsub messages")
+                delay = self.interval
+            with self._cond:
+                if delay is None and not self._pending:
+                    self._cond.wait()
+                elif delay:
+                    self._cond.wait(delay)
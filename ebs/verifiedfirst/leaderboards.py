@@ -0,0 +1,95 @@
+"""Cache of encoded /firsts responses, so a cache hit only copies bytes.
+
+When a big channel goes live thousands of panels request the same leaderboard at once. Each entry
+holds the response body already encoded in the requested format, and each compressed variant once it
+has been requested, so serving a hit does no json encoding or compression.
+
+Entries are versioned by the id of the broadcaster's latest first, so a first added through any
+worker is seen on the next request. Reading it is a single index lookup per request, which is the
+only database work a cache hit does. The ttl bounds how long changes that don't add a first (e.g.
+reassign_user) take to show.
+"""
+
+import hashlib
+from collections.abc import Hashable
+from dataclasses import dataclass, field
+from typing import cast
+
+from flask import Response, current_app, request
+
+from verifiedfirst import compress
+
+
+@dataclass
+class CachedLeaderboard:
+    """An encoded leaderboard and its compressed variants."""
+
+    version: int | None
+    mimetype: str
+    body: bytes
+    etag: str
+    # compressed bodies by content encoding, added as they are first requested
+    compressed: dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def from_response(cls, resp: Response, version: int | None) -> "CachedLeaderboard":
+        """Cache the body of a response.
+
+        :param resp: response with the encoded leaderboard
+        :param version: id of the broadcaster's latest first when the leaderboard was read
+        :return: the cached leaderboard
+        """
+        body = resp.get_data()
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        return cls(version, resp.mimetype or "", body, etag)
+
+    def response(self) -> Response:
+        """Build a response for the current request, compressed if the client accepts it.
+
+        :return: the response, or a 304 response if the client already has this leaderboard
+        """
+        body, etag = self.body, self.etag
+        encoding = compress.negotiate(len(body))
+        if encoding is not None:
+            if encoding not in self.compressed:
+                # concurrent misses may compress it more than once, which is harmless
+                self.compressed[encoding] = compress.compress(
+                    body, encoding, current_app.config["COMPRESS_LEVEL"]
+                )
+            body, etag = self.compressed[encoding], f"{etag}-{encoding}"
+
+        resp = Response(body, mimetype=self.mimetype)
+        if encoding is not None:
+            resp.content_encoding = encoding
+        resp.set_etag(etag)
+        resp.vary.update(("Accept", "Accept-Encoding"))
+
+        return cast(Response, resp.make_conditional(request))
+
+
+def get(key: Hashable, version: int | None) -> CachedLeaderboard | None:
+    """Get a cached leaderboard if it is still current.
+
+    :param key: key the leaderboard was cached under
+    :param version: id of the broadcaster's latest first
+    :return: the cached leaderboard, or None if it is missing or out of date
+    """
+    leaderboard: CachedLeaderboard | None = current_app.extensions["leaderboard_cache"].get(key)
+    if leaderboard is None or leaderboard.version != version:
+        return None
+
+    return leaderboard
+
+
+def add(key: Hashable, resp: Response, version: int | None) -> CachedLeaderboard:
+    """Cache an encoded leaderboard.
+
+    :param key: key to cache the leaderboard under
+    :param resp: response with the encoded leaderboard
+    :param version: id of the broadcaster's latest first when the leaderboard was read
+    :return: the cached leaderboard
+    """
+    leaderboard = CachedLeaderboard.from_response(resp, version)
+    current_app.extensions["leaderboard_cache"].set(key, leaderboard)
+
+    return leaderboard
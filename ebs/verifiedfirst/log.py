@@ -0,0 +1,211 @@
+"""Logging configuration.
+
+Log lines can be written as plain text (the default, easier to read when running locally) or as one
+JSON object per line for log aggregation. Either way every line includes the id of the request it
+was logged for, and tokens/secrets are redacted from the output.
+
+High volume INFO messages (e.g. one per eventsub webhook) can be sampled by logging them with
+``extra=SAMPLED``, only LOG_SAMPLE_RATE of them are then written.
+"""
+
+import json
+import logging
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, UTC
+from typing import Any
+
+from flask import Flask, Response, g, has_app_context, request
+
+REQUEST_ID_HEADER = "X-Request-Id"
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s %(threadName)s [%(request_id)s] : %(message)s"
+# extra to pass when logging a message that should be sampled
+SAMPLED = {"sampled": True}
+
+# request ids accepted from clients/proxies, anything else is replaced with a new id
+REQUEST_ID_PATTERN = re.compile(r"[\w.-]{1,64}")
+REDACTED = "[REDACTED]"
+REDACT_PATTERNS = (
+    # bearer tokens e.g. in Authorization headers
+    (re.compile(r"(Bearer\s+)[^\s'\",]+", re.IGNORECASE), rf"\1{REDACTED}"),
+    # JWTs
+    (re.compile(r"eyJ[\w-]*\.[\w-]*\.[\w-]*"), REDACTED),
+    # tokens and secrets in query strings, dicts and json
+    (
+        re.compile(
+            r"\b((?:access_token|refresh_token|client_secret|token|secret)['\"]?\s*[=:]\s*"
+            r"['\"]?)[^'\"&\s,}]+"
+        ),
+        rf"\1{REDACTED}",
+    ),
+    # oauth codes, only as a query param, dict or json key (or "code=" at the start of a message)
+    # so that e.g. "status code: 500" is left alone
+    (
+        re.compile(r"((?:^|[?&])code=|['\"]code['\"]\s*:\s*['\"]?)[^'\"&\s,}]+"),
+        rf"\1{REDACTED}",
+    ),
+)
+
+
+def redact(text: str) -> str:
+    """Remove tokens and secrets from a log message.
+
+    :param text: text to redact
+    :return: the text with any tokens and secrets replaced
+    """
+    for pattern, replacement in REDACT_PATTERNS:
+        text = pattern.sub(replacement, text)
+
+    return text
+
+
+def get_request_id() -> str | None:
+    """Get the id of the request currently being handled.
+
+    :return: the request id, or None if not handling a request
+    """
+    if has_app_context():
+        request_id: str | None = g.get("request_id")
+        return request_id
+
+    return None
+
+
+class RequestIdFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """Adds the id of the current request to log records."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Add the request id to a log record.
+
+        :param record: record to add the request id to
+        :return: True so the record is always logged
+        """
+        record.request_id = get_request_id() or "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """Drops a fraction of the log records that were logged with ``extra=SAMPLED``."""
+
+    def __init__(self, rate: float = 1.0) -> None:
+        """Create a new filter.
+
+        :param rate: fraction of sampled records to keep
+        """
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Check if a log record should be logged.
+
+        :param record: record to check
+        :return: False if the record should be dropped
+        """
+        if getattr(record, "sampled", False) and record.levelno <= logging.INFO:
+            return random.random() < self.rate
+
+        return True
+
+
+class RedactingFormatter(logging.Formatter):
+    """Plain text formatter that redacts tokens and secrets."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a log record.
+
+        :param record: record to format
+        :return: the formatted and redacted record
+        """
+        return redact(super().format(record))
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats log records as single line JSON objects, redacting tokens and secrets."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a log record.
+
+        :param record: record to format
+        :return: the record as a JSON object
+        """
+        entry: dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "request_id": getattr(record, "request_id", None),
+            "message": redact(record.getMessage()),
+        }
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+
+        return json.dumps(entry)
+
+
+# handler that writes all logs to stdout
+handler = logging.StreamHandler(sys.stdout)
+handler.addFilter(RequestIdFilter())
+sampler = SamplingFilter()
+handler.addFilter(sampler)
+
+
+def configure(log_format: str = "text", sample_rate: float = 1.0) -> None:
+    """Configure the format of the logs written to stdout.
+
+    :param log_format: "text" or "json"
+    :param sample_rate: fraction of sampled INFO messages to write
+    """
+    if log_format == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(RedactingFormatter(TEXT_FORMAT))
+    sampler.rate = sample_rate
+
+    root = logging.getLogger()
+    if handler not in root.handlers:
+        root.addHandler(handler)
+
+
+def init_app(app: Flask) -> None:
+    """Configure logging for an app and assign an id to each request it handles.
+
+    :param app: app to configure logging for
+    """
+    configure(app.config["LOG_FORMAT"], app.config["LOG_SAMPLE_RATE"])
+    app.before_request(start_request)
+    app.after_request(add_request_id)
+    app.teardown_request(end_request)
+
+
+def start_request() -> None:
+    """Assign an id to the current request.
+
+    The id from the X-Request-Id header is used if it was set (e.g. by a proxy) so requests can be
+    correlated across services.
+    """
+    request_id = request.headers.get(REQUEST_ID_HEADER, "")
+    if not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    g.request_id = request_id
+
+
+def add_request_id(response: Response) -> Response:
+    """Return the request id to the client.
+
+    :param response: response to the request
+    :return: the response with the X-Request-Id header set
+    """
+    if "request_id" in g:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+
+    return response
+
+
+def end_request(_exception: BaseException | None) -> None:  # pylint: disable=useless-param-doc
+    """Stop logging the request id once the request has been handled.
+
+    :param _exception: exception raised while handling the request, if any
+    """
+    g.pop("request_id", None)
@@ -1,24 +1,39 @@
 """Main routes."""
 
+import json
+import time
 from datetime import datetime
+from typing import Any, Iterator
 
 from flask import Blueprint, Response, abort, jsonify, make_response, request, current_app
 from markupsafe import escape
+import msgpack  # type: ignore[import-untyped]
 from requests import RequestException
 
-from verifiedfirst import twitch, verify
+from verifiedfirst import leaderboards, log, twitch, verify
+from verifiedfirst.metrics.registry import FIRSTS_STREAMS_OPEN
+from verifiedfirst.pubsub import PubSub, Subscription
 
 bp = Blueprint("main", __name__)
 
+# formats /firsts can be encoded as, chosen with the Accept header
+JSON_MIMETYPE = "application/json"
+COLUMNS_MIMETYPE = "application/vnd.verifiedfirst.columns+json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
 
 @bp.route("/firsts", methods=["GET"])
 @verify.token_required
 def firsts(channel_id: int, role: str) -> Response:
     """Get total count of "firsts" for each user.
 
+    The format is negotiated with the Accept header, json by default. Encoded responses are cached
+    until a first is added for the broadcaster, and have an ETag so clients can revalidate them.
+
     :param channel_id: id of the channel the extension is running on.
     :param role: role of the user making the request
-    :return: first counts by user in json format e.g {"user1": 5, "user2": 3}
+    :return: first counts by user in json format e.g {"user1": 5, "user2": 3}, or in one of the
+        formats supported by encode_firsts
     """
     del role
     # check broadcaster exists in database
@@ -34,15 +49,168 @@ def firsts(channel_id: int, role: str) -> Response:
     if "start_time" in request.args:
         start_time = datetime.fromisoformat(request.args["start_time"])
 
-    firsts_dict = twitch.get_firsts(broadcaster, end_time=end_time, start_time=start_time)
-    if not firsts_dict:
-        abort(404, "could not get firsts")
+    mimetype = request.accept_mimetypes.best_match(
+        [JSON_MIMETYPE, COLUMNS_MIMETYPE, MSGPACK_MIMETYPE], default=JSON_MIMETYPE
+    )
+    key = (broadcaster.id, start_time, end_time, mimetype)
+    # a cache hit still costs this one index lookup, deliberately: a first is usually added through
+    # another worker (the one that received the webhook) just as viewers open the leaderboard, and
+    # a per-worker version would serve them a leaderboard without it until the ttl expired. It is
+    # read before the firsts, so a first added in between makes the next request refresh them
+    version = twitch.get_last_first_id(broadcaster.id)
+    leaderboard = leaderboards.get(key, version)
+    if leaderboard is None:
+        firsts_dict = twitch.get_firsts(broadcaster, end_time=end_time, start_time=start_time)
+        if not firsts_dict:
+            abort(404, "could not get firsts")
+        leaderboard = leaderboards.add(key, encode_firsts(firsts_dict, mimetype), version)
+
+    return leaderboard.response()
+
+
+def encode_firsts(firsts_dict: dict[str, Any], mimetype: str) -> Response:
+    """Encode first counts in a format supported by /firsts.
+
+    - application/json: an object of counts by user e.g {"user1": 5, "user2": 3}
+    - application/vnd.verifiedfirst.columns+json: arrays of the names and their counts e.g
+      {"names": ["user1", "user2"], "counts": [5, 3]}, which avoids repeating the keys
+    - application/msgpack: the same object of counts as json, encoded with msgpack
+
+    :param firsts_dict: first counts by user
+    :param mimetype: mimetype of the format
+    :return: the encoded response
+    """
+    if mimetype == COLUMNS_MIMETYPE:
+        resp = jsonify({"names": list(firsts_dict), "counts": list(firsts_dict.values())})
+        resp.mimetype = COLUMNS_MIMETYPE
+    elif mimetype == MSGPACK_MIMETYPE:
+        resp = Response(msgpack.packb(firsts_dict), mimetype=MSGPACK_MIMETYPE)
+    else:
+        resp = make_response(jsonify(firsts_dict))
 
-    resp = make_response(jsonify(firsts_dict))
+    return resp
+
+
+@bp.route("/firsts/since", methods=["GET"])
+@verify.token_required
+def firsts_since(channel_id: int, role: str) -> Response:
+    """Get the count of "firsts" added for each user since a given first.
+
+    :param channel_id: id of the channel the extension is running on.
+    :param role: role of the user making the request
+    :return: first counts by user and the id of the latest first in json format e.g {"firsts":
+        {"user1": 1}, "last_id": 1234}, pass last_id as after_id to get the next update
+    """
+    del role
+    try:
+        after_id = int(request.args["after_id"])
+    except (KeyError, ValueError):
+        abort(400, "after_id must be an integer")
+
+    # check broadcaster exists in database
+    broadcaster = twitch.get_broadcaster(channel_id)
+    if broadcaster is None:
+        abort(403, "broadcaster is not authed yet")
+
+    first_counts, last_id = twitch.get_firsts_since(broadcaster, after_id)
+
+    return make_response(jsonify({"firsts": first_counts, "last_id": last_id}))
+
+
+@bp.route("/firsts/stream", methods=["GET"])
+@verify.token_required
+def firsts_stream(channel_id: int, role: str) -> Response:
+    """Stream live updates to the "firsts" leaderboard as server-sent events.
+
+    The current leaderboard is sent first as a "leaderboard" event, then a "first" event with the
+    user's new count is sent for each first added while the stream is open.
+
+    :param channel_id: id of the channel the extension is running on.
+    :param role: role of the user making the request
+    :return: text/event-stream response
+    """
+    del role
+    if not current_app.config["STREAM_MAX_CLIENTS"]:
+        abort(404, "streams are disabled")
+
+    # check broadcaster exists in database
+    broadcaster = twitch.get_broadcaster(channel_id)
+    if broadcaster is None:
+        abort(403, "broadcaster is not authed yet")
+
+    start_time = None
+    if "start_time" in request.args:
+        start_time = datetime.fromisoformat(request.args["start_time"])
+
+    firsts_dict = twitch.get_firsts(broadcaster, start_time=start_time)
+
+    pubsub: PubSub = current_app.extensions["firsts_pubsub"]
+    subscription = pubsub.subscribe(broadcaster.id)
+    if subscription is None:
+        abort(503, "too many open streams")
+
+    events = stream_firsts(
+        subscription,
+        firsts_dict,
+        current_app.config["STREAM_KEEPALIVE"],
+        current_app.config["STREAM_TIMEOUT"],
+    )
+    resp = Response(
+        events,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # called by the server when the stream ends or the client disconnects
+    resp.call_on_close(lambda: pubsub.unsubscribe(subscription))
 
     return resp
 
 
+def server_sent_event(event: str, data: Any) -> str:
+    """Format a server-sent event.
+
+    :param event: name of the event
+    :param data: data to send as json
+    :return: the formatted event
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_firsts(
+    subscription: Subscription,
+    firsts_dict: dict[str, Any],
+    keepalive: float,
+    timeout: float,
+) -> Iterator[str]:
+    """Generate the server-sent events for a leaderboard stream.
+
+    Counts are kept up to date from the names published for the subscription, so new firsts don't
+    need any database queries.
+
+    :param subscription: subscription to the broadcaster's new firsts
+    :param firsts_dict: current first counts by user
+    :param keepalive: seconds between keepalive comments when no firsts are added
+    :param timeout: seconds before the stream is closed
+    :return: iterator of server-sent events
+    """
+    FIRSTS_STREAMS_OPEN.inc()
+    try:
+        yield server_sent_event("leaderboard", firsts_dict)
+        deadline = time.monotonic() + timeout
+        while subscription.active:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            name = subscription.get(min(keepalive, remaining))
+            if name is None:
+                yield ": keepalive\n\n"
+                continue
+            firsts_dict[name] = firsts_dict.get(name, 0) + 1
+            yield server_sent_event("first", {"name": name, "count": firsts_dict[name]})
+    finally:
+        FIRSTS_STREAMS_OPEN.dec()
+
+
 @bp.route("/eventsub/create", methods=["POST"])
 @verify.token_required
 def eventsub_create(channel_id: int, role: str) -> Response:
@@ -72,6 +240,7 @@ def eventsub_create(channel_id: int, role: str) -> Response:
         abort(403, "broadcaster is not authed yet")
 
     reward_id = twitch.update_reward(broadcaster, reward_id)
+    twitch.invalidate_rewards(broadcaster.id)
 
     eventsub_id = twitch.update_eventsub(broadcaster, reward_id)
 
@@ -85,7 +254,8 @@ def rewards(channel_id: int, role: str) -> Response:
 
     :param channel_id: id of the channel the extension is running on
     :param role: role of the user making the request
-    :return: list of rewards in json format
+    :return: list of rewards in json format e.g [{"id": "...", "title": "first", "cost": 1,
+        "is_enabled": true}]
     """
     if role != "broadcaster":
         abort(403, "user role is not broadcaster")
@@ -95,7 +265,7 @@ def rewards(channel_id: int, role: str) -> Response:
     if broadcaster is None:
         abort(403, "broadcaster is not authed yet")
     try:
-        rewards_dict = twitch.get_rewards(broadcaster)
+        rewards_dict = twitch.get_cached_rewards(broadcaster)
     except RequestException:
         abort(500, "failed to get rewards for broadcaster")
 
@@ -118,7 +288,7 @@ def eventsub() -> Response:
     if not verify.verify_eventsub_message(request):
         abort(401, "could not verify hmac in eventsub message")
 
-    current_app.logger.info("hmac verified")
+    current_app.logger.debug("hmac verified")
 
     if message_type == "webhook_callback_verification":
         challenge = request_data["challenge"]
@@ -137,6 +307,7 @@ def eventsub() -> Response:
             user_id,
             user_name,
             reward_id,
+            extra=log.SAMPLED,
         )
         # TODO: check reward id is correct, check for duplicate message ids
         first = twitch.add_first(broadcaster_id, user_id, user_name)
@@ -0,0 +1,92 @@
+"""Database query instrumentation.
+
+Every statement executed by the app's engine is timed. The number of queries and the total time
+spent in the database are tracked for the current request, so N+1 query regressions show up in the
+metrics (and in the Server-Timing header when running in debug mode). Statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged with their parameters redacted, as they can contain tokens.
+"""
+
+import time
+from typing import Any
+
+from flask import Flask, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, ExecutionContext
+
+from verifiedfirst.metrics import registry
+
+
+def init_app(app: Flask, engine: Engine) -> None:
+    """Instrument the queries executed by an engine.
+
+    :param app: app the engine belongs to
+    :param engine: engine to instrument
+    """
+    threshold = app.config["SLOW_QUERY_THRESHOLD_MS"] / 1000
+
+    # pylint: disable=unused-argument,too-many-arguments,too-many-positional-arguments
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn: Connection,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: ExecutionContext | None,
+        executemany: bool,
+    ) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn: Connection,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: ExecutionContext | None,
+        executemany: bool,
+    ) -> None:
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        registry.DB_QUERY_DURATION.observe(duration)
+
+        # only requests (and not e.g. scripts) track their queries
+        if has_app_context() and "db_queries" in g:
+            g.db_queries += 1
+            g.db_time += duration
+
+        if threshold and duration >= threshold:
+            app.logger.warning(
+                "slow query (%.1f ms): %s parameters=%s",
+                duration * 1000,
+                statement,
+                redact(parameters, executemany),
+            )
+
+
+def redact(parameters: Any, executemany: bool = False) -> str:
+    """Describe the parameters of a statement without including their values.
+
+    :param parameters: parameters of the statement
+    :param executemany: whether the parameters are for multiple executions of the statement
+    :return: the type of each parameter, or the number of rows for executemany statements
+    """
+    if executemany:
+        return f"<{len(parameters)} rows>"
+
+    if isinstance(parameters, dict):
+        return str({key: type(value).__name__ for key, value in parameters.items()})
+
+    return str([type(value).__name__ for value in parameters or ()])
+
+
+def start_request() -> None:
+    """Start tracking the queries executed for the current request."""
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def server_timing() -> str:
+    """Get a Server-Timing header value describing the database queries of the current request.
+
+    :return: header value with the total database time and number of queries
+    """
+    return f'db;dur={g.db_time * 1000:.1f};desc="{g.db_queries} queries"'
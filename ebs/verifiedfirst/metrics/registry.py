@@ -0,0 +1,129 @@
+"""Prometheus metrics for the app.
+
+When the PROMETHEUS_MULTIPROC_DIR environment variable is set (e.g. when running under gunicorn with
+several workers) each worker writes its samples to that directory and the /metrics endpoint
+aggregates them, so the values cover every worker rather than whichever one served the scrape.
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+def make_multiproc_dir() -> None:
+    """Create the multiprocess directory, if it is enabled, before any metrics are defined.
+
+    Unlabeled metrics open their file in the directory as soon as they are defined, which with
+    gunicorn --preload is before any gunicorn hook has run.
+    """
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+make_multiproc_dir()
+
+# latency buckets in seconds, from fast database only requests up to slow twitch api calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter(
+    "verifiedfirst_http_requests_total",
+    "Number of http requests handled.",
+    ["blueprint", "route", "method", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "verifiedfirst_http_request_duration_seconds",
+    "Time taken to handle http requests.",
+    ["blueprint", "route", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "verifiedfirst_http_requests_in_progress",
+    "Number of http requests currently being handled.",
+    ["blueprint", "route", "method"],
+    multiprocess_mode="livesum",
+)
+FIRSTS_STREAMS_OPEN = Gauge(
+    "verifiedfirst_firsts_streams_open",
+    "Number of open /firsts/stream connections.",
+    multiprocess_mode="livesum",
+)
+
+TWITCH_REQUESTS = Counter(
+    "verifiedfirst_twitch_requests_total",
+    "Number of requests sent to the twitch api.",
+    ["endpoint", "method", "token", "status"],
+)
+TWITCH_REQUEST_DURATION = Histogram(
+    "verifiedfirst_twitch_request_duration_seconds",
+    "Time taken for the twitch api to respond.",
+    ["endpoint", "method", "token"],
+    buckets=LATENCY_BUCKETS,
+)
+TWITCH_RATE_LIMITED = Counter(
+    "verifiedfirst_twitch_rate_limited_total",
+    "Number of twitch api requests that were rate limited (429).",
+    ["endpoint", "token"],
+)
+TWITCH_RETRIES = Counter(
+    "verifiedfirst_twitch_retries_total",
+    "Number of twitch api requests retried after an unauthorized (401) response.",
+    ["endpoint", "token"],
+)
+TWITCH_TOKEN_REFRESHES = Counter(
+    "verifiedfirst_twitch_token_refreshes_total",
+    "Number of access token refreshes triggered by an unauthorized (401) response.",
+    ["token", "result"],
+)
+
+DB_QUERY_DURATION = Histogram(
+    "verifiedfirst_db_query_duration_seconds",
+    "Time taken to execute database queries.",
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "verifiedfirst_http_request_db_queries",
+    "Number of database queries executed while handling http requests.",
+    ["blueprint", "route", "method"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+
+
+def generate_metrics() -> tuple[bytes, str]:
+    """Generate the metrics in the prometheus text exposition format.
+
+    :return: the encoded metrics and their content type
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def observe_twitch_request(
+    endpoint: str, method: str, token: str, status: int | None, duration: float
+) -> None:
+    """Record a request sent to the twitch api.
+
+    :param endpoint: path of the endpoint relative to the api base url e.g. "/users"
+    :param method: http method of the request
+    :param token: kind of access token used, "app", "broadcaster" or "extension" (JWT)
+    :param status: http status of the response, or None if no response was received
+    :param duration: seconds taken to get the response
+    """
+    TWITCH_REQUESTS.labels(endpoint, method, token, status or "error").inc()
+    TWITCH_REQUEST_DURATION.labels(endpoint, method, token).observe(duration)
+    if status == 429:
+        TWITCH_RATE_LIMITED.labels(endpoint, token).inc()
@@ -0,0 +1,73 @@
+"""Request instrumentation and the /metrics endpoint."""
+
+import time
+
+from flask import Blueprint, Response, current_app, g, make_response, request
+
+from verifiedfirst.metrics import queries, registry
+
+bp = Blueprint("metrics", __name__)
+
+
+def _labels() -> tuple[str, str, str]:
+    """Get the labels identifying the current request.
+
+    The route template is used rather than the path so that ids in urls don't create new series,
+    requests that don't match any route are grouped together.
+
+    :return: the blueprint, route and method of the request
+    """
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    return request.blueprint or "", route, request.method
+
+
+@bp.before_app_request
+def start_timer() -> None:
+    """Record the start of a request."""
+    g.metrics_start = time.perf_counter()
+    queries.start_request()
+    registry.HTTP_REQUESTS_IN_PROGRESS.labels(*_labels()).inc()
+
+
+@bp.after_app_request
+def record_request(response: Response) -> Response:
+    """Record the latency, status and number of database queries of a request.
+
+    In debug mode the time spent in the database is added to the response as a Server-Timing header.
+
+    :param response: response to the request
+    :return: the unmodified response
+    """
+    if "metrics_start" in g:
+        labels = _labels()
+        registry.HTTP_REQUEST_DURATION.labels(*labels).observe(
+            time.perf_counter() - g.metrics_start
+        )
+        registry.HTTP_REQUESTS.labels(*labels, str(response.status_code)).inc()
+        registry.HTTP_REQUEST_DB_QUERIES.labels(*labels).observe(g.db_queries)
+        if current_app.debug:
+            response.headers["Server-Timing"] = queries.server_timing()
+
+    return response
+
+
+@bp.teardown_app_request
+def end_request(_exception: BaseException | None) -> None:  # pylint: disable=useless-param-doc
+    """Record the end of a request, even if handling it failed.
+
+    :param _exception: exception raised while handling the request, if any
+    """
+    # only count requests that were started, e.g. not test request contexts
+    if g.pop("metrics_start", None) is not None:
+        registry.HTTP_REQUESTS_IN_PROGRESS.labels(*_labels()).dec()
+        g.pop("db_queries")
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    """Expose metrics to be scraped by prometheus.
+
+    :return: metrics in the prometheus text exposition format
+    """
+    data, content_type = registry.generate_metrics()
+    return make_response(data, 200, {"Content-Type": content_type})
@@ -0,0 +1,29 @@
+"""first_totals.py."""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from verifiedfirst.database import db
+
+
+# pylint: disable=invalid-name
+@dataclass
+class FirstTotal(db.Model):  # type: ignore
+    """Database model to store the running total of each user's "firsts" for a broadcaster.
+
+    Firsts with a user_id are totalled by user_id, legacy firsts with no user_id by name.
+    """
+
+    __tablename__ = "first_totals"
+    # one total per user, reads a broadcaster's totals in a single index scan
+    __table_args__ = (
+        db.Index(
+            "ix_first_totals_broadcaster_id_user_id", "broadcaster_id", "user_id", unique=True
+        ),
+    )
+
+    id: int = db.Column(db.Integer, primary_key=True)
+    broadcaster_id: int = db.Column(db.Integer, nullable=False)
+    user_id: Optional[int] = db.Column(db.Integer, db.ForeignKey("twitch_user.id"), nullable=True)
+    name: str = db.Column(db.String, nullable=False)
+    count: int = db.Column(db.Integer, nullable=False, default=0)
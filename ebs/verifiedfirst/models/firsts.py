@@ -13,6 +13,8 @@ class First(db.Model):  # type: ignore
     """Database model to store "first" channel point redemptions."""
 
     __allow_unmapped__ = True
+    # serves a broadcaster's firsts in id order, e.g. the firsts added since a given id
+    __table_args__ = (db.Index("ix_first_broadcaster_id_id", "broadcaster_id", "id"),)
 
     id: int = db.Column(db.Integer, primary_key=True)
     name: str = db.Column(db.String, nullable=False)
@@ -0,0 +1,83 @@
+"""Opt-in profiling of individual requests.
+
+Profiling is enabled by setting PROFILE_DIR. A request is then profiled with cProfile if it has an
+X-Profile header matching PROFILE_SECRET, or if it is picked by sampling PROFILE_SAMPLE_RATE of all
+requests. Each profile is written to PROFILE_DIR with the route and timing in the filename, and can
+be inspected with e.g. ``python -m pstats`` or snakeviz.
+
+When PROFILE_DIR isn't set no hooks are registered, so requests have no extra overhead.
+"""
+
+import cProfile
+import hmac
+import os
+import random
+import time
+
+from flask import Flask, current_app, g, request
+
+PROFILE_HEADER = "X-Profile"
+
+
+def init_app(app: Flask) -> None:
+    """Register the profiling hooks if profiling is enabled.
+
+    :param app: app to profile requests for
+    """
+    if not app.config["PROFILE_DIR"]:
+        return
+
+    os.makedirs(app.config["PROFILE_DIR"], exist_ok=True)
+    app.before_request(start_profile)
+    app.teardown_request(stop_profile)
+    app.logger.warning("request profiling is enabled, writing to %s", app.config["PROFILE_DIR"])
+
+
+def should_profile() -> bool:
+    """Check if the current request should be profiled.
+
+    :return: True if the request has a valid profiling header or was sampled
+    """
+    secret = current_app.config["PROFILE_SECRET"]
+    header = request.headers.get(PROFILE_HEADER)
+    if secret and header and hmac.compare_digest(header.encode(), secret.encode()):
+        return True
+
+    sample_rate: float = current_app.config["PROFILE_SAMPLE_RATE"]
+    return random.random() < sample_rate
+
+
+def start_profile() -> None:
+    """Start profiling the current request if it should be profiled."""
+    if not should_profile():
+        return
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as exp:
+        # only one profiler can be active at a time
+        current_app.logger.warning("could not start profiling request: %s", exp)
+        return
+
+    g.profile = profile
+    g.profile_start = time.perf_counter()
+
+
+def stop_profile(_exception: BaseException | None) -> None:  # pylint: disable=useless-param-doc
+    """Stop profiling the current request and write the profile to the profile directory.
+
+    :param _exception: exception raised while handling the request, if any
+    """
+    profile = g.pop("profile", None)
+    if profile is None:
+        return
+
+    profile.disable()
+    duration_ms = (time.perf_counter() - g.pop("profile_start")) * 1000
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    name = route.strip("/").replace("/", "_") or "root"
+    filename = f"{name}.{request.method}.{duration_ms:.0f}ms.{time.time_ns()}.prof"
+    path = os.path.join(current_app.config["PROFILE_DIR"], filename)
+    profile.dump_stats(path)
+    current_app.logger.info("wrote profile for %s %s to %s", request.method, route, path)
@@ -0,0 +1,108 @@
+"""In-process publish/subscribe of new firsts, used to push live leaderboard updates.
+
+Each worker process has its own PubSub, so a stream only receives the firsts added by the worker it
+is connected to. Streams are closed after STREAM_TIMEOUT seconds and send the full leaderboard again
+when the client reconnects, which bounds how stale a viewer connected to another worker can get.
+"""
+
+import queue
+import threading
+from collections import defaultdict
+from typing import Any
+
+
+class Subscription:  # pylint: disable=too-few-public-methods
+    """Queue of messages published for a single subscriber."""
+
+    def __init__(self, topic: int, maxsize: int) -> None:
+        """Create a new subscription.
+
+        :param topic: topic the subscription is for
+        :param maxsize: maximum number of undelivered messages before the subscription is dropped
+        """
+        self.topic = topic
+        self.active = True
+        self.queue: queue.Queue[Any] = queue.Queue(maxsize)
+
+    def get(self, timeout: float) -> Any | None:
+        """Wait for the next message.
+
+        :param timeout: maximum number of seconds to wait
+        :return: the message, or None if no message was published before the timeout
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class PubSub:
+    """Thread safe fan out of messages to the subscribers of a topic e.g. a broadcaster id."""
+
+    def __init__(self, max_subscribers: int = 1000, maxsize: int = 100) -> None:
+        """Create a new pubsub.
+
+        :param max_subscribers: maximum number of subscriptions across all topics
+        :param maxsize: maximum number of undelivered messages for each subscriber, slow subscribers
+            are dropped rather than buffering messages for them indefinitely
+        """
+        self.max_subscribers = max_subscribers
+        self.maxsize = maxsize
+        self._subscriptions: dict[int, set[Subscription]] = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: int) -> Subscription | None:
+        """Subscribe to the messages published for a topic.
+
+        :param topic: topic to subscribe to
+        :return: the subscription, or None if the maximum number of subscribers has been reached
+        """
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscription = Subscription(topic, self.maxsize)
+            self._subscriptions[topic].add(subscription)
+            self._count += 1
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop receiving messages for a subscription.
+
+        :param subscription: subscription to remove
+        """
+        with self._lock:
+            self._remove(subscription)
+
+    def publish(self, topic: int, message: Any) -> int:
+        """Send a message to all subscribers of a topic.
+
+        :param topic: topic to publish the message for
+        :param message: message to send
+        :return: number of subscribers the message was sent to
+        """
+        sent = 0
+        with self._lock:
+            for subscription in list(self._subscriptions.get(topic, ())):
+                try:
+                    subscription.queue.put_nowait(message)
+                    sent += 1
+                except queue.Full:
+                    self._remove(subscription)
+
+        return sent
+
+    def _remove(self, subscription: Subscription) -> None:
+        """Remove a subscription, the lock must be held.
+
+        :param subscription: subscription to remove
+        """
+        if not subscription.active:
+            return
+        subscription.active = False
+        self._count -= 1
+        subscribers = self._subscriptions[subscription.topic]
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscriptions[subscription.topic]
@@ -0,0 +1,227 @@
+"""Reconcile the eventsubs registered with twitch against the broadcasters in the database."""
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from flask import current_app
+from requests.exceptions import RequestException
+
+from verifiedfirst import create_app
+from verifiedfirst.database import db
+from verifiedfirst.models.broadcasters import Broadcaster
+from verifiedfirst.twitch_async import REDEMPTION_EVENTSUB_TYPE, AsyncTwitchClient
+
+# eventsubs with any other status will never deliver notifications and need to be recreated
+ACTIVE_STATUSES = ("enabled", "webhook_callback_verification_pending")
+
+
+@dataclass
+class ReconcileStats:
+    """Summary of the changes made (or that would be made) by a reconcile run."""
+
+    eventsubs: int = 0
+    skipped: int = 0
+    kept: int = 0
+    deleted: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+
+
+@dataclass
+class ReconcilePlan:
+    """Changes required to bring the eventsubs in line with the database."""
+
+    keep: dict[Tuple[str, str], str] = field(default_factory=dict)
+    delete: List[str] = field(default_factory=list)
+    recreate: dict[Tuple[str, str], List[str]] = field(default_factory=dict)
+    create: List[Broadcaster] = field(default_factory=list)
+
+
+async def plan(client: AsyncTwitchClient, stats: ReconcileStats) -> ReconcilePlan:
+    """Page through all eventsubs once and diff them against the broadcaster table.
+
+    :param client: twitch api client to use
+    :param stats: stats to record the number of eventsubs seen in
+    :return: plan of the changes to make
+    """
+    broadcasters = {
+        (str(broadcaster.id), broadcaster.reward_id): broadcaster
+        for broadcaster in Broadcaster.query.all()
+        if broadcaster.reward_id
+    }
+    callback = current_app.config["EVENTSUB_CALLBACK_URL"]
+
+    result = ReconcilePlan()
+    other_deployments: set[Tuple[str, str]] = set()
+    async for eventsub in client.iter_eventsubs(eventsub_type=REDEMPTION_EVENTSUB_TYPE):
+        stats.eventsubs += 1
+        condition = eventsub["condition"]
+        key = (condition["broadcaster_user_id"], condition["reward_id"])
+
+        if eventsub["transport"].get("callback") != callback:
+            # leave eventsubs created by other deployments of the extension alone
+            stats.skipped += 1
+            other_deployments.add(key)
+            continue
+        if key not in broadcasters:
+            current_app.logger.info("orphaned eventsub_id=%s for %s", eventsub["id"], key)
+            result.delete.append(eventsub["id"])
+        elif eventsub["status"] in ACTIVE_STATUSES and key not in result.keep:
+            result.keep[key] = eventsub["id"]
+        else:
+            current_app.logger.info(
+                "%s eventsub_id=%s for %s", eventsub["status"], eventsub["id"], key
+            )
+            result.recreate.setdefault(key, []).append(eventsub["id"])
+
+    for key in list(result.recreate):
+        if key in result.keep or key in other_deployments:
+            # an active eventsub already exists, or twitch would reject a new one because another
+            # deployment has one with the same condition, so the others are just deleted
+            result.delete.extend(result.recreate.pop(key))
+    for key in sorted((broadcasters.keys() & other_deployments) - result.keep.keys()):
+        current_app.logger.warning(
+            "eventsub for %s belongs to another deployment, not creating one", key
+        )
+    result.create = [
+        broadcaster
+        for key, broadcaster in broadcasters.items()
+        if key not in result.keep and key not in other_deployments
+    ]
+
+    return result
+
+
+async def apply(
+    client: AsyncTwitchClient, reconcile_plan: ReconcilePlan, stats: ReconcileStats
+) -> dict[int, str]:
+    """Delete and create eventsubs concurrently according to a plan.
+
+    :param client: twitch api client to use
+    :param reconcile_plan: plan of the changes to make
+    :param stats: stats to record the changes in
+    :return: ids of the eventsubs that were created by broadcaster id
+    """
+
+    async def delete(eventsub_id: str) -> bool:
+        try:
+            await client.delete_eventsub(eventsub_id)
+        except RequestException as exp:
+            current_app.logger.error("failed to delete eventsub_id=%s: %s", eventsub_id, exp)
+            stats.failed += 1
+            return False
+        stats.deleted += 1
+        return True
+
+    async def create(broadcaster: Broadcaster) -> Tuple[int, str | None]:
+        # twitch rejects a new eventsub while one with the same condition still exists
+        key = (str(broadcaster.id), broadcaster.reward_id)
+        deleted = await asyncio.gather(
+            *(delete(eventsub_id) for eventsub_id in reconcile_plan.recreate.get(key, []))
+        )
+        if not all(deleted):
+            # the failed deletes have already been counted
+            return broadcaster.id, None
+        try:
+            eventsub_id = await client.create_eventsub(broadcaster, broadcaster.reward_id)
+        except RequestException as exp:
+            current_app.logger.error(
+                "failed to create eventsub for broadcaster_id=%s: %s", broadcaster.id, exp
+            )
+            stats.failed += 1
+            return broadcaster.id, None
+        stats.created += 1
+        return broadcaster.id, eventsub_id
+
+    created, _ = await asyncio.gather(
+        asyncio.gather(*(create(broadcaster) for broadcaster in reconcile_plan.create)),
+        asyncio.gather(*(delete(eventsub_id) for eventsub_id in reconcile_plan.delete)),
+    )
+
+    return {
+        broadcaster_id: eventsub_id
+        for broadcaster_id, eventsub_id in created
+        if eventsub_id is not None
+    }
+
+
+async def reconcile(dry_run: bool = False, max_concurrency: int | None = None) -> ReconcileStats:
+    """Reconcile all eventsubs against the broadcaster table.
+
+    Orphaned, duplicate and failed eventsubs are deleted, missing ones are created and the eventsub
+    ids stored in the database are updated to match.
+
+    :param dry_run: only log the changes that would be made
+    :param max_concurrency: maximum number of concurrent requests to the twitch api
+    :return: summary of the changes
+    """
+    stats = ReconcileStats()
+    async with AsyncTwitchClient(
+        current_app.config,
+        max_concurrency=max_concurrency or current_app.config["TWITCH_MAX_CONCURRENCY"],
+    ) as client:
+        reconcile_plan = await plan(client, stats)
+        stats.kept = len(reconcile_plan.keep)
+
+        for broadcaster in reconcile_plan.create:
+            current_app.logger.info("missing eventsub for broadcaster_id=%s", broadcaster.id)
+
+        if dry_run:
+            stats.deleted = len(reconcile_plan.delete) + sum(
+                len(eventsub_ids) for eventsub_ids in reconcile_plan.recreate.values()
+            )
+            stats.created = len(reconcile_plan.create)
+            return stats
+
+        created = await apply(client, reconcile_plan, stats)
+
+    eventsub_ids = {
+        int(broadcaster_id): eventsub_id
+        for (broadcaster_id, _), eventsub_id in reconcile_plan.keep.items()
+    }
+    eventsub_ids.update(created)
+    for broadcaster in Broadcaster.query.all():
+        if (
+            broadcaster.id in eventsub_ids
+            and broadcaster.eventsub_id != eventsub_ids[broadcaster.id]
+        ):
+            broadcaster.eventsub_id = eventsub_ids[broadcaster.id]
+            stats.updated += 1
+    db.session.commit()
+
+    return stats
+
+
+def main() -> None:
+    """Reconcile eventsubs for every broadcaster."""
+    parser = argparse.ArgumentParser(
+        description="Reconcile the eventsubs registered with twitch against the database."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="log the changes without making them"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, help="maximum number of concurrent requests to the twitch api"
+    )
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        stats = asyncio.run(reconcile(dry_run=args.dry_run, max_concurrency=args.concurrency))
+        current_app.logger.info(
+            "%s: eventsubs=%d skipped=%d kept=%d deleted=%d created=%d updated=%d failed=%d",
+            "dry run" if args.dry_run else "reconciled",
+            stats.eventsubs,
+            stats.skipped,
+            stats.kept,
+            stats.deleted,
+            stats.created,
+            stats.updated,
+            stats.failed,
+        )
+
+
+if __name__ == "__main__":
+    main()
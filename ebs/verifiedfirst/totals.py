@@ -0,0 +1,190 @@
+"""Running totals of each user's firsts, so all time leaderboards don't count every first.
+
+The first_totals table has one row per user with a user_id, and one row per name for legacy firsts
+with no user_id. add_first increments the user's total in the same transaction as the first is
+added, scripts that change the first table rebuild the totals of the broadcasters they changed.
+Databases created before the table existed get it, filled from the first table, when the app starts.
+"""
+
+from typing import Any, cast
+
+from flask import Flask
+from sqlalchemy import (
+    Connection,
+    CursorResult,
+    Select,
+    case,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from verifiedfirst.database import db
+from verifiedfirst.models.first_totals import FirstTotal
+from verifiedfirst.models.firsts import First
+from verifiedfirst.models.users import User
+
+# identifies a total, (broadcaster_id, user_id) or (broadcaster_id, name) for legacy firsts
+TotalKey = tuple[int, int | str]
+
+
+def init_app(app: Flask) -> None:
+    """Create and fill the totals table of a database that has firsts but no totals yet.
+
+    New databases are left to create_all, which creates every table.
+
+    :param app: app to migrate the database of
+    :raises SQLAlchemyError: if the table can't be created or filled
+    """
+    with app.app_context():
+        tables = inspect(db.engine)
+        if not tables.has_table(First.__tablename__) or tables.has_table(FirstTotal.__tablename__):
+            return
+
+        app.logger.info("creating first totals from existing firsts")
+        try:
+            with db.engine.begin() as conn:
+                FirstTotal.__table__.create(conn)
+                count = rebuild(conn)
+        except SQLAlchemyError:
+            # another worker starting at the same time may have created it first
+            if not inspect(db.engine).has_table(FirstTotal.__tablename__):
+                raise
+            app.logger.info("first totals were created by another process")
+            return
+
+        app.logger.info("created %d first total(s)", count)
+
+
+def increment(broadcaster_id: int, user_id: int, user_name: str) -> None:
+    """Add one to a user's total, the caller commits it along with the first.
+
+    :param broadcaster_id: id of the broadcaster the first was added for
+    :param user_id: numeric Twitch id of the user who was first
+    :param user_name: login name of the user who was first
+    """
+    totals = FirstTotal.__table__
+    increment_total = (
+        update(totals)
+        .where(totals.c.broadcaster_id == broadcaster_id, totals.c.user_id == user_id)
+        .values(count=totals.c.count + 1, name=user_name)
+    )
+    if cast(CursorResult[Any], db.session.execute(increment_total)).rowcount:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(
+                insert(totals).values(
+                    broadcaster_id=broadcaster_id, user_id=user_id, name=user_name, count=1
+                )
+            )
+    except IntegrityError:
+        # the total was created by a concurrent first for the same user
+        db.session.execute(increment_total)
+
+
+def get_totals(broadcaster_id: int) -> dict[str, int]:
+    """Get the all time first counts for a broadcaster.
+
+    :param broadcaster_id: id of the broadcaster to get totals for
+    :raises ValueError: if a total references a user that is not in the database
+    :return: dictionary of first counts by user e.g {"user1": 5, "user2": 3}, the same as
+        twitch.get_firsts would count from the firsts
+    """
+    totals = FirstTotal.__table__
+    users = User.__table__
+    rows = db.session.execute(
+        select(totals.c.user_id, users.c.name, totals.c.name, totals.c.count)
+        .select_from(totals.outerjoin(users, users.c.id == totals.c.user_id))
+        .where(totals.c.broadcaster_id == broadcaster_id)
+    ).all()
+
+    # counted by the current cached username, or the recorded name for legacy firsts
+    first_counts: dict[str, int] = {}
+    for user_id, user_name, name, count in rows:
+        if user_id is not None:
+            if user_name is None:
+                raise ValueError(f"User {user_id} referenced in totals but not found in database")
+            name = user_name
+        first_counts[name] = first_counts.get(name, 0) + count
+
+    return first_counts
+
+
+def _count_firsts(broadcaster_id: int | None) -> Select[Any]:
+    """Build a query that counts the firsts of each total from the first table.
+
+    :param broadcaster_id: only count the firsts of this broadcaster, or all broadcasters if None
+    :return: query selecting broadcaster_id, user_id, name and count for each total
+    """
+    firsts = First.__table__
+    query = select(
+        firsts.c.broadcaster_id,
+        firsts.c.user_id,
+        func.max(firsts.c.name),  # pylint: disable=not-callable
+        func.count(),  # pylint: disable=not-callable
+    ).group_by(
+        firsts.c.broadcaster_id,
+        firsts.c.user_id,
+        case((firsts.c.user_id.is_(None), firsts.c.name)),
+    )
+    if broadcaster_id is not None:
+        query = query.where(firsts.c.broadcaster_id == broadcaster_id)
+
+    return query
+
+
+def rebuild(conn: Connection, broadcaster_id: int | None = None) -> int:
+    """Recompute totals from the first table, the caller commits them.
+
+    :param conn: connection to rebuild the totals with
+    :param broadcaster_id: only rebuild the totals of this broadcaster, or all broadcasters if None
+    :return: number of totals
+    """
+    totals = FirstTotal.__table__
+    delete_totals = delete(totals)
+    if broadcaster_id is not None:
+        delete_totals = delete_totals.where(totals.c.broadcaster_id == broadcaster_id)
+    conn.execute(delete_totals)
+    result = conn.execute(
+        insert(totals).from_select(
+            ["broadcaster_id", "user_id", "name", "count"], _count_firsts(broadcaster_id)
+        )
+    )
+
+    return result.rowcount
+
+
+def check(conn: Connection, broadcaster_id: int | None = None) -> dict[TotalKey, tuple[int, int]]:
+    """Compare the totals against the first table.
+
+    :param conn: connection to check the totals with
+    :param broadcaster_id: only check the totals of this broadcaster, or all broadcasters if None
+    :return: expected and actual count of each total that doesn't match
+    """
+
+    def key(row: Any) -> TotalKey:
+        return (row[0], row[2] if row[1] is None else row[1])
+
+    expected: dict[TotalKey, int] = {}
+    for row in conn.execute(_count_firsts(broadcaster_id)):
+        expected[key(row)] = row[3]
+
+    totals = FirstTotal.__table__
+    query = select(totals.c.broadcaster_id, totals.c.user_id, totals.c.name, totals.c.count)
+    if broadcaster_id is not None:
+        query = query.where(totals.c.broadcaster_id == broadcaster_id)
+    actual: dict[TotalKey, int] = {}
+    for row in conn.execute(query):
+        actual[key(row)] = actual.get(key(row), 0) + row[3]
+
+    return {
+        total: (expected.get(total, 0), actual.get(total, 0))
+        for total in expected.keys() | actual.keys()
+        if expected.get(total, 0) != actual.get(total, 0)
+    }
@@ -1,18 +1,29 @@
 """Functions related to the twitch api."""
 
+import asyncio
+import time
 from collections import defaultdict
-from typing import Any, List, Tuple
+from typing import Any, Iterator, List, Tuple
 from datetime import datetime
 
 from flask import current_app
 from requests import Request, Response, Session, codes, post
 from requests.exceptions import RequestException
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.exc import NoResultFound
 
+from verifiedfirst import log, totals
+from verifiedfirst.cache import TTLCache
 from verifiedfirst.models.broadcasters import Broadcaster
+from verifiedfirst.models.first_totals import FirstTotal
 from verifiedfirst.models.firsts import First
 from verifiedfirst.models.users import User
 from verifiedfirst.database import db
+from verifiedfirst.metrics import registry as metrics
+from verifiedfirst.twitch_async import AsyncTwitchClient, eventsub_filters
+
+# fields of each reward returned to the config page
+REWARD_FIELDS = ("id", "title", "cost", "is_enabled")
 
 
 def get_auth_tokens(code: str) -> Tuple[str, str]:
@@ -24,7 +35,7 @@ def get_auth_tokens(code: str) -> Tuple[str, str]:
     :return: valid access token
     """
     req = post(
-        "https://id.twitch.tv/oauth2/token",
+        current_app.config["TWITCH_AUTH_URL"],
         params={
             "client_id": current_app.config["CLIENT_ID"],
             "client_secret": current_app.config["CLIENT_SECRET"],
@@ -57,7 +68,7 @@ def get_app_access_token() -> str:
     :return: valid access token
     """
     req = post(
-        "https://id.twitch.tv/oauth2/token",
+        current_app.config["TWITCH_AUTH_URL"],
         params={
             "client_id": current_app.config["CLIENT_ID"],
             "client_secret": current_app.config["CLIENT_SECRET"],
@@ -91,7 +102,7 @@ def refresh_auth_token(broadcaster: Broadcaster) -> Broadcaster:
     :return: Broadcaster object with updated auth tokens
     """
     req = post(
-        "https://id.twitch.tv/oauth2/token",
+        current_app.config["TWITCH_AUTH_URL"],
         params={
             "client_id": current_app.config["CLIENT_ID"],
             "client_secret": current_app.config["CLIENT_SECRET"],
@@ -118,6 +129,25 @@ def refresh_auth_token(broadcaster: Broadcaster) -> Broadcaster:
     return broadcaster
 
 
+def _endpoint(request: Request) -> str:
+    """Get the endpoint a request is for, used to label metrics.
+
+    :param request: request to the twitch api
+    :return: path of the endpoint relative to the api base url e.g. "/users"
+    """
+    path = str(request.url).removeprefix(current_app.config["TWITCH_API_BASEURL"])
+    return path.partition("?")[0]
+
+
+def _token_kind(access_token: str) -> str:
+    """Get the kind of access token being used, used to label metrics.
+
+    :param access_token: access token used for the request
+    :return: "app" for the app access token, otherwise "broadcaster"
+    """
+    return "app" if access_token == current_app.config["APP_ACCESS_TOKEN"] else "broadcaster"
+
+
 def request_twitch_api(access_token: str, request: Request) -> Response:
     """Send request to twitch api.
 
@@ -126,12 +156,28 @@ def request_twitch_api(access_token: str, request: Request) -> Response:
     :return: response from the request
     """
     request.headers["Authorization"] = f"Bearer {access_token}"
+    request_id = log.get_request_id()
+    if request_id:
+        request.headers[log.REQUEST_ID_HEADER] = request_id
 
     session = Session()
 
-    resp = session.send(
-        request.prepare(),
-        timeout=current_app.config["REQUEST_TIMEOUT"],
+    endpoint = _endpoint(request)
+    token = _token_kind(access_token)
+    start = time.perf_counter()
+    try:
+        resp = session.send(
+            request.prepare(),
+            timeout=current_app.config["REQUEST_TIMEOUT"],
+        )
+    except RequestException:
+        metrics.observe_twitch_request(
+            endpoint, request.method, token, None, time.perf_counter() - start
+        )
+        raise
+
+    metrics.observe_twitch_request(
+        endpoint, request.method, token, resp.status_code, time.perf_counter() - start
     )
 
     return resp
@@ -163,7 +209,10 @@ def request_twitch_api_broadcaster(broadcaster: Broadcaster, request: Request) -
         broadcaster = refresh_auth_token(broadcaster)
     except RequestException as exp:
         current_app.logger.error("failed to refresh auth token: %s", exp)
+        metrics.TWITCH_TOKEN_REFRESHES.labels("broadcaster", "failure").inc()
         raise exp
+    metrics.TWITCH_TOKEN_REFRESHES.labels("broadcaster", "success").inc()
+    metrics.TWITCH_RETRIES.labels(_endpoint(request), "broadcaster").inc()
 
     # retry the request with a new token
     current_app.logger.debug("retrying with new auth token: %s", broadcaster.access_token)
@@ -197,7 +246,10 @@ def request_twitch_api_app(request: Request) -> Response:
         current_app.config["APP_ACCESS_TOKEN"] = access_token
     except RequestException as exp:
         current_app.logger.error("failed to refresh auth token: %s", exp)
+        metrics.TWITCH_TOKEN_REFRESHES.labels("app", "failure").inc()
         raise exp
+    metrics.TWITCH_TOKEN_REFRESHES.labels("app", "success").inc()
+    metrics.TWITCH_RETRIES.labels(_endpoint(request), "app").inc()
 
     # retry the request with a new token
     current_app.logger.debug(
@@ -288,16 +340,49 @@ def get_rewards(broadcaster: Broadcaster) -> list[Any]:
     return rewards
 
 
+def get_cached_rewards(broadcaster: Broadcaster) -> list[dict[str, Any]]:
+    """Get a trimmed list of rewards from a broadcaster, using the rewards cache if possible.
+
+    :param broadcaster: broadcaster to get rewards for
+    :raises RequestException: if the request to the twitch api fails
+    :return: list of rewards containing only the fields used by the config page
+    """
+    cache: TTLCache[int, list[dict[str, Any]]] = current_app.extensions["rewards_cache"]
+    rewards = cache.get(broadcaster.id)
+    if rewards is None:
+        current_app.logger.debug("rewards cache miss for broadcaster_id=%s", broadcaster.id)
+        rewards = [
+            {field: reward.get(field) for field in REWARD_FIELDS}
+            for reward in get_rewards(broadcaster)
+        ]
+        cache.set(broadcaster.id, rewards)
+
+    return rewards
+
+
+def invalidate_rewards(broadcaster_id: int) -> None:
+    """Remove the cached rewards for a broadcaster.
+
+    :param broadcaster_id: id of the broadcaster
+    """
+    current_app.extensions["rewards_cache"].delete(broadcaster_id)
+
+
 def get_firsts(
     broadcaster: Broadcaster, start_time: datetime | None = None, end_time: datetime | None = None
 ) -> dict[str, Any]:
     """Get total count of "firsts"for a specific broadcaster.
 
+    All time counts are read from the running totals, counts for a date range are counted from the
+    firsts.
+
     :param broadcaster: broadcaster to count firsts for
     :param start_time: count firsts at or after this date
     :param end_time: count firsts at or before this date
     :return: dictionary of first counts by user e.g {"user1": 5, "user2": 3}
     """
+    if start_time is None and end_time is None:
+        return totals.get_totals(broadcaster.id)
     if start_time is None:
         start_time = datetime.min
     if end_time is None:
@@ -331,6 +416,48 @@ def get_firsts(
     return first_counts
 
 
+def get_firsts_since(broadcaster: Broadcaster, after_id: int) -> tuple[dict[str, int], int]:
+    """Count the "firsts" added for a broadcaster after a given first.
+
+    Clients holding a leaderboard can add these counts to it instead of fetching the whole
+    leaderboard again. Only the new rows are read, using the (broadcaster_id, id) index.
+
+    :param broadcaster: broadcaster to count firsts for
+    :param after_id: only count firsts with an id greater than this
+    :return: first counts by user e.g {"user1": 1}, and the id of the latest first (after_id if
+        there are no new firsts)
+    """
+    firsts = First.__table__
+    users = User.__table__
+    # counted by the current cached username, or the recorded name for legacy rows
+    name = func.coalesce(users.c.name, firsts.c.name)  # pylint: disable=assignment-from-no-return
+    rows = db.session.execute(
+        select(name, func.count(), func.max(firsts.c.id))
+        .select_from(firsts.outerjoin(users, users.c.id == firsts.c.user_id))
+        .where(firsts.c.broadcaster_id == broadcaster.id, firsts.c.id > after_id)
+        .group_by(name)
+    ).all()
+
+    first_counts = {row[0]: row[1] for row in rows}
+    last_id = max((row[2] for row in rows), default=after_id)
+
+    return first_counts, last_id
+
+
+def get_last_first_id(broadcaster_id: int) -> int | None:
+    """Get the id of a broadcaster's latest first, which changes whenever a first is added.
+
+    :param broadcaster_id: id of the broadcaster
+    :return: id of the latest first, or None if the broadcaster has no firsts
+    """
+    firsts = First.__table__
+    last_id: int | None = db.session.execute(
+        select(func.max(firsts.c.id)).where(firsts.c.broadcaster_id == broadcaster_id)
+    ).scalar_one()
+
+    return last_id
+
+
 def create_eventsub(broadcaster: Broadcaster, reward_id: str) -> str:
     """Create an eventsub to listen for channel point redemption for a specific reward id.
 
@@ -369,6 +496,45 @@ def create_eventsub(broadcaster: Broadcaster, reward_id: str) -> str:
     return eventsub_id
 
 
+def iter_eventsubs(
+    user_id: int | None = None, status: str | None = None, eventsub_type: str | None = None
+) -> Iterator[Any]:
+    """Iterate over the eventsubs the application has created, following the pagination cursor.
+
+    Pages are only requested as the iterator is consumed.
+
+    :param user_id: only include eventsubs for this broadcaster
+    :param status: only include eventsubs with this status e.g. "enabled"
+    :param eventsub_type: only include eventsubs of this type
+    :raises RequestException: if the request fails
+    :yield: eventsubs matching the filters
+    """
+    params, matches = eventsub_filters(user_id, status, eventsub_type)
+    cursor = None
+    while True:
+        req = Request(
+            method="GET",
+            url=f"{current_app.config['TWITCH_API_BASEURL']}/eventsub/subscriptions",
+            params={**params, "after": cursor} if cursor else params,
+            headers={"Client-ID": current_app.config["CLIENT_ID"]},
+        )
+
+        resp = request_twitch_api_app(req)
+
+        try:
+            page = resp.json()
+            eventsubs = page["data"]
+            assert isinstance(eventsubs, list)
+            cursor = page.get("pagination", {}).get("cursor")
+        except (KeyError, TypeError, AttributeError, AssertionError) as exp:
+            raise RequestException("could not get eventsubs") from exp
+
+        yield from filter(matches, eventsubs)
+
+        if not cursor:
+            return
+
+
 def get_eventsubs(broadcaster: Broadcaster) -> List[Any]:
     """Get list of eventsubs the application has created.
 
@@ -376,22 +542,7 @@ def get_eventsubs(broadcaster: Broadcaster) -> List[Any]:
     :raises RequestException: if the request fails
     :return: list of eventsubs
     """
-    req = Request(
-        method="GET",
-        url=f"{current_app.config['TWITCH_API_BASEURL']}/eventsub/subscriptions",
-        params={"user_id": broadcaster.id},
-        headers={"Client-ID": current_app.config["CLIENT_ID"]},
-    )
-
-    resp = request_twitch_api_app(req)
-
-    try:
-        eventsubs = resp.json()["data"]
-        assert isinstance(eventsubs, list)
-    except (KeyError, TypeError, AssertionError) as exp:
-        raise RequestException("could not get eventsubs") from exp
-
-    return eventsubs
+    return list(iter_eventsubs(user_id=broadcaster.id))
 
 
 def delete_eventsub(eventsub_id: str) -> None:
@@ -411,31 +562,36 @@ def delete_eventsub(eventsub_id: str) -> None:
     current_app.logger.debug("delete eventsub response=%s", resp.text)
 
 
-def update_eventsub(broadcaster: Broadcaster, reward_id: str) -> str:
-    """Configure eventsubs for channel points events to ensure the application is listening for the
-    correct reward redemptions for a specific broadcaster.
+async def _sync_eventsubs(
+    client: AsyncTwitchClient, broadcaster: Broadcaster, reward_id: str
+) -> str:
+    """Delete stale eventsubs and ensure an enabled eventsub exists for the reward.
 
-    :param broadcaster: broadcaster to update eventsub data for
-    :param reward_id: id of the reward to update the eventsub for
+    Stale eventsubs are deleted concurrently. A new eventsub is created at the same time as the
+    deletes, unless an old eventsub with the same condition exists, in which case it has to be
+    deleted first because twitch rejects duplicate subscriptions. Once the eventsub is known the
+    deletes still running get EVENTSUB_DELETE_TIMEOUT seconds to finish, any left after that are
+    cancelled and left to verifiedfirst-reconcile.
+
+    :param client: twitch api client to use
+    :param broadcaster: broadcaster to update eventsubs for
+    :param reward_id: id of the reward to listen for redemptions of
     :return: id of the eventsub
     """
     broadcaster_id = broadcaster.id
-    current_app.logger.info("updating eventsub for broadcaster_id=%s", broadcaster_id)
-
-    # check if eventsub id exists in the db
-    db_eventsub_id = broadcaster.eventsub_id
-    current_app.logger.debug("db_eventsub_id=%s", db_eventsub_id)
 
     # check if eventsub id exists in the twitch API
-    existing_eventsubs = get_eventsubs(broadcaster)
-    matching_eventsub = None
+    existing_eventsubs = await client.get_eventsubs(broadcaster)
     current_app.logger.debug("existing_eventsubs=%s", existing_eventsubs)
+
+    matching_eventsub: str | None = None
+    stale_eventsubs = []
+    conflicting_eventsubs = []
     for eventsub in existing_eventsubs:
-        current_app.logger.debug("eventsub=%s", eventsub)
         eventsub_id = eventsub["id"]
-        eventsub_status = eventsub["status"]
-        eventsub_reward_id = eventsub["condition"]["reward_id"]
-        if eventsub_reward_id == reward_id and eventsub_status == "enabled":
+        if eventsub["condition"]["reward_id"] != reward_id:
+            stale_eventsubs.append(eventsub_id)
+        elif eventsub["status"] == "enabled" and matching_eventsub is None:
             current_app.logger.info(
                 "found existing eventsub_id=%s for broadcaster_id=%s",
                 eventsub_id,
@@ -443,17 +599,84 @@ def update_eventsub(broadcaster: Broadcaster, reward_id: str) -> str:
             )
             matching_eventsub = eventsub_id
         else:
+            conflicting_eventsubs.append(eventsub_id)
+
+    async def delete(eventsub_id: str) -> None:
+        current_app.logger.info(
+            "deleting old eventsub eventsub_id=%s for broadcaster_id=%s",
+            eventsub_id,
+            broadcaster_id,
+        )
+        try:
+            await client.delete_eventsub(eventsub_id)
+        except RequestException as exp:
+            # a leftover eventsub only costs a webhook, so don't fail the update because of it
+            current_app.logger.error("failed to delete eventsub_id=%s: %s", eventsub_id, exp)
+
+    async def create() -> str:
+        await asyncio.gather(*(delete(eventsub_id) for eventsub_id in conflicting_eventsubs))
+        current_app.logger.info("creating new eventsub for broadcaster_id=%s", broadcaster_id)
+        return await client.create_eventsub(broadcaster, reward_id)
+
+    deletes = [asyncio.create_task(delete(eventsub_id)) for eventsub_id in stale_eventsubs]
+    if matching_eventsub is not None:
+        # nothing has to be deleted before returning the existing eventsub
+        deletes += [asyncio.create_task(delete(e)) for e in conflicting_eventsubs]
+        eventsub_id = matching_eventsub
+    else:
+        eventsub_id = await create()
+
+    if deletes:
+        _, pending = await asyncio.wait(
+            deletes, timeout=current_app.config["EVENTSUB_DELETE_TIMEOUT"]
+        )
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
             current_app.logger.info(
-                "deleting old eventsub eventsub_id=%s for broadcaster_id=%s",
-                eventsub_id,
+                "left %d stale eventsub(s) for broadcaster_id=%s to verifiedfirst-reconcile",
+                len(pending),
                 broadcaster_id,
             )
-            delete_eventsub(eventsub_id)
 
-    # create eventsub if it doesn't exist
-    if matching_eventsub is None:
-        current_app.logger.info("creating new eventsub for broadcaster_id=%s", broadcaster_id)
-        matching_eventsub = create_eventsub(broadcaster, reward_id)
+    return eventsub_id
+
+
+async def _update_eventsub_async(broadcaster: Broadcaster, reward_id: str) -> str:
+    """Run _sync_eventsubs with a new twitch api client.
+
+    The client (and the event loop that runs it) only lives for one call, which costs a new
+    connection to the twitch api on each config save. Saves are rare, so this isn't worth keeping a
+    loop and client running in every worker for.
+
+    :param broadcaster: broadcaster to update eventsubs for
+    :param reward_id: id of the reward to listen for redemptions of
+    :return: id of the eventsub
+    """
+
+    async with AsyncTwitchClient(
+        current_app.config, max_concurrency=current_app.config["TWITCH_MAX_CONCURRENCY"]
+    ) as client:
+        return await _sync_eventsubs(client, broadcaster, reward_id)
+
+
+def update_eventsub(broadcaster: Broadcaster, reward_id: str) -> str:
+    """Configure eventsubs for channel points events to ensure the application is listening for the
+    correct reward redemptions for a specific broadcaster.
+
+    :param broadcaster: broadcaster to update eventsub data for
+    :param reward_id: id of the reward to update the eventsub for
+    :return: id of the eventsub
+    """
+    broadcaster_id = broadcaster.id
+    current_app.logger.info("updating eventsub for broadcaster_id=%s", broadcaster_id)
+
+    # check if eventsub id exists in the db
+    db_eventsub_id = broadcaster.eventsub_id
+    current_app.logger.debug("db_eventsub_id=%s", db_eventsub_id)
+
+    matching_eventsub = asyncio.run(_update_eventsub_async(broadcaster, reward_id))
 
     # update eventsub details to the database if required
     if db_eventsub_id != matching_eventsub:
@@ -549,7 +772,10 @@ def upsert_user(user_id: int, user_name: str) -> User:
 
 
 def add_first(broadcaster_id: int, user_id: int, user_name: str) -> First:
-    """Adds a "first" entry to the database.
+    """Adds a "first" entry to the database and increments the user's running total.
+
+    The user's name is published to any /firsts/stream connections for the broadcaster, and their
+    new count is broadcast to the extension's viewers with extension pubsub.
 
     :param broadcaster_id: id of the broadcaster to add the first entry for
     :param user_id: numeric Twitch id of the user who was first
@@ -559,11 +785,42 @@ def add_first(broadcaster_id: int, user_id: int, user_name: str) -> First:
     upsert_user(user_id, user_name)
     first = First(broadcaster_id=broadcaster_id, name=user_name, user_id=user_id)
     db.session.add(first)
+    db.session.flush()
+    first_id = first.id
+    totals.increment(broadcaster_id, user_id, user_name)
+    extension_pubsub = current_app.extensions["extension_pubsub"]
+    count = count_user_firsts(broadcaster_id, user_id, user_name) if extension_pubsub.enabled else 0
     db.session.commit()
 
+    current_app.extensions["firsts_pubsub"].publish(broadcaster_id, user_name)
+    if extension_pubsub.enabled:
+        extension_pubsub.add(broadcaster_id, user_name, count, first_id)
+
     return first
 
 
+def count_user_firsts(broadcaster_id: int, user_id: int, user_name: str) -> int:
+    """Count the firsts of a user, including legacy firsts that only recorded their name.
+
+    :param broadcaster_id: id of the broadcaster to count firsts for
+    :param user_id: numeric Twitch id of the user
+    :param user_name: current login name of the user
+    :return: number of firsts from the running totals, matching the user's count from get_firsts
+    """
+    first_totals = FirstTotal.__table__
+    count: int = db.session.execute(
+        select(func.coalesce(func.sum(first_totals.c.count), 0)).where(
+            first_totals.c.broadcaster_id == broadcaster_id,
+            or_(
+                first_totals.c.user_id == user_id,
+                and_(first_totals.c.user_id.is_(None), first_totals.c.name == user_name),
+            ),
+        )
+    ).scalar_one()
+
+    return count
+
+
 def get_broadcaster(broadcaster_id: int) -> Broadcaster | None:
     """Get a broadcaster details from the database.
 
@@ -0,0 +1,487 @@
+"""Asyncio based client for the twitch api.
+
+Mirrors the blocking helpers in :mod:`verifiedfirst.twitch`, but sends requests over a single pooled
+connection so that independent calls (e.g. deleting several stale eventsubs) can be awaited
+concurrently.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, List, MutableMapping, Tuple, TypeVar
+
+import httpx
+from requests.exceptions import RequestException
+
+from verifiedfirst import log
+from verifiedfirst.database import db
+from verifiedfirst.metrics import registry as metrics
+from verifiedfirst.models.broadcasters import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+# maximum number of requests that will be in flight at once for a single client
+DEFAULT_MAX_CONCURRENCY = 10
+
+REDEMPTION_EVENTSUB_TYPE = "channel.channel_points_custom_reward_redemption.add"
+
+T = TypeVar("T")
+
+
+class AsyncTwitchClient:
+    """Asynchronous twitch api client.
+
+    The client reads its settings from (and stores refreshed app access tokens back into) the
+    provided config mapping, so passing ``current_app.config`` keeps it in sync with the blocking
+    helpers. Use it as an async context manager so the connection pool is closed afterwards.
+    """
+
+    def __init__(
+        self, config: MutableMapping[str, Any], max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ) -> None:
+        """Create a new client.
+
+        :param config: app config containing the twitch api settings
+        :param max_concurrency: maximum number of requests to send at the same time
+        """
+        self.config = config
+        self._client = httpx.AsyncClient(
+            timeout=config["REQUEST_TIMEOUT"],
+            headers={"Client-ID": config["CLIENT_ID"]},
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._refresh_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncTwitchClient":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the underlying connection pool."""
+        await self._client.aclose()
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request, converting transport errors to a RequestException.
+
+        :param method: http method to use
+        :param url: url to send the request to
+        :param kwargs: extra arguments passed to httpx
+        :raises RequestException: if the request could not be sent
+        :return: response from the request
+        """
+
+        async with self._semaphore:
+            try:
+                return await self._client.request(method, url, **kwargs)
+            except httpx.HTTPError as exp:
+                raise RequestException(f"request to {url} failed: {exp}") from exp
+
+    async def _request_oauth(self, params: dict[str, str]) -> dict[str, Any]:
+        """Request the twitch oauth token endpoint.
+
+        :param params: query params for the token request
+        :raises RequestException: if the request fails or the response is invalid
+        :return: decoded json response
+        """
+        resp = await self._send(
+            "POST",
+            self.config["TWITCH_AUTH_URL"],
+            params={
+                "client_id": self.config["CLIENT_ID"],
+                "client_secret": self.config["CLIENT_SECRET"],
+                **params,
+            },
+        )
+        _raise_for_status(resp)
+        try:
+            auth = resp.json()
+            assert isinstance(auth, dict)
+        except (ValueError, AssertionError) as exp:
+            raise RequestException("invalid response from oauth endpoint") from exp
+
+        return auth
+
+    async def request_twitch_api(
+        self, access_token: str, method: str, path: str, **kwargs: Any
+    ) -> httpx.Response:
+        """Send request to twitch api.
+
+        :param access_token: access token to use for authenticating the request
+        :param method: http method to use
+        :param path: path of the endpoint relative to the api base url e.g. "/users"
+        :param kwargs: extra arguments passed to httpx e.g. params or json
+        :return: response from the request
+        """
+        endpoint = path.partition("?")[0]
+        token = "app" if access_token == self.config["APP_ACCESS_TOKEN"] else "broadcaster"
+        headers = {"Authorization": f"Bearer {access_token}"}
+        request_id = log.get_request_id()
+        if request_id:
+            headers[log.REQUEST_ID_HEADER] = request_id
+        start = time.perf_counter()
+        try:
+            resp = await self._send(
+                method, f"{self.config['TWITCH_API_BASEURL']}{path}", headers=headers, **kwargs
+            )
+        except RequestException:
+            metrics.observe_twitch_request(
+                endpoint, method, token, None, time.perf_counter() - start
+            )
+            raise
+
+        metrics.observe_twitch_request(
+            endpoint, method, token, resp.status_code, time.perf_counter() - start
+        )
+
+        return resp
+
+    async def get_app_access_token(self) -> str:
+        """Gets an app access token using the "client credentials" twitch oauth flow.
+
+        :raises RequestException: if the request fails or the response is invalid
+        :return: valid access token
+        """
+        auth = await self._request_oauth({"grant_type": "client_credentials"})
+        try:
+            access_token = auth["access_token"]
+            assert isinstance(access_token, str)
+        except (KeyError, AssertionError) as exp:
+            raise RequestException("could not get app access token") from exp
+
+        return access_token
+
+    async def refresh_auth_token(self, broadcaster: Broadcaster) -> Broadcaster:
+        """Refresh authorization token for a specific broadcaster.
+
+        :param broadcaster: Broadcaster object to refresh token for
+        :raises RequestException: if the request fails or the response is invalid
+        :return: Broadcaster object with updated auth tokens
+        """
+        auth = await self._request_oauth(
+            {"refresh_token": broadcaster.refresh_token, "grant_type": "refresh_token"}
+        )
+        try:
+            access_token = auth["access_token"]
+            refresh_token = auth["refresh_token"]
+        except KeyError as exp:
+            raise RequestException("could not refresh auth token") from exp
+
+        broadcaster.access_token = access_token
+        broadcaster.refresh_token = refresh_token
+        db.session.commit()
+
+        return broadcaster
+
+    async def request_twitch_api_app(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """Request the twitch api using the application access token.
+
+        If the token has expired it is refreshed once and the request is retried. Concurrent
+        requests that fail with the same expired token share a single refresh.
+
+        :param method: http method to use
+        :param path: path of the endpoint relative to the api base url
+        :param kwargs: extra arguments passed to httpx
+        :raises RequestException: if the request fails
+        :return: response from the twitch api
+        """
+        access_token = self.config["APP_ACCESS_TOKEN"]
+        resp = await self.request_twitch_api(access_token, method, path, **kwargs)
+        if resp.status_code != httpx.codes.UNAUTHORIZED:
+            _raise_for_status(resp)
+            return resp
+
+        logger.debug("refreshing app access token")
+        async with self._refresh_lock:
+            # another request may have already refreshed the token while we were waiting
+            if self.config["APP_ACCESS_TOKEN"] == access_token:
+                self.config["APP_ACCESS_TOKEN"] = await _count_refresh(
+                    "app", self.get_app_access_token()
+                )
+
+        metrics.TWITCH_RETRIES.labels(path.partition("?")[0], "app").inc()
+        resp = await self.request_twitch_api(
+            self.config["APP_ACCESS_TOKEN"], method, path, **kwargs
+        )
+        _raise_for_status(resp)
+
+        return resp
+
+    async def request_twitch_api_broadcaster(
+        self, broadcaster: Broadcaster, method: str, path: str, **kwargs: Any
+    ) -> httpx.Response:
+        """Request the twitch api with a user (broadcaster) token.
+
+        If the token has expired it is refreshed once and the request is retried.
+
+        :param broadcaster: broadcaster to perform the request for
+        :param method: http method to use
+        :param path: path of the endpoint relative to the api base url
+        :param kwargs: extra arguments passed to httpx
+        :raises RequestException: if the request fails
+        :return: response from the twitch api
+        """
+        access_token = broadcaster.access_token
+        resp = await self.request_twitch_api(access_token, method, path, **kwargs)
+        if resp.status_code != httpx.codes.UNAUTHORIZED:
+            _raise_for_status(resp)
+            return resp
+
+        logger.debug("refreshing auth token for broadcaster_id=%s", broadcaster.id)
+        async with self._refresh_lock:
+            if broadcaster.access_token == access_token:
+                await _count_refresh("broadcaster", self.refresh_auth_token(broadcaster))
+
+        metrics.TWITCH_RETRIES.labels(path.partition("?")[0], "broadcaster").inc()
+        resp = await self.request_twitch_api(broadcaster.access_token, method, path, **kwargs)
+        _raise_for_status(resp)
+
+        return resp
+
+    async def get_broadcaster_from_token(self, access_token: str) -> Tuple[str, int]:
+        """Find the broadcaster that an access token belongs to.
+
+        :param access_token: access token to check
+        :raises RequestException: if the request fails
+        :return: name and id of the broadcaster
+        """
+        resp = await self.request_twitch_api(access_token, "GET", "/users")
+        try:
+            _raise_for_status(resp)
+            user = resp.json()["data"][0]
+            broadcaster_name = user["login"]
+            broadcaster_id = int(user["id"])
+            assert isinstance(broadcaster_name, str)
+        except (RequestException, KeyError, IndexError, AssertionError, ValueError) as exp:
+            raise RequestException(
+                f"could not get broadcaster: {type(exp).__name__} {exp}"
+            ) from exp
+
+        return broadcaster_name, broadcaster_id
+
+    async def _get_users(self, key: str, values: List[str]) -> List[dict[str, Any]]:
+        """Look up users in batches of 100, sending the batches concurrently.
+
+        :param key: query param to look users up by ("login" or "id")
+        :param values: values to look up
+        :raises RequestException: if any of the requests fail
+        :return: list of user objects returned by the api
+        """
+
+        async def get_batch(batch: List[str]) -> List[dict[str, Any]]:
+            resp = await self.request_twitch_api_app(
+                "GET", "/users", params=[(key, value) for value in batch]
+            )
+            return _get_data(resp, "could not look up users")
+
+        # Twitch /users endpoint accepts up to 100 logins or ids per request
+        batch_size = 100
+        batches = await asyncio.gather(
+            *(get_batch(values[i : i + batch_size]) for i in range(0, len(values), batch_size))
+        )
+        return [user for batch in batches for user in batch]
+
+    async def get_users_by_login(self, logins: List[str]) -> dict[str, int]:
+        """Look up Twitch users by login name and return a mapping of login -> user_id.
+
+        :param logins: list of Twitch login names to look up
+        :return: dict mapping login name to numeric Twitch user id
+        """
+        users = await self._get_users("login", logins)
+        return {user["login"]: int(user["id"]) for user in users}
+
+    async def get_users_by_id(self, user_ids: List[int]) -> dict[int, str]:
+        """Look up Twitch users by numeric id and return a mapping of user_id -> login.
+
+        :param user_ids: list of numeric Twitch user ids to look up
+        :return: dict mapping user id to current login name
+        """
+        users = await self._get_users("id", [str(user_id) for user_id in user_ids])
+        return {int(user["id"]): user["login"] for user in users}
+
+    async def get_rewards(self, broadcaster: Broadcaster) -> List[Any]:
+        """Get list of rewards from a broadcaster.
+
+        :param broadcaster: broadcaster to get rewards for
+        :return: list of rewards
+        """
+        resp = await self.request_twitch_api_broadcaster(
+            broadcaster,
+            "GET",
+            "/channel_points/custom_rewards",
+            params={"broadcaster_id": broadcaster.id, "only_manageable_rewards": "False"},
+        )
+        return _get_data(resp, "could not get rewards")
+
+    async def create_eventsub(self, broadcaster: Broadcaster, reward_id: str) -> str:
+        """Create an eventsub to listen for channel point redemption for a specific reward id.
+
+        :param broadcaster: broadcaster to create the eventsub for
+        :param reward_id: id of the reward to create an eventsub for
+        :raises RequestException: if the request fails
+        :return: id of the created eventsub
+        """
+        # pylint: disable=duplicate-code
+        resp = await self.request_twitch_api_app(
+            "POST",
+            "/eventsub/subscriptions",
+            json={
+                "type": REDEMPTION_EVENTSUB_TYPE,
+                "version": "1",
+                "condition": {
+                    "broadcaster_user_id": str(broadcaster.id),
+                    "reward_id": str(reward_id),
+                },
+                "transport": {
+                    "method": "webhook",
+                    "callback": self.config["EVENTSUB_CALLBACK_URL"],
+                    "secret": self.config["EVENTSUB_SECRET"],
+                },
+            },
+        )
+        try:
+            eventsub_id = _get_data(resp, "could not create eventsub")[0]["id"]
+            assert isinstance(eventsub_id, str)
+        except (KeyError, IndexError, AssertionError) as exp:
+            raise RequestException("could not create eventsub") from exp
+
+        return eventsub_id
+
+    async def iter_eventsubs(
+        self,
+        user_id: int | None = None,
+        status: str | None = None,
+        eventsub_type: str | None = None,
+    ) -> AsyncIterator[Any]:
+        """Iterate over the eventsubs the application has created, one page at a time.
+
+        :param user_id: only include eventsubs for this broadcaster
+        :param status: only include eventsubs with this status e.g. "enabled"
+        :param eventsub_type: only include eventsubs of this type
+        :raises RequestException: if a request fails
+        :yield: eventsubs matching the filters
+        """
+        params, matches = eventsub_filters(user_id, status, eventsub_type)
+        cursor = None
+        while True:
+            resp = await self.request_twitch_api_app(
+                "GET",
+                "/eventsub/subscriptions",
+                params={**params, "after": cursor} if cursor else params,
+            )
+            cursor = _get_cursor(resp)
+            for eventsub in _get_data(resp, "could not get eventsubs"):
+                if matches(eventsub):
+                    yield eventsub
+            if not cursor:
+                return
+
+    async def get_eventsubs(self, broadcaster: Broadcaster) -> List[Any]:
+        """Get list of eventsubs the application has created for a broadcaster.
+
+        :param broadcaster: broadcaster to get eventsubs for
+        :return: list of eventsubs
+        """
+        return [eventsub async for eventsub in self.iter_eventsubs(user_id=broadcaster.id)]
+
+    async def delete_eventsub(self, eventsub_id: str) -> None:
+        """Delete an eventsub from the twitch api.
+
+        :param eventsub_id: id of the eventsub to delete
+        """
+        resp = await self.request_twitch_api_app(
+            "DELETE", "/eventsub/subscriptions", params={"id": eventsub_id}
+        )
+        logger.debug("delete eventsub response=%s", resp.text)
+
+
+def eventsub_filters(
+    user_id: int | None = None, status: str | None = None, eventsub_type: str | None = None
+) -> Tuple[dict[str, Any], Callable[[Any], bool]]:
+    """Work out how to filter a listing of eventsubs.
+
+    The twitch api only accepts one filter per request, so the most selective one is sent as a query
+    param and the rest are checked against each eventsub in the response.
+
+    :param user_id: only include eventsubs for this broadcaster
+    :param status: only include eventsubs with this status
+    :param eventsub_type: only include eventsubs of this type
+    :return: query params to send and a function that checks the remaining filters
+    """
+    params: dict[str, Any] = {}
+    if user_id is not None:
+        params["user_id"] = user_id
+    elif eventsub_type is not None:
+        params["type"] = eventsub_type
+    elif status is not None:
+        params["status"] = status
+
+    def matches(eventsub: Any) -> bool:
+        return (status is None or eventsub["status"] == status) and (
+            eventsub_type is None or eventsub["type"] == eventsub_type
+        )
+
+    return params, matches
+
+
+def _get_cursor(resp: httpx.Response) -> str | None:
+    """Get the pagination cursor from a twitch api response.
+
+    :param resp: response to decode
+    :return: cursor for the next page, or None if this is the last page
+    """
+    try:
+        cursor = resp.json()["pagination"]["cursor"]
+        assert isinstance(cursor, str)
+    except (ValueError, KeyError, TypeError, AssertionError):
+        return None
+
+    return cursor
+
+
+def _raise_for_status(resp: httpx.Response) -> None:
+    """Raise a RequestException if the response is an error.
+
+    :param resp: response to check
+    :raises RequestException: if the response has an error status code
+    """
+    if resp.is_error:
+        raise RequestException(
+            f"{resp.status_code} error for {resp.request.method} {resp.request.url}: {resp.text}"
+        )
+
+
+def _get_data(resp: httpx.Response, error_msg: str) -> List[Any]:
+    """Get the "data" list from a twitch api response.
+
+    :param resp: response to decode
+    :param error_msg: message to use if the response is in the wrong format
+    :raises RequestException: if the response doesn't contain a data list
+    :return: contents of the data field
+    """
+    try:
+        data = resp.json()["data"]
+        assert isinstance(data, list)
+    except (ValueError, KeyError, TypeError, AssertionError) as exp:
+        raise RequestException(error_msg) from exp
+
+    return data
+
+
+async def _count_refresh(token: str, refresh: Awaitable[T]) -> T:
+    """Await a token refresh, counting whether it succeeded.
+
+    :param token: kind of access token being refreshed, "app" or "broadcaster"
+    :param refresh: the refresh to await
+    :raises RequestException: if the refresh fails
+    :return: result of the refresh
+    """
+    try:
+        result = await refresh
+    except RequestException:
+        metrics.TWITCH_TOKEN_REFRESHES.labels(token, "failure").inc()
+        raise
+
+    metrics.TWITCH_TOKEN_REFRESHES.labels(token, "success").inc()
+    return result
@@ -2,7 +2,6 @@
 
 from functools import wraps
 from typing import Callable, TypeVar, Tuple, cast
-import base64
 import hashlib
 import hmac
 
@@ -10,6 +9,8 @@ import jwt
 from flask import Request, current_app, abort
 from flask import request as flask_request
 
+from verifiedfirst import extension_jwt
+
 
 R = TypeVar("R")
 
@@ -48,7 +49,7 @@ def get_hmac(hmac_message: bytes) -> str:
         current_app.config["EVENTSUB_SECRET"].encode("utf-8"), hmac_message, hashlib.sha256
     ).hexdigest()
 
-    current_app.logger.info("calculated hmac as sha256=%s", hmac_value)
+    current_app.logger.debug("calculated hmac as sha256=%s", hmac_value)
 
     return hmac_value
 
@@ -90,9 +91,7 @@ def verify_jwt(request: Request) -> Tuple[int, str]:
 
     try:
         auth_header = headers["Authorization"]
-        current_app.logger.debug("auth_header=%s", auth_header)
         token = auth_header.split(" ")[1].strip()
-        current_app.logger.debug("token=%s", token)
     except (KeyError, IndexError) as exp:
         error_msg = f"could not get auth token from headers, {exp.__class__.__name__}: {exp}"
         current_app.logger.debug(error_msg)
@@ -102,7 +101,7 @@ def verify_jwt(request: Request) -> Tuple[int, str]:
     try:
         payload = jwt.decode(
             token,
-            key=base64.b64decode(current_app.config["EXTENSION_SECRET"]),
+            key=extension_jwt.get_signer().secret,
             algorithms=["HS256"],
         )
         current_app.logger.debug("payload: %s", payload)
@@ -136,6 +136,36 @@ export default function Panel() {
     });
   }, [loadFirsts]);
 
+  // Apply leaderboard deltas broadcast by the EBS when new firsts are added
+  useEffect(() => {
+    if (!activeRange || activeRange === "custom") return undefined;
+    const twitch = window.Twitch.ext;
+
+    const onBroadcast = (target, contentType, message) => {
+      let deltas;
+      try {
+        deltas = JSON.parse(message).firsts;
+      } catch (e) {
+        console.error("invalid broadcast", e);
+        return;
+      }
+      if (!Array.isArray(deltas)) return;
+
+      setFirsts((prev) => {
+        const next = { ...prev };
+        for (const { name, count, added } of deltas) {
+          // counts are all time totals, shorter ranges add the new firsts to their own count
+          next[name] = activeRange === "all_time" ? count : (next[name] ?? 0) + added;
+        }
+        return next;
+      });
+      setLastUpdated(new Date());
+    };
+
+    twitch.listen("broadcast", onBroadcast);
+    return () => twitch.unlisten("broadcast", onBroadcast);
+  }, [activeRange]);
+
   const handleRangeClick = (range) => {
     if (range === "custom") {
       const defaults = getDefaultCustomRange();
@@ -131,6 +131,61 @@ describe("Panel", () => {
     });
   });
 
+  /** Simulate the EBS broadcasting leaderboard deltas over extension pubsub */
+  async function broadcast(deltas) {
+    const [, onBroadcast] = window.Twitch.ext.listen.mock.calls.at(-1);
+    await act(async () => {
+      onBroadcast("broadcast", "application/json", JSON.stringify({ firsts: deltas }));
+    });
+  }
+
+  it("applies deltas broadcast by the EBS", async () => {
+    fetchFirsts.mockResolvedValue({ alice: 3, bob: 1 });
+    render(<Panel />);
+    await authorize();
+
+    await waitFor(() => {
+      expect(screen.getByText(/3x \| alice/)).toBeInTheDocument();
+    });
+    expect(window.Twitch.ext.listen).toHaveBeenCalledWith("broadcast", expect.any(Function));
+
+    await broadcast([
+      { name: "bob", count: 2, added: 1, id: 10 },
+      { name: "carol", count: 1, added: 1, id: 11 },
+    ]);
+    expect(screen.getByText(/3x \| alice/)).toBeInTheDocument();
+    expect(screen.getByText(/2x \| bob/)).toBeInTheDocument();
+    expect(screen.getByText(/1x \| carol/)).toBeInTheDocument();
+  });
+
+  it("adds broadcast deltas to the counts of shorter ranges", async () => {
+    fetchFirsts.mockResolvedValue({ alice: 1 });
+    render(<Panel />);
+    await applyConfig({ timeRange: "month" });
+    await authorize();
+
+    await waitFor(() => {
+      expect(screen.getByText(/1x \| alice/)).toBeInTheDocument();
+    });
+
+    await broadcast([{ name: "alice", count: 40, added: 2, id: 10 }]);
+    expect(screen.getByText(/3x \| alice/)).toBeInTheDocument();
+  });
+
+  it("stops listening for broadcasts for custom ranges", async () => {
+    fetchFirsts.mockResolvedValue({});
+    render(<Panel />);
+    await authorize();
+    const calls = window.Twitch.ext.listen.mock.calls.length;
+
+    await act(async () => {
+      fireEvent.click(screen.getByRole("button", { name: "Custom" }));
+    });
+
+    expect(window.Twitch.ext.unlisten).toHaveBeenCalledWith("broadcast", expect.any(Function));
+    expect(window.Twitch.ext.listen.mock.calls.length).toBe(calls);
+  });
+
   // -------------------------------------------------------------------------
   // Time-range selection
   // -------------------------------------------------------------------------
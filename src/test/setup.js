@@ -5,6 +5,8 @@ window.Twitch = {
   ext: {
     onAuthorized: vi.fn(),
     onContext: vi.fn(),
+    listen: vi.fn(),
+    unlisten: vi.fn(),
     configuration: {
       onChanged: vi.fn(),
       set: vi.fn(),